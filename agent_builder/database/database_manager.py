@@ -1,6 +1,8 @@
 
+import threading
+import time
 from datetime import datetime
-from typing import Optional
+from typing import Any, Callable, Dict, List, Optional
 
 from loguru import logger
 from sqlalchemy import exc
@@ -11,35 +13,57 @@ from agent_builder.datamodel import (
     AgentLink,
     AgentModelLink,
     AgentSkillLink,
+    KnowledgeHub,
+    Message,
     Model,
     Response,
     Skill,
     Workflow,
     WorkflowAgentLink,
 )
-from .utils import init_db_samples
+from .utils import init_db_samples, run_migration
 
 valid_link_types = ["agent_model", "agent_skill", "agent_agent", "workflow_agent"]
 
+# entities returned by the aggregated building blocks query, keyed by response field
+building_block_models = {
+    "skills": Skill,
+    "models": Model,
+    "agents": Agent,
+    "knowledgehub": KnowledgeHub,
+    "workflows": Workflow,
+}
+
 
 class DBManager:
     """A class to manage database operations"""
 
-    def __init__(self, engine_uri: str):
-        connection_args = {"check_same_thread": True} if "sqlite" in engine_uri else {}
+    def __init__(self, engine_uri: str, building_blocks_ttl: float = 60):
+        # sessions are opened per call and dbmanager is used from executor threads, so pooled
+        # sqlite connections must be allowed to move between threads
+        connection_args = {"check_same_thread": False} if "sqlite" in engine_uri else {}
+        self.engine_uri = engine_uri
         self.engine = create_engine(engine_uri, connect_args=connection_args)
-        # run_migration(engine_uri=engine_uri)
+        # per user cache of get_building_blocks, cleared on every write through this manager.
+        # the ttl bounds staleness when other processes write to the same database
+        self.building_blocks_ttl = building_blocks_ttl
+        self._building_blocks_cache: Dict[str, tuple] = {}
+        self._building_blocks_lock = threading.Lock()
+        self._write_listeners: List[Callable[[Optional[str]], None]] = []
 
     def create_db_and_tables(self):
-        """Create a new database and tables"""
+        """Create a new database and tables. Raises if the schema can not be brought up to date"""
         try:
             SQLModel.metadata.create_all(self.engine)
-            try:
-                init_db_samples(self)
-            except Exception as e:
-                logger.info("Error while initializing database samples: " + str(e))
+            run_migration(engine_uri=self.engine_uri)
+        except Exception as e:
+            # serving on a schema behind the models fails later on every query, fail startup instead
+            logger.error("Error while creating database tables: " + str(e))
+            raise
+        try:
+            init_db_samples(self)
         except Exception as e:
-            logger.info("Error while creating database tables:" + str(e))
+            logger.warning("Error while initializing database samples: " + str(e))
 
     def upsert(self, model: SQLModel):
         """Create a new entity"""
@@ -67,6 +91,8 @@ class DBManager:
                 session.rollback()
                 logger.error("Error while upserting %s", e)
                 status = False
+        if model_class in building_block_models.values():
+            self.invalidate_building_blocks(getattr(model, "user_id", None))
 
         response = Response(
             message=(
@@ -147,6 +173,88 @@ class DBManager:
             response = self.get_items(model_class, session, filters, return_json, order)
         return response
 
+    def get_updated_at(self, model_class: SQLModel, entity_id: Any) -> Optional[datetime]:
+        """Last update time of an entity, without loading the entity"""
+        with Session(self.engine) as session:
+            return session.exec(
+                select(model_class.updated_at).where(model_class.id == entity_id)
+            ).first()
+
+    def get_recent_messages(self, user_id: str, session_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Role and content of the last `limit` messages of a session, in chronological order"""
+        with Session(self.engine) as session:
+            rows = session.exec(
+                select(Message.role, Message.content)
+                .where(Message.user_id == user_id, Message.session_id == session_id)
+                .order_by(Message.id.desc())
+                .limit(limit)
+            ).all()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def get_building_blocks(self, user_id: str) -> Dict[str, Any]:
+        """
+        Load the skills, models, agents, knowledge hubs and workflows of a user in a single session.
+
+        Results are cached per user until the next write through this manager or until
+        `building_blocks_ttl` seconds have passed.
+
+        Args:
+            user_id (str): The user whose entities are loaded.
+
+        Returns:
+            Dict[str, Any]: The entity lists keyed by building block name.
+        """
+        with self._building_blocks_lock:
+            cached = self._building_blocks_cache.get(user_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        building_blocks = {}
+        with Session(self.engine) as session:
+            for name, model_class in building_block_models.items():
+                building_blocks[name] = self.get_items(
+                    model_class, session, filters={"user_id": user_id}, return_json=True
+                ).data
+
+        with self._building_blocks_lock:
+            self._building_blocks_cache[user_id] = (
+                time.monotonic() + self.building_blocks_ttl,
+                building_blocks,
+            )
+        return building_blocks
+
+    def invalidate_building_blocks(self, user_id: Optional[str] = None):
+        """Drop the cached building blocks of a user, or of every user when no user is given"""
+        with self._building_blocks_lock:
+            if user_id is None:
+                self._building_blocks_cache.clear()
+            else:
+                self._building_blocks_cache.pop(user_id, None)
+        for listener in list(self._write_listeners):
+            try:
+                listener(user_id)
+            except Exception as e:
+                logger.error(f"Error in building blocks write listener: {e}")
+
+    def _link_owner(self, link_type: str, primary_id: int) -> Optional[str]:
+        """User owning the primary entity of a link, None when it cannot be found"""
+        primary_class = Workflow if link_type == "workflow_agent" else Agent
+        try:
+            with Session(self.engine) as session:
+                return session.exec(
+                    select(primary_class.user_id).where(primary_class.id == primary_id)
+                ).first()
+        except Exception as e:
+            logger.error("Error while looking up the owner of a link: %s", e)
+            return None
+
+    def add_write_listener(self, listener: Callable[[Optional[str]], None]):
+        """
+        Call `listener(user_id)` after every write of a building block or link through this manager,
+        e.g. to drop caches of workflow answers. user_id is None when the write is not scoped to a user.
+        """
+        self._write_listeners.append(listener)
+
     def delete(self, model_class: SQLModel, filters: dict = None):
         """Delete an entity"""
         row = None
@@ -189,6 +297,8 @@ class DBManager:
                 status=status,
                 data=None,
             )
+        if model_class in building_block_models.values():
+            self.invalidate_building_blocks((filters or {}).get("user_id"))
         return response
 
     def get_linked_entities(
@@ -425,6 +535,7 @@ class DBManager:
                     logger.error("Error while linking: %s", e)
                     status = False
                     status_message = f"Error while linking due to an exception: {e}"
+            self.invalidate_building_blocks(self._link_owner(link_type, primary_id))
 
         response = Response(
             message=status_message,
@@ -505,5 +616,6 @@ class DBManager:
                 logger.error("Error while unlinking: %s", e)
                 status = False
                 status_message = f"Error while unlinking due to an exception: {e}"
+        self.invalidate_building_blocks(self._link_owner(link_type, primary_id))
 
         return Response(message=status_message, status=status)
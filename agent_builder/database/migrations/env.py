@@ -13,7 +13,10 @@ from agent_builder.datamodel import *
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
-config.set_main_option("sqlalchemy.url", get_db_uri())
+# run_migration passes the url of the running app, the alembic cli falls back to the env
+url = config.get_main_option("sqlalchemy.url")
+if not url or url.startswith("driver://"):
+    config.set_main_option("sqlalchemy.url", get_db_uri().replace("%", "%%"))
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
@@ -0,0 +1,45 @@
+"""add parallel workflow enum values
+
+Revision ID: 1bdd6e84e278
+Revises: 8c13b12d888f
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "1bdd6e84e278"
+down_revision: Union[str, None] = "8c13b12d888f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# enum type names and their new labels, sqlalchemy stores enum member names
+NEW_ENUM_VALUES = [
+    ("workflowtype", "parallel"),
+    ("workflowagenttype", "merger"),
+]
+
+
+def upgrade() -> None:
+    # only postgres has native enum types, other backends store enums as plain strings
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    if op.get_context().as_sql:
+        existing_types = {type_name for type_name, _ in NEW_ENUM_VALUES}
+    else:
+        existing_types = set(bind.execute(sa.text("SELECT typname FROM pg_type WHERE typtype = 'e'")).scalars())
+    # ALTER TYPE ... ADD VALUE can't run inside a transaction block before postgres 12
+    with op.get_context().autocommit_block():
+        for type_name, value in NEW_ENUM_VALUES:
+            if type_name in existing_types:
+                op.execute(f"ALTER TYPE {type_name} ADD VALUE IF NOT EXISTS '{value}'")
+
+
+def downgrade() -> None:
+    # postgres can't drop a value from an enum type
+    pass
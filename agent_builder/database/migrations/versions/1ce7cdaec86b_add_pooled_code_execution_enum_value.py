@@ -0,0 +1,40 @@
+"""add pooled code execution enum value
+
+Revision ID: 1ce7cdaec86b
+Revises: 1bdd6e84e278
+Create Date: 2026-10-18 19:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "1ce7cdaec86b"
+down_revision: Union[str, None] = "1bdd6e84e278"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # only postgres has native enum types, other backends store enums as plain strings
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    # agent configs are stored as JSON, the type only exists if a table ever declared it
+    if not op.get_context().as_sql:
+        exists = bind.execute(
+            sa.text("SELECT 1 FROM pg_type WHERE typname = 'codeexecutionconfigtypes'")
+        ).first()
+        if exists is None:
+            return
+    # ALTER TYPE ... ADD VALUE can't run inside a transaction block before postgres 12
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE codeexecutionconfigtypes ADD VALUE IF NOT EXISTS 'pooled'")
+
+
+def downgrade() -> None:
+    # postgres can't drop a value from an enum type
+    pass
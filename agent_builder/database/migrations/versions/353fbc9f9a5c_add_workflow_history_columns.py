@@ -0,0 +1,41 @@
+"""add workflow history window columns
+
+Revision ID: 353fbc9f9a5c
+Revises:
+Create Date: 2026-10-18 18:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "353fbc9f9a5c"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _existing_columns(table: str) -> set:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return set()
+    return {column["name"] for column in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    # databases created by create_all after the models changed already have the columns
+    columns = _existing_columns("workflow")
+    if not columns:
+        return
+    for name in ("history_max_turns", "history_token_budget"):
+        if name not in columns:
+            op.add_column("workflow", sa.Column(name, sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("workflow") as batch_op:
+        batch_op.drop_column("history_token_budget")
+        batch_op.drop_column("history_max_turns")
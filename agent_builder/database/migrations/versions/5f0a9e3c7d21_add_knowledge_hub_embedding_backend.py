@@ -0,0 +1,37 @@
+"""add knowledge hub embedding backend
+
+Revision ID: 5f0a9e3c7d21
+Revises: 1ce7cdaec86b
+Create Date: 2026-10-18 19:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5f0a9e3c7d21"
+down_revision: Union[str, None] = "1ce7cdaec86b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _existing_columns(table: str) -> set:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return set()
+    return {column["name"] for column in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    # databases created by create_all after the models changed already have the column
+    columns = _existing_columns("knowledgehub")
+    if columns and "embedding_backend" not in columns:
+        op.add_column("knowledgehub", sa.Column("embedding_backend", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("knowledgehub") as batch_op:
+        batch_op.drop_column("embedding_backend")
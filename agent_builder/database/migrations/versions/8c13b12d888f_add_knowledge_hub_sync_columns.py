@@ -0,0 +1,47 @@
+"""add knowledge hub sync columns
+
+Revision ID: 8c13b12d888f
+Revises: 353fbc9f9a5c
+Create Date: 2026-10-18 18:41:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8c13b12d888f"
+down_revision: Union[str, None] = "353fbc9f9a5c"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _existing_columns(table: str) -> set:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return set()
+    return {column["name"] for column in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    # databases created by create_all after the models changed already have the columns
+    columns = _existing_columns("knowledgehub")
+    if not columns:
+        return
+    new_columns = [
+        sa.Column("collection_name", sa.String(), nullable=True),
+        sa.Column("embedding_model", sa.String(), nullable=True),
+        sa.Column("synced_at", sa.DateTime(), nullable=True),
+    ]
+    for column in new_columns:
+        if column.name not in columns:
+            op.add_column("knowledgehub", column)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("knowledgehub") as batch_op:
+        batch_op.drop_column("synced_at")
+        batch_op.drop_column("embedding_model")
+        batch_op.drop_column("collection_name")
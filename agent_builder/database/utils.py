@@ -1,14 +1,12 @@
 
-import time
-from datetime import datetime
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
-from alembic import command, util
+from alembic import command
 from alembic.config import Config
 from loguru import logger
 
-from sqlmodel import Session, create_engine, text
+from sqlmodel import Session, select
 
 from autogen.agentchat import AssistantAgent
 
@@ -20,10 +18,21 @@ from agent_builder.datamodel import (
     Model,
     Skill,
     Workflow,
-    WorkflowAgentLink, KnowledgeHub, )
+    WorkflowAgentLink, KnowledgeHub, WorkflowAgentType, WorkFlowType, )
 
 
 
+def synced_collection_hub(collection_name: Optional[str], session: Session) -> Optional[KnowledgeHub]:
+    """The knowledge hub maintaining a vector collection with a document manifest, if any."""
+    if not collection_name:
+        return None
+    return session.exec(
+        select(KnowledgeHub).where(
+            KnowledgeHub.collection_name == collection_name, KnowledgeHub.synced_at.is_not(None)
+        )
+    ).first()
+
+
 def workflow_from_id(workflow_id: int, dbmanager: Any):
     workflow = dbmanager.get(Workflow, filters={"id": workflow_id}).data
     if not workflow or len(workflow) == 0:
@@ -81,69 +90,49 @@ def workflow_from_id(workflow_id: int, dbmanager: Any):
                     llm_config["config_list"] = models
                 agent_dict["config"]["llm_config"] = llm_config
             agent_dict["agents"] = [get_agent(agent.id) for agent in agent.agents]
+            retrieve_config = agent_dict["config"].get("retrieve_config")
+            if agent.type == AgentType.retrieverproxy and retrieve_config:
+                hub = synced_collection_hub(retrieve_config.get("collection_name"), session)
+                retrieve_config["managed_collection"] = hub is not None
+                if hub is not None and hub.embedding_model:
+                    retrieve_config["collection_embedding_model"] = (
+                        f"{hub.embedding_backend}:{hub.embedding_model}"
+                        if hub.embedding_backend
+                        else hub.embedding_model
+                    )
             return agent_dict
 
+    receivers = []
     for link in workflow_agent_links:
         agent_dict = get_agent(link.agent_id)
         workflow[str(link.agent_type.value)] = agent_dict
+        if link.agent_type == WorkflowAgentType.receiver:
+            receivers.append(agent_dict)
+    # parallel workflows fan out to every linked receiver
+    if workflow.get("type") == WorkFlowType.parallel:
+        workflow["receivers"] = receivers
     return workflow
 
 
 def run_migration(engine_uri: str):
-    database_dir = Path(__file__).parent
-    script_location = database_dir / "migrations"
-
-    engine = create_engine(engine_uri)
-    buffer = open(script_location / "alembic.log", "w")
-    alembic_cfg = Config(stdout=buffer)
+    """
+    Upgrade the database to the latest alembic revision. Tables are created by create_all
+    first, so revisions only alter what create_all leaves alone, like new columns on existing
+    tables and new enum values, and skip changes that are already in place.
+    """
+    script_location = Path(__file__).parent / "migrations"
+
+    alembic_cfg = Config()
     alembic_cfg.set_main_option("script_location", str(script_location))
-    alembic_cfg.set_main_option("sqlalchemy.url", engine_uri)
-
-    print(f"Running migrations with engine_uri: {engine_uri}")
-
-    should_initialize_alembic = False
-    with Session(engine) as session:
-        try:
-            session.exec(text("SELECT * FROM alembic_version"))
-        except Exception:
-            logger.info("Alembic not initialized")
-            should_initialize_alembic = True
-        else:
-            logger.info("Alembic already initialized")
-
-    if should_initialize_alembic:
-        try:
-            logger.info("Initializing alembic")
-            command.ensure_version(alembic_cfg)
-            command.upgrade(alembic_cfg, "head")
-            logger.info("Alembic initialized")
-        except Exception as exc:
-            logger.error(f"Error initializing alembic: {exc}")
-            raise RuntimeError("Error initializing alembic") from exc
+    # config values are interpolated, escape the % of url encoded passwords
+    alembic_cfg.set_main_option("sqlalchemy.url", engine_uri.replace("%", "%%"))
 
     logger.info(f"Running DB migrations in {script_location}")
-
     try:
-        buffer.write(f"{datetime.now().isoformat()}: Checking migrations\n")
-        command.check(alembic_cfg)
+        command.upgrade(alembic_cfg, "head")
     except Exception as exc:
-        if isinstance(exc, (util.exc.CommandError, util.exc.AutogenerateDiffsDetected)):
-            try:
-                command.upgrade(alembic_cfg, "head")
-                time.sleep(3)
-            except Exception as exc:
-                logger.error(f"Error running migrations: {exc}")
-
-    try:
-        buffer.write(f"{datetime.now().isoformat()}: Checking migrations\n")
-        command.check(alembic_cfg)
-    except util.exc.AutogenerateDiffsDetected as exc:
-        logger.info(f"AutogenerateDiffsDetected: {exc}")
-        # raise RuntimeError(
-        #     f"There's a mismatch between the models and the database.\n{exc}")
-    except util.exc.CommandError as exc:
-        logger.error(f"CommandError: {exc}")
-        # raise RuntimeError(f"Error running migrations: {exc}")
+        logger.error(f"Error running migrations: {exc}")
+        raise RuntimeError("Error running migrations") from exc
 
 
 def init_db_samples(dbmanager: Any):
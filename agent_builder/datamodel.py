@@ -2,10 +2,8 @@ from datetime import datetime
 from enum  import Enum
 from typing import Any, Callable, Dict, List, Optional, Union
 
-from pyarrow import table
-
 from pydantic import BaseModel, field_validator
-from sqlalchemy import ForeignKey, Integer
+from sqlalchemy import UniqueConstraint
 from sqlmodel import (
     JSON,
     Column, DateTime, Field, Relationship, SQLModel, func
@@ -54,6 +52,19 @@ class Session(SQLModel, table=True):
     description: Optional[str] = None
 
 
+class SessionSummary(SQLModel, table=True):
+    """Rolling summary of the session messages that aged out of the workflow history window."""
+    __table_args__ = {"sqlite_autoincrement": True}
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: int = Field(foreign_key="session.id", unique=True, index=True)
+    updated_at: datetime = Field(
+        default_factory=datetime.now,
+        sa_column=Column(DateTime(timezone=True), server_default=func.now())
+    )
+    summary: str = ""
+    summarized_until_id: int = 0
+
+
 class AgentSkillLink(SQLModel, table=True):
     __table_args__ = {"sqlite_autoincrement": True}
     agent_id: int = Field(default=None, primary_key=True, foreign_key="agent.id")
@@ -94,6 +105,7 @@ class LLMConfig(SQLModel, table=False):
     timeout: Optional[int] = 1000
     max_tokens: Optional[int] = 1000
     extra_body: Optional[dict] = None
+    stream: bool = False
 
 
 class ModelTypes(str, Enum):
@@ -128,12 +140,20 @@ class Model(SQLModel, table=True):
 class CodeExecutionConfigTypes(str,Enum):
     local = "local"
     docker = "docker"
+    # local execution in the warm python kernels of the kernel pool
+    pooled = "pooled"
     none = "none"
 
 class VectorDBType(str, Enum):
     pgvector = "pgvector"
     qdrant = "qdrant"
 
+class EmbeddingBackend(str, Enum):
+    sentence_transformers = "sentence_transformers"
+    # ONNX models on CPU, e.g. BAAI/bge-small-en-v1.5
+    fastembed = "fastembed"
+    openai = "openai"
+
 class RetrieverConfig(SQLModel, table=False):
     task: str = "qa"
     docs_path: Union[List[str], str]
@@ -144,8 +164,15 @@ class RetrieverConfig(SQLModel, table=False):
     collection_name: str
     db_config: dict = Field(default_factory={}, sa_column=Column(JSON))
     embedding_model: str = "BAAI/bge-large-en-v1.5"
+    # inferred from embedding_model when not set
+    embedding_backend: Optional[EmbeddingBackend] = None
     model: Optional[str] = Field(default="gpt-4o")
     get_or_create: bool
+    # set for collections kept in sync by the knowledge hub ingestion, the retriever then
+    # only queries the collection instead of chunking docs_path itself
+    managed_collection: bool = False
+    # "backend:model" the knowledge hub embedded the managed collection with
+    collection_embedding_model: Optional[str] = None
     customized_prompt: Optional[str] = None
     customize_answer_prefix: Optional[str] = None
 
@@ -202,6 +229,7 @@ class WorkflowAgentType(str, Enum):
     sender = "sender"
     receiver = "receiver"
     planner = "planner"
+    merger = "merger"
 
 class AgentClassification(str, Enum):
     basic = "basic"
@@ -297,12 +325,40 @@ class KnowledgeHub(SQLModel,table=True):
     name: str
     description: str
     details:str
+    # vector collection kept in sync with the hub's documents by the ingestion job
+    collection_name: Optional[str] = None
+    embedding_model: Optional[str] = None
+    # backend the collection was embedded with, inferred from embedding_model when not set
+    embedding_backend: Optional[str] = None
+    synced_at: Optional[datetime] = None
+
+
+class KnowledgeHubDocument(SQLModel, table=True):
+    """Manifest entry of a source document of a knowledge hub and the vector chunks it was split into."""
+    __table_args__ = (
+        UniqueConstraint("knowledge_hub_id", "source"),
+        {"sqlite_autoincrement": True},
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    knowledge_hub_id: int = Field(foreign_key="knowledgehub.id", index=True)
+    # file path or url
+    source: str
+    size: Optional[int] = None
+    mtime: Optional[float] = None
+    content_hash: str
+    chunk_ids: List[str] = Field(default_factory=list, sa_column=Column(JSON))
+    updated_at: datetime = Field(
+        default_factory=datetime.now,
+        sa_column=Column(DateTime(timezone=True), server_default=func.now())
+    )
 
 
 
 class WorkFlowType(str, Enum):
     twoagents = "twoagents"
     groupchat = "groupchat"
+    # a planner fans the task out to every receiver concurrently, a merger combines the answers
+    parallel = "parallel"
 
 
 class WorkFlowSummaryMethod(str, Enum):
@@ -334,6 +390,10 @@ class Workflow(SQLModel, table=True):
         default=WorkFlowSummaryMethod.last,
         sa_column=Column(SqlEnum(WorkFlowSummaryMethod)),
     )
+    # history window passed to the agents, older turns are folded into the session summary.
+    # None keeps the full session history
+    history_max_turns: Optional[int] = None
+    history_token_budget: Optional[int] = None
 
 
 class Response(SQLModel):
@@ -1,14 +1,151 @@
+import copy
+import hashlib
+import json
 import os
-from typing import Dict, Optional, List, Any
-import openai
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Optional, List, Any
 from datetime import datetime
 
-from agent_builder.manager.agents import ExtendedRetrieverAgent, ExtendedConversableAgent
-from agent_builder.datamodel import Message, Agent, AgentType, SocketMessage
+from agent_builder.manager.agents import ExtendedRetrieverAgent, ExtendedConversableAgent, ExtendedGroupChatManager
+from agent_builder.manager.run_executor import RunCancelledError
+from agent_builder.datamodel import Message, Agent, AgentType, CodeExecutionConfigTypes, SocketMessage, WorkFlowType
 from agent_builder.utils import clear_folder, sanitize_model, load_code_execution_config, get_skills_from_prompt
+from agent_builder.utils.completion_cache import ScopedCompletionCache, get_completion_cache
+from agent_builder.utils.llm_clients import llm_client_registry
+from agent_builder.utils.skills_bundle import skills_bundle_cache, skills_digest
+from agent_builder.utils.streaming import DeltaIOStream
 import autogen
+from autogen.io import IOStream
+from loguru import logger
+
+# upper bound for the branches of a parallel workflow running at once
+PARALLEL_MAX_BRANCHES = int(os.getenv("AGENT_BUILDER_PARALLEL_MAX_BRANCHES", "8"))
+
+
+def get_default_system_message(agent_type: str) -> str:
+    if agent_type in ("assistant", "retrieve"):
+        return autogen.AssistantAgent.DEFAULT_SYSTEM_MESSAGE
+    else:
+        return "You are a helpful AI Assistant."
+
+
+def workflow_fingerprint(workflow: Dict) -> Optional[str]:
+    """
+    Version of a workflow and everything linked to it: the ids and `updated_at` of the workflow,
+    its agents (recursively), their skills and models, and whether the collections of retriever
+    agents are maintained by a knowledge hub sync. Returns None for workflows that were not
+    loaded from the database, which can't be versioned.
+    """
+    versions = [("workflow", workflow.get("id"), str(workflow.get("updated_at")))]
+
+    def add(kind: str, entity: Any) -> bool:
+        entity_id = entity.get("id") if isinstance(entity, dict) else getattr(entity, "id", None)
+        updated_at = entity.get("updated_at") if isinstance(entity, dict) else getattr(entity, "updated_at", None)
+        versions.append((kind, entity_id, str(updated_at)))
+        return entity_id is not None
+
+    def add_agent(kind: str, agent: Optional[Dict]) -> bool:
+        if not agent or not add(kind, agent):
+            return False
+        retrieve_config = (agent.get("config") or {}).get("retrieve_config")
+        if retrieve_config:
+            versions.append((
+                "managed_collection",
+                agent.get("id"),
+                bool(retrieve_config.get("managed_collection")),
+                retrieve_config.get("collection_embedding_model"),
+            ))
+        return (
+            all([add("skill", skill) for skill in agent.get("skills", [])])
+            and all([add("model", model) for model in agent.get("models", [])])
+            and all([add_agent("member", member) for member in agent.get("agents", [])])
+        )
+
+    if workflow.get("id") is None:
+        return None
+    if not (add_agent("sender", workflow.get("sender")) and add_agent("receiver", workflow.get("receiver"))):
+        return None
+    for role in ("planner", "merger"):
+        if workflow.get(role) and not add_agent(role, workflow.get(role)):
+            return None
+    if not all([add_agent("branch", branch) for branch in workflow.get("receivers", [])]):
+        return None
+    return hashlib.sha256(json.dumps(versions).encode("utf-8")).hexdigest()
+
+
+class AgentTemplate:
+    """
+    Validated and serialized spec of an agent, shared by every session running its workflow.
+    Session specific parts, the code executor and the skills file, are created on load.
+    """
 
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self,
+                 agent_type: AgentType,
+                 config: Dict,
+                 code_execution_type: Optional[CodeExecutionConfigTypes] = None,
+                 skills: Optional[List[Any]] = None,
+                 skills_digest: Optional[str] = None,
+                 llm_config: Optional[Dict] = None,
+                 agents: Optional[List["AgentTemplate"]] = None,
+                 ) -> None:
+        self.agent_type = agent_type
+        self.config = config
+        self.code_execution_type = code_execution_type
+        self.skills = skills or []
+        self.skills_digest = skills_digest
+        self.llm_config = llm_config
+        self.agents = agents or []
+
+
+class WorkflowTemplateCache:
+    """
+    LRU cache of compiled workflow templates keyed by `workflow_fingerprint`, so editing the
+    workflow or any linked agent, skill or model compiles a new template.
+
+    :param max_entries: Maximum number of workflow versions kept.
+    """
+
+    def __init__(self, max_entries: int = 128) -> None:
+        self.max_entries = max_entries
+        self._templates: "OrderedDict[str, Dict[str, AgentTemplate]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compile(self,
+                       workflow: Dict,
+                       compile_function: Callable[[], Dict[str, AgentTemplate]]
+                       ) -> Dict[str, AgentTemplate]:
+        key = workflow_fingerprint(workflow) if self.max_entries > 0 else None
+        if key is None:
+            return compile_function()
+        with self._lock:
+            templates = self._templates.get(key)
+            if templates is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return templates
+            self.misses += 1
+        templates = compile_function()
+        with self._lock:
+            self._templates[key] = templates
+            while len(self._templates) > self.max_entries:
+                self._templates.popitem(last=False)
+        return templates
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"entries": len(self._templates), "hits": self.hits, "misses": self.misses}
+
+
+workflow_template_cache = WorkflowTemplateCache(
+    max_entries=int(os.getenv("AGENT_BUILDER_TEMPLATE_CACHE_SIZE", "128"))
+)
 
 
 class AgentOrchestrator:
@@ -19,7 +156,9 @@ class AgentOrchestrator:
                  work_dir: str = None,
                  clear_work_dir: bool = True,
                  send_message_function: Optional[callable] = None,
-                 connection_id: Optional[str] = None
+                 connection_id: Optional[str] = None,
+                 cancel_event: Optional[threading.Event] = None,
+                 template_cache: Optional["WorkflowTemplateCache"] = None
                  ) -> None:
         """
         Initializes a AutogenFlow with agents specified in the config
@@ -29,18 +168,44 @@ class AgentOrchestrator:
         :param clear_work_dir:
         :param send_message_function:
         :param connection_id:
+        :param cancel_event: Event set by the run executor when the run is cancelled
+        :param template_cache: Cache of compiled workflow templates, defaults to the process wide cache
         """
 
         self.send_message_function = send_message_function
         self.connection_id = connection_id
+        self.cancel_event = cancel_event
         self.work_dir = work_dir or "work_dir"
         if clear_work_dir:
             clear_folder(self.work_dir)
 
         self.workflow = workflow
-        self.sender = self.load(workflow.get("sender"))
-        self.receiver = self.load(workflow.get("receiver"))
+        self.template_cache = template_cache if template_cache is not None else workflow_template_cache
+        self.parallel = workflow.get("type") == WorkFlowType.parallel
+        templates = self.template_cache.get_or_compile(workflow, lambda: self.compile_workflow(workflow))
+        self.fingerprint = workflow_fingerprint(workflow)
+        self.sender = self.load(templates["sender"])
+        self.branches = []
+        self.planner = None
+        self.merger = None
+        if self.parallel:
+            # every branch talks to its own sender so the branch conversations stay independent
+            self.branches = [
+                (self.load(templates["sender"]), self.load(branch)) for branch in templates["receivers"]
+            ]
+            self.planner = self.load(templates["planner"]) if templates.get("planner") else None
+            # the merger, or the first branch without one, answers the user
+            self.receiver = (
+                self.load(templates["merger"]) if templates.get("merger") else self.branches[0][1]
+            )
+            if templates.get("merger"):
+                self.merger = self.receiver
+        else:
+            self.receiver = self.load(templates["receiver"])
         self.agent_history = []
+        self.history_length = 0
+        # completion caches of the current run, one per cache_seed
+        self.completion_caches: Dict[Any, ScopedCompletionCache] = {}
 
         if history:
             self._populate_history(history)
@@ -108,6 +273,9 @@ class AgentOrchestrator:
                         sender_type: str = "agent",
                         ) -> None:
 
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise RunCancelledError("Workflow run was cancelled")
+
         message = (
             message
             if isinstance(message, dict)
@@ -134,40 +302,95 @@ class AgentOrchestrator:
                 )
                 self.send_message_function(socket_msg)
 
+    def process_delta(self, sender_name: str, content: str) -> None:
+        """Forwards a streamed token delta of the agent currently generating a reply."""
+
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise RunCancelledError("Workflow run was cancelled")
+
+        if self.send_message_function:
+            socket_msg = SocketMessage(
+                type="agent_message_delta",
+                data={
+                    "sender": sender_name,
+                    "delta": content,
+                    "timestamp": datetime.now().isoformat(),
+                    "connection_id": self.connection_id,
+                    "message_type": "agent_message_delta"
+                },
+                connection_id=self.connection_id
+            )
+            self.send_message_function(socket_msg)
+
     def _populate_history(self, history: List[Message]) -> None:
+        """
+        Loads the stored session messages into the sender's and receiver's conversations.
 
-        for msg in history:
-            if isinstance(msg, dict):
-                msg = Message(**msg)
-            if msg.role == "user":
-                self.sender.send(
-                    msg.content,
-                    self.receiver,
-                    request_reply = False,
-                    silent= True
-                )
-            elif msg.role == "assistant":
-                self.receiver.send(
-                    msg.content,
-                    self.sender,
-                    request_reply=False,
-                    silent=True
-                )
+        The messages are appended the way `send` would record them, without running the
+        receive hooks, so loading a long session doesn't re-process every past message.
+        System messages, like the summary of the earlier conversation, are seen by both agents.
+        """
+
+        messages = [Message(**msg) if isinstance(msg, dict) else msg for msg in history]
+        messages.sort(key=lambda msg: (msg.created_at is None, msg.created_at, msg.id or 0))
+        for sender, receiver in [(self.sender, self.receiver)] + self.branches:
+            for msg in messages:
+                if msg.role == "user":
+                    speaker, listener = sender, receiver
+                elif msg.role == "assistant":
+                    speaker, listener = receiver, sender
+                elif msg.role == "system":
+                    sender._append_oai_message(msg.content, "system", receiver, is_sending=True)
+                    receiver._append_oai_message(msg.content, "system", sender, is_sending=False)
+                    continue
+                else:
+                    continue
+                speaker._append_oai_message(msg.content, "assistant", listener, is_sending=True)
+                listener._append_oai_message(msg.content, "user", speaker, is_sending=False)
+        self.history_length = len(messages)
+
+    def prepare_run(self,
+                    send_message_function: Optional[callable] = None,
+                    connection_id: Optional[str] = None,
+                    cancel_event: Optional[threading.Event] = None,
+                    history: Optional[List[Message]] = None
+                    ) -> None:
+        """
+        Rebinds a warm orchestrator to the connection and cancel event of a new run.
+
+        The agents' conversations are reset to the stored session messages, so a warm run sees
+        the same context as a cold one instead of the previous runs' full inner transcript.
+        """
+
+        self.send_message_function = send_message_function
+        self.connection_id = connection_id
+        self.cancel_event = cancel_event
+        self.agent_history = []
+        for agent in self._agents():
+            agent.clear_history()
+            if isinstance(agent, autogen.GroupChatManager):
+                agent.groupchat.reset()
+        self.history_length = 0
+        if history:
+            self._populate_history(history)
+
+    def conversation_size(self) -> int:
+        """Approximate size in characters of the conversations held by the sender and receiver."""
+
+        size = 0
+        for agent in (self.sender, self.receiver):
+            for messages in agent.chat_messages.values():
+                size += sum(len(str(message.get("content") or "")) for message in messages)
+        return size
 
     def sanitize_agent(self, agent: Dict) -> Agent:
+        """Validates an agent spec and sanitizes its llm config. Independent of the session."""
 
-        skills = agent.get("skills", [])
         agent = Agent.model_validate(agent)
         agent.config.is_termination_msg = agent.config.is_termination_msg or (
             lambda x: "TERMINATE" in x.get("content", "").rstrip()[-20:]
         )
 
-        def get_default_system_message(agent_type: str) -> str:
-            if agent_type in ("assistant", "retrieve") :
-                return autogen.AssistantAgent.DEFAULT_SYSTEM_MESSAGE
-            else:
-                return "You are a helpful AI Assistant."
-
         if agent.config.llm_config is not False:
             config_list = []
             for llm in agent.config.llm_config.config_list:
@@ -177,24 +400,23 @@ class AgentOrchestrator:
                 sanitized_llm = sanitize_model(llm)
                 config_list.append(sanitized_llm)
             agent.config.llm_config.config_list = config_list
+        return agent
 
-        agent.config.code_execution_config = load_code_execution_config(
-            agent.config.code_execution_config, work_dir = self.work_dir
-        )
+    def compile_workflow(self, workflow: Dict) -> Dict[str, Any]:
+        """Compiles the agents of a workflow into templates keyed by their role in the workflow."""
 
-        if skills:
-            skills_prompt = get_skills_from_prompt(skills, self.work_dir)
-            if agent.config.system_message:
-                agent.config.system_message = (
-                    agent.config.system_message + "\n\n" + skills_prompt
-                )
-            else:
-                agent.config.system_message = (
-                    get_default_system_message(agent.type) + "\n\n" + skills_prompt
-                )
-        return agent
+        templates = {"sender": self.compile(workflow.get("sender"))}
+        if workflow.get("type") != WorkFlowType.parallel:
+            templates["receiver"] = self.compile(workflow.get("receiver"))
+            return templates
+        receivers = workflow.get("receivers") or [workflow.get("receiver")]
+        templates["receivers"] = [self.compile(receiver) for receiver in receivers]
+        templates["planner"] = self.compile(workflow["planner"]) if workflow.get("planner") else None
+        templates["merger"] = self.compile(workflow["merger"]) if workflow.get("merger") else None
+        return templates
 
-    def load(self, agent: Any) -> autogen.Agent:
+    def compile(self, agent: Any) -> AgentTemplate:
+        """Validates and serializes an agent spec and its linked agents into a reusable template."""
 
         if not agent:
             raise ValueError(
@@ -202,57 +424,221 @@ class AgentOrchestrator:
             )
 
         linked_agents = agent.get("agents", [])
+        skills = agent.get("skills", [])
         agent = self.sanitize_agent(agent)
-        if agent.type == "groupchat":
-            groupchat_agents = [self.load(agent) for agent in linked_agents]
-            group_chat_config = self._serialize_agent(agent)
-            group_chat_config["agents"] = groupchat_agents
+        if agent.type == AgentType.groupchat:
+            return AgentTemplate(
+                agent_type=agent.type,
+                config=self._serialize_agent(agent),
+                llm_config=agent.config.llm_config.model_dump(),
+                agents=[self.compile(linked_agent) for linked_agent in linked_agents],
+            )
+        if agent.type not in (AgentType.assistant, AgentType.userproxy, AgentType.retrieverproxy):
+            raise ValueError(f"Unknown agent type: {agent.type}")
+        return AgentTemplate(
+            agent_type=agent.type,
+            config=self._serialize_agent(agent),
+            code_execution_type=agent.config.code_execution_config,
+            skills=skills,
+            skills_digest=skills_digest(skills) if skills else None,
+        )
+
+    def load(self, template: AgentTemplate) -> autogen.Agent:
+        """Builds the autogen agent of a template for this session's work_dir."""
+
+        if template.agent_type == AgentType.groupchat:
+            group_chat_config = copy.deepcopy(template.config)
+            group_chat_config["agents"] = [self.load(member) for member in template.agents]
             groupchat = autogen.GroupChat(**group_chat_config)
-            agent = ExtendedGroupChatManager(
-                groupchat =groupchat,
-                message_processor = self.process_message,
-                llm_config = agent.config.llm_config.model_dump()
+            return ExtendedGroupChatManager(
+                groupchat=groupchat,
+                message_processor=self.process_message,
+                llm_config=llm_client_registry.bind(copy.deepcopy(template.llm_config)),
             )
-            return agent
-        else:
-            if agent.type == "assistant":
-                agent = ExtendedConversableAgent(
-                    **self._serialize_agent(agent),
-                    message_processor=self.process_message,
-                )
-            elif agent.type == "userproxy":
-                agent = ExtendedConversableAgent(
-                    **self._serialize_agent(agent),
-                    message_processor=self.process_message,
-                )
-            elif agent.type == "retrieverproxy":
-                agent = ExtendedRetrieverAgent(
-                    **self._serialize_agent(agent),
-                    message_processor=self.process_message,
-                )
+
+        # the template is shared between sessions, agents may mutate their config
+        config = copy.deepcopy(template.config)
+        # agents of every run share the pooled http clients of their llm endpoints
+        config["llm_config"] = llm_client_registry.bind(config.get("llm_config"))
+        config["code_execution_config"] = load_code_execution_config(
+            template.code_execution_type, work_dir=self.work_dir
+        )
+        if template.skills:
+            skills_prompt = skills_bundle_cache.prompt(template.skills, template.skills_digest)
+            if template.code_execution_type == CodeExecutionConfigTypes.docker:
+                # the container does not see the shared bundle directory
+                get_skills_from_prompt(template.skills, self.work_dir)
             else:
-                raise ValueError(f"Unknown agent type: {agent.type}")
-            return agent
+                skills_bundle_cache.link(template.skills, self.work_dir, template.skills_digest)
+            config["system_message"] = (
+                config.get("system_message") or get_default_system_message(template.agent_type)
+            ) + "\n\n" + skills_prompt
+
+        if template.agent_type == AgentType.retrieverproxy:
+            return ExtendedRetrieverAgent(**config, message_processor=self.process_message)
+        return ExtendedConversableAgent(**config, message_processor=self.process_message)
 
 
     def run(self, message: str, clear_history: bool = False) -> None:
 
-        #with autogen.Cache.redis() as cache:
-        if isinstance(self.sender, ExtendedRetrieverAgent):
+        self.completion_caches = self._attach_completion_caches()
+        if self.parallel:
+            self._run_parallel(message, clear_history=clear_history)
+            return
+
+        # token deltas of agents whose llm_config enables `stream` are forwarded
+        # as agent_message_delta events, the complete message still follows
+        with IOStream.set_default(DeltaIOStream(on_delta=self.process_delta)):
+            self._initiate_chat(self.sender, self.receiver, message, clear_history)
+
+    def _agents(self) -> List[autogen.Agent]:
+        """Every agent of the workflow, including the branch senders and the group chat members."""
+        agents = [self.sender, self.receiver]
+        for sender, receiver in self.branches:
+            agents += [sender, receiver]
+        if self.planner is not None:
+            agents.append(self.planner)
+        # the list grows while it is walked, so members of nested group chats are included
+        for agent in agents:
+            if isinstance(agent, autogen.GroupChatManager):
+                agents.extend(agent.groupchat.agents)
+        return agents
+
+    def _attach_completion_caches(self) -> Dict[Any, ScopedCompletionCache]:
+        """
+        Give every agent whose llm_config sets a cache_seed a completion cache scoped by that seed.
+        Agents without a seed, for which autogen disables caching, get none.
+        """
 
-            self.sender.initiate_chat(
-                self.receiver,
-                message=self.sender.message_generator,
+        cache = get_completion_cache()
+        scoped: Dict[Any, ScopedCompletionCache] = {}
+        for agent in self._agents():
+            if not hasattr(agent, "completion_cache"):
+                continue
+            llm_config = getattr(agent, "llm_config", None)
+            seed = llm_config.get("cache_seed") if isinstance(llm_config, dict) else None
+            if cache is None or seed is None:
+                agent.completion_cache = None
+                continue
+            if seed not in scoped:
+                scoped[seed] = cache.scoped(seed)
+            agent.completion_cache = scoped[seed]
+        return scoped
+
+    def completion_cache_stats(self) -> Optional[List[Dict[str, Any]]]:
+        """Hits and misses of the current run per cache_seed, None when no agent caches completions."""
+        if not self.completion_caches:
+            return None
+        return [cache.get_stats() for cache in self.completion_caches.values()]
+
+    def _initiate_chat(self,
+                       sender: autogen.Agent,
+                       receiver: autogen.Agent,
+                       message: str,
+                       clear_history: bool,
+                       **kwargs: Any
+                       ) -> autogen.ChatResult:
+        if isinstance(sender, ExtendedRetrieverAgent):
+            return sender.initiate_chat(
+                receiver,
+                message=sender.message_generator,
                 problem=message,
                 clear_history=clear_history,
-
-                #cache=cache
+                **kwargs
             )
-        else:
-            self.sender.initiate_chat(
-                self.receiver,
-                message=message,
-                clear_history=clear_history,
+        return sender.initiate_chat(
+            receiver,
+            message=message,
+            clear_history=clear_history,
+            **kwargs
+        )
+
+    def _send_branch_status(self, branch: str, status: str, **data: Any) -> None:
+        if self.send_message_function:
+            self.send_message_function(
+                SocketMessage(
+                    type="agent_status",
+                    data={"status": status, "branch": branch, **data},
+                    connection_id=self.connection_id,
+                )
             )
 
+    def _plan(self, message: str) -> Dict[str, str]:
+        """Asks the planner for one sub-task per branch agent. Falls back to the full task for every branch."""
 
+        tasks = {receiver.name: message for _, receiver in self.branches}
+        if self.planner is None:
+            return tasks
+        agents = "\n".join(
+            f"- {receiver.name}: {receiver.description}" for _, receiver in self.branches
+        )
+        prompt = (
+            f"Split the task below into sub-tasks for these agents, which work in parallel:\n{agents}\n\n"
+            f"Task:\n{message}\n\n"
+            "Reply only with a JSON object mapping every agent name to its sub-task."
+        )
+        reply = self.planner.generate_reply(messages=[{"role": "user", "content": prompt}])
+        reply = reply.get("content") if isinstance(reply, dict) else reply
+        try:
+            plan = json.loads(str(reply).strip().removeprefix("```json").strip("`\n "))
+            tasks.update({name: str(task) for name, task in plan.items() if name in tasks and task})
+        except (ValueError, AttributeError):
+            logger.warning("Planner reply is not a JSON object, sending the full task to every branch")
+        return tasks
+
+    def _run_branch(self, sender: autogen.Agent, receiver: autogen.Agent, task: str, clear_history: bool) -> str:
+        # IOStream defaults are context local, branch threads need their own
+        with IOStream.set_default(DeltaIOStream(on_delta=self.process_delta)):
+            self._send_branch_status(receiver.name, "branch_started", task=task)
+            self._initiate_chat(sender, receiver, task, clear_history)
+        answer = sender.last_message(receiver) or {}
+        self._send_branch_status(receiver.name, "branch_completed")
+        return answer.get("content") or ""
+
+    def _run_parallel(self, message: str, clear_history: bool = False) -> None:
+        """
+        Runs a parallel workflow: the planner assigns a task to every branch agent, the branches
+        run concurrently and the merger combines their answers into the final reply.
+        """
+
+        with IOStream.set_default(DeltaIOStream(on_delta=self.process_delta)):
+            tasks = self._plan(message)
+
+        answers = {}
+        with ThreadPoolExecutor(
+            max_workers=min(len(self.branches), PARALLEL_MAX_BRANCHES),
+            thread_name_prefix="workflow-branch",
+        ) as executor:
+            futures = {
+                executor.submit(self._run_branch, sender, receiver, tasks[receiver.name], clear_history): receiver.name
+                for sender, receiver in self.branches
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    answers[name] = future.result()
+                except RunCancelledError:
+                    if self.cancel_event is not None:
+                        self.cancel_event.set()
+                    raise
+                except Exception as ex_error:
+                    logger.error(f"Branch {name} failed: {ex_error}")
+                    self._send_branch_status(name, "branch_failed", message=str(ex_error))
+                    answers[name] = f"Failed: {ex_error}"
+
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise RunCancelledError("Workflow run was cancelled")
+
+        combined = "\n\n".join(
+            f"### {receiver.name}\n{answers[receiver.name]}" for _, receiver in self.branches
+        )
+        if self.merger is None:
+            self.process_message(self.receiver, self.sender, combined, request_reply=True)
+            return
+        prompt = (
+            f"Task:\n{message}\n\nAnswers from the agents that worked on it in parallel:\n\n"
+            f"{combined}\n\nCombine them into a single answer to the task."
+        )
+        # a plain message, a retriever sender would otherwise answer the merger from its collection
+        with IOStream.set_default(DeltaIOStream(on_delta=self.process_delta)):
+            self.sender.initiate_chat(self.merger, message=prompt, clear_history=clear_history, max_turns=1)
@@ -1,19 +1,42 @@
 import os
-from typing import Union, Dict, Optional, Sequence
+from typing import Union, Dict, List, Optional
 from qdrant_client import QdrantClient
 import autogen
 from autogen.agentchat.contrib.retrieve_user_proxy_agent import RetrieveUserProxyAgent
-from fastembed import TextEmbedding
 from qdrant_client import models
 
-from agent_builder.manager.embedding_functions import openai_embedding, FastEmbedEmbeddingFunction, \
-    sentence_transformer_ef
+from agent_builder.manager.embedding_functions import embedding_registry, parse_embedding_model
+from agent_builder.utils.streaming import streaming_speaker
+
+
+def ensure_collection(client: QdrantClient, collection_name: str, dimension: int, embedding_model: str) -> None:
+    """
+    Create a qdrant collection for vectors of `dimension` if it does not exist.
+
+    :raises ValueError: If the collection exists with vectors of another size, it was
+        indexed with a different embedding model and would return wrong results.
+    """
+    if not client.collection_exists(collection_name):
+        client.create_collection(collection_name,
+                                 models.VectorParams(size=dimension, distance=models.Distance.COSINE)
+            )
+        return
+    vectors = client.get_collection(collection_name).config.params.vectors
+    size = vectors.size if isinstance(vectors, models.VectorParams) else None
+    if size is not None and size != dimension:
+        raise ValueError(
+            f"Collection {collection_name} stores vectors of size {size} but the embedding model "
+            f"{embedding_model} produces vectors of size {dimension}. "
+            "Use a new collection name or re-index the knowledge hub with this model."
+        )
 
 
 class ExtendedConversableAgent(autogen.ConversableAgent):
     def __init__(self, message_processor=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.message_processor = message_processor
+        # set by the orchestrator for agents whose llm_config sets a cache_seed
+        self.completion_cache = None
 
     def receive(
         self,
@@ -28,6 +51,19 @@ class ExtendedConversableAgent(autogen.ConversableAgent):
             )
         super().receive(message, sender, request_reply, silent)
 
+    def generate_reply(
+        self,
+        messages: Optional[List[Dict]] = None,
+        sender: Optional[autogen.Agent] = None,
+        **kwargs,
+    ):
+        with streaming_speaker(self.name):
+            return super().generate_reply(messages=messages, sender=sender, **kwargs)
+
+    def _generate_oai_reply_from_client(self, llm_client, messages, cache):
+        # completions are cached per agent, by the cache_seed of the agent's own llm_config
+        return super()._generate_oai_reply_from_client(llm_client, messages, self.completion_cache)
+
 
 class ExtendedGroupChatManager(autogen.GroupChatManager):
     def __init__(self, message_processor=None, *args, **kwargs):
@@ -54,19 +90,33 @@ class ExtendedRetrieverAgent(RetrieveUserProxyAgent):
 
         config = kwargs
 
-        config = self.update_docs_path(config)
-
+        if config["retrieve_config"].pop("managed_collection", False):
+            # the knowledge hub sync maintains the collection, autogen would otherwise chunk
+            # docs_path again on every cold run and store every chunk a second time
+            config["retrieve_config"]["docs_path"] = None
+            config["retrieve_config"]["new_docs"] = False
+        else:
+            config = self.update_docs_path(config)
 
+        backend = config["retrieve_config"].pop("embedding_backend", None)
+        collection_model = config["retrieve_config"].pop("collection_embedding_model", None)
         if config["retrieve_config"]["vector_db"] == "qdrant":
             model =  config["retrieve_config"]["embedding_model"]
+            if collection_model and parse_embedding_model(collection_model) != parse_embedding_model(model, backend):
+                raise ValueError(
+                    f"Collection {config['retrieve_config']['collection_name']} was embedded with "
+                    f"{collection_model} by its knowledge hub, but the retriever embeds queries with {model}. "
+                    "Use the knowledge hub's embedding model in the retriever."
+                )
             url = config["retrieve_config"]["db_config"]["client"]
             client = QdrantClient(url)
             config["retrieve_config"]["db_config"]["client"] = client
-            config["retrieve_config"]["embedding_function"] = sentence_transformer_ef
+            config["retrieve_config"]["embedding_function"] = embedding_registry.get(model, backend=backend)
 
-            self.check_collection_exist(client, config)
+            self.check_collection_exist(client, config, embedding_registry.dimension(model, backend=backend))
         super().__init__(*args, **config)
         self.message_processor = message_processor
+        self.completion_cache = None
 
 
     def update_docs_path(self, config):
@@ -77,17 +127,10 @@ class ExtendedRetrieverAgent(RetrieveUserProxyAgent):
             config["retrieve_config"]["docs_path"] = urls
         return config
 
-    def check_collection_exist(self,client, config):
+    def check_collection_exist(self, client, config, dimension: int = 1024):
+        """Create the collection for vectors of `dimension` if it does not exist, see ensure_collection."""
         collection_name = config["retrieve_config"]["collection_name"]
-        doc_path = config["retrieve_config"]["docs_path"]
-        # if "www.hdfcbank.com" in doc_path:
-        #     config["retrieve_config"]["collection_name"] = "EVA_Content"
-        #     collection_name = config["retrieve_config"]["collection_name"]
-
-        if not client.collection_exists(collection_name):
-            client.create_collection(collection_name,
-                                     models.VectorParams(size=1024, distance=models.Distance.COSINE)
-                )
+        ensure_collection(client, collection_name, dimension, config["retrieve_config"]["embedding_model"])
 
     def receive(
         self,
@@ -100,4 +143,17 @@ class ExtendedRetrieverAgent(RetrieveUserProxyAgent):
             self.message_processor(
                 sender, self, message, request_reply, silent, sender_type="agent"
             )
-        super().receive(message, sender, request_reply, silent)
\ No newline at end of file
+        super().receive(message, sender, request_reply, silent)
+
+    def generate_reply(
+        self,
+        messages: Optional[List[Dict]] = None,
+        sender: Optional[autogen.Agent] = None,
+        **kwargs,
+    ):
+        with streaming_speaker(self.name):
+            return super().generate_reply(messages=messages, sender=sender, **kwargs)
+
+    def _generate_oai_reply_from_client(self, llm_client, messages, cache):
+        # completions are cached per agent, by the cache_seed of the agent's own llm_config
+        return super()._generate_oai_reply_from_client(llm_client, messages, self.completion_cache)
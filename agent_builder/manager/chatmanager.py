@@ -1,9 +1,9 @@
 import asyncio
 import json
 import os
+import threading
 from pathlib import Path
-from queue import Queue
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Union
 from datetime import datetime
 import time
 
@@ -11,20 +11,39 @@ from agent_builder.utils import get_modified_files, extract_successful_code_bloc
 
 import websockets
 from fastapi import WebSocket, WebSocketDisconnect
-from agent_builder.manager.agent_orchestrator import AgentOrchestrator
+from starlette.websockets import WebSocketState
+from loguru import logger
+from agent_builder.manager.agent_orchestrator import AgentOrchestrator, workflow_fingerprint
+from agent_builder.manager.session_cache import WarmSessionCache, warm_session_cache
+from agent_builder.manager.workspace import WorkspaceManager
 from agent_builder.datamodel import Message, Workflow, SocketMessage
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
-class ChatManager:
+# upper bound for the batching window a client may request
+MAX_BATCH_WINDOW_MS = 250
 
-    def __init__(self, message_queue: Queue) -> None:
 
-        self.message_queue = message_queue
+class ChatManager:
 
-    def send(self, message: str) -> None:
+    def __init__(self,
+                 send_message_function: Optional[Callable] = None,
+                 session_cache: Optional[WarmSessionCache] = None) -> None:
+        """
+        :param send_message_function: Thread-safe callable that delivers agent events to clients,
+            typically MessageDispatcher.dispatch.
+        :param session_cache: Warm orchestrators of recent sessions, defaults to the process wide cache.
+        """
+        self.send_message_function = send_message_function
+        self.session_cache = session_cache if session_cache is not None else warm_session_cache
 
-        if self.message_queue is not None:
-            self.message_queue.put_nowait(message)
+    def send(self, message: Union[SocketMessage, Dict]) -> None:
+
+        if self.send_message_function is not None:
+            self.send_message_function(message)
 
 
     def chat(self,
@@ -33,39 +52,83 @@ class ChatManager:
              workflow: Any = None,
              connection_id: Optional[str] = None,
              user_dir: Optional[str] = None,
+             cancel_event: Optional[threading.Event] = None,
+             warm_session: bool = True,
+             workspace_manager: Optional[WorkspaceManager] = None,
              **kwargs
              ) -> Message:
+        """
+        Runs the workflow on a message and returns the response message.
 
-        work_dir = Path(user_dir) / str(message.session_id) / datetime.now().strftime("%Y%m%d")
+        :param warm_session: Whether the session's warm orchestrator may be reused and kept.
+            Disabled when the history was windowed, its length no longer tracks the stored messages.
+        :param workspace_manager: Creates the work dir and records the files the run changes.
+            Without it the work dir is scanned for files modified during the run.
+        """
 
-        os.makedirs(work_dir, exist_ok=True)
+        if workspace_manager is not None:
+            work_dir = workspace_manager.workspace(user_dir, message.session_id)
+        else:
+            work_dir = Path(user_dir) / str(message.session_id) / datetime.now().strftime("%Y%m%d")
+            os.makedirs(work_dir, exist_ok=True)
 
         if workflow is None:
             raise ValueError("Workflow must be specified")
 
-        agent_orchestrator = AgentOrchestrator(
-            workflow=workflow,
-            history = history,
-            work_dir=work_dir,
-            send_message_function=self.send,
-            connection_id=connection_id
+        session_key = (
+            f"{message.user_id}:{message.session_id}"
+            if message.session_id is not None and warm_session
+            else None
         )
+        agent_orchestrator = (
+            self.session_cache.checkout(
+                session_key, workflow_fingerprint(workflow), str(work_dir), len(history)
+            )
+            if session_key is not None
+            else None
+        )
+        if agent_orchestrator is not None:
+            agent_orchestrator.prepare_run(
+                send_message_function=self.send,
+                connection_id=connection_id,
+                cancel_event=cancel_event,
+                history=history
+            )
+        else:
+            agent_orchestrator = AgentOrchestrator(
+                workflow=workflow,
+                history = history,
+                work_dir=work_dir,
+                send_message_function=self.send,
+                connection_id=connection_id,
+                cancel_event=cancel_event
+            )
 
         workflow = Workflow.model_validate(workflow)
 
         message_text = message.content.strip()
 
         start_time = time.time()
-        agent_orchestrator.run(
-            message=f"{message}", clear_history=False
-        )
-        end_time = time.time()
+        if workspace_manager is not None:
+            with workspace_manager.track(work_dir) as workspace_run:
+                agent_orchestrator.run(
+                    message=f"{message}", clear_history=False
+                )
+            end_time = time.time()
+            modified_files = workspace_run.files
+        else:
+            agent_orchestrator.run(
+                message=f"{message}", clear_history=False
+            )
+            end_time = time.time()
+            modified_files = get_modified_files(start_time, end_time, source_dir = work_dir)
 
         metadata = {
             "messages": agent_orchestrator.agent_history,
             "summary_method": workflow.summary_method,
             "time": end_time - start_time,
-            "file": get_modified_files(start_time, end_time, source_dir = work_dir)
+            "file": modified_files,
+            "completion_cache": agent_orchestrator.completion_cache_stats(),
         }
 
         output = self._generate_output(message_text, agent_orchestrator, workflow)
@@ -78,6 +141,11 @@ class ChatManager:
             session_id=message.session_id
         )
 
+        if session_key is not None:
+            # the incoming message and this response are stored by the caller
+            agent_orchestrator.history_length += 2
+            self.session_cache.checkin(session_key, agent_orchestrator)
+
         return output_message
 
     def _generate_output(self,
@@ -119,6 +187,7 @@ class ChatManager:
                 task=message_text,
                 messages=agent_orchestrator.agent_history,
                 client=client,
+                on_delta=lambda delta: agent_orchestrator.process_delta("summarizer", delta),
             )
         elif workflow.summary_method == "none":
             output = ""
@@ -127,42 +196,50 @@ class ChatManager:
 
 
 class WebSocketConnectionManager:
+    """
+    Registry of active websocket connections keyed by connection id.
 
-    def __init__(self,
-                 active_connections: List[Tuple[WebSocket, str]] = None,
-                active_connections_lock: asyncio.Lock = None,
-    ) -> None:
-        if active_connections is None:
-            active_connections = []
+    Lookups and removals are O(1). Every socket has its own send lock, so a slow client only
+    delays messages to itself and broadcasts go out to all sockets concurrently.
+    """
 
-        self.active_connections_lock = active_connections_lock
-        self.active_connections: List[Tuple[WebSocket, str]] = active_connections
+    def __init__(self) -> None:
+        self.active_connections: Dict[str, WebSocket] = {}
+        self._connection_ids: Dict[int, str] = {}
+        self._send_locks: Dict[str, asyncio.Lock] = {}
 
+    def __len__(self) -> int:
+        return len(self.active_connections)
+
+    def get(self, connection_id: str) -> Optional[WebSocket]:
+        return self.active_connections.get(connection_id)
+
+    def connection_id_for(self, websocket: WebSocket) -> Optional[str]:
+        return self._connection_ids.get(id(websocket))
 
     async def connect(self, websocket: WebSocket, client_id: str) -> None:
 
         await websocket.accept()
-        async with self.active_connections_lock:
-            self.active_connections.append((websocket, client_id))
-            print(f"New Connection: {client_id}, Total: {len(self.active_connections)}")
+        self.active_connections[client_id] = websocket
+        self._connection_ids[id(websocket)] = client_id
+        self._send_locks[client_id] = asyncio.Lock()
+        print(f"New Connection: {client_id}, Total: {len(self.active_connections)}")
 
 
     async def disconnect(self, websocket: WebSocket) -> None:
 
-        async with self.active_connections_lock:
-            try:
-                self.active_connections = [
-                    conn for conn in self.active_connections if conn[0] != websocket
-                ]
-                print(f"Connection Closed. Total: {len(self.active_connections)}")
-            except ValueError:
-                print("Error: WebSocket connection not found")
+        client_id = self._connection_ids.pop(id(websocket), None)
+        if client_id is None:
+            return
+        self.active_connections.pop(client_id, None)
+        self._send_locks.pop(client_id, None)
+        print(f"Connection Closed: {client_id}, Total: {len(self.active_connections)}")
 
     async def disconnect_all(self) -> None:
         """
         Disconnects all active WebSocket connections.
         """
-        for connection, _ in self.active_connections[:]:
+        for connection in list(self.active_connections.values()):
             await self.disconnect(connection)
 
     async def send_message(
@@ -174,9 +251,26 @@ class WebSocketConnectionManager:
         :param message: A JSON serializable dictionary containing the message to send.
         :param websocket: The WebSocket instance through which to send the message.
         """
+        await self._send(websocket, websocket.send_json, message)
+
+    async def send_frame(self, frame: Union[str, bytes], websocket: WebSocket) -> None:
+        """
+        Sends an already encoded frame to a single WebSocket connection.
+
+        :param frame: Text frame contents, or bytes for a binary frame.
+        :param websocket: The WebSocket instance through which to send the frame.
+        """
+        send = websocket.send_bytes if isinstance(frame, bytes) else websocket.send_text
+        await self._send(websocket, send, frame)
+
+    async def _send(self, websocket: WebSocket, send: Callable, payload: Any) -> None:
+        send_lock = self._send_locks.get(self.connection_id_for(websocket))
+        if send_lock is None:
+            print("Error: Tried to send a message to an unregistered WebSocket")
+            return
         try:
-            async with self.active_connections_lock:
-                await websocket.send_json(message)
+            async with send_lock:
+                await send(payload)
         except WebSocketDisconnect:
             print("Error: Tried to send a message to a closed WebSocket")
             await self.disconnect(websocket)
@@ -184,31 +278,209 @@ class WebSocketConnectionManager:
             print("Error: WebSocket connection closed normally")
             await self.disconnect(websocket)
         except Exception as e:
-            print(f"Error in sending message: {str(e)}", message)
+            print(f"Error in sending message: {str(e)}", payload)
             await self.disconnect(websocket)
 
     async def broadcast(self, message: Dict) -> None:
         """
-        Broadcasts a JSON message to all active WebSocket connections.
+        Broadcasts a JSON message to all active WebSocket connections concurrently.
 
         :param message: A JSON serializable dictionary containing the message to broadcast.
         """
         # Create a message dictionary with the desired format
         message_dict = {"message": message}
 
-        for connection, _ in self.active_connections[:]:
-            try:
-                if connection.client_state == websockets.protocol.State.OPEN:
-                    # Call send_message method with the message dictionary and current WebSocket connection
-                    await self.send_message(message_dict, connection)
-                else:
-                    print("Error: WebSocket connection is closed")
-                    await self.disconnect(connection)
-            except (WebSocketDisconnect, websockets.exceptions.ConnectionClosedOK) as e:
-                print(f"Error: WebSocket disconnected or closed({str(e)})")
+        sends = []
+        for connection in list(self.active_connections.values()):
+            if connection.client_state == WebSocketState.CONNECTED:
+                sends.append(self.send_message(message_dict, connection))
+            else:
+                print("Error: WebSocket connection is closed")
                 await self.disconnect(connection)
+        await asyncio.gather(*sends, return_exceptions=True)
+
+
+class SocketTransport:
+    """
+    Wire format of a websocket connection, negotiated by the client with query parameters
+    on the websocket URL, e.g. `/api/ws/?batch_ms=10&encoding=msgpack`.
+
+    By default every event is sent as its own JSON text frame, as before. With `batch_ms` set,
+    events queued within that window are coalesced into one `{"type": "batch", "data": [...]}`
+    frame. With `encoding=msgpack` frames are MessagePack encoded binary frames. Both options
+    drop the `connection_id` repeated in every event, it is sent once in `connection_ack`.
+
+    :param batch_window_ms: Milliseconds to wait for more events before sending a frame. 0 disables batching.
+    :param max_batch_size: Maximum number of events coalesced into one frame.
+    :param encoding: "json" or "msgpack".
+    """
+
+    def __init__(self, batch_window_ms: float = 0, max_batch_size: int = 64, encoding: str = "json") -> None:
+        if encoding == "msgpack" and msgpack is None:
+            logger.warning("msgpack is not installed, falling back to json encoding")
+            encoding = "json"
+        self.batch_window_ms = max(0.0, batch_window_ms)
+        self.max_batch_size = max(1, max_batch_size)
+        self.encoding = encoding
+
+    @classmethod
+    def from_query_params(cls, query_params: Any) -> "SocketTransport":
+        """Build the transport requested in the websocket query parameters, ignoring invalid values."""
+        try:
+            batch_window_ms = min(float(query_params.get("batch_ms", 0)), MAX_BATCH_WINDOW_MS)
+        except ValueError:
+            batch_window_ms = 0
+        encoding = query_params.get("encoding", "json")
+        return cls(
+            batch_window_ms=batch_window_ms,
+            encoding=encoding if encoding in ("json", "msgpack") else "json",
+        )
 
+    @property
+    def compact(self) -> bool:
+        return self.batch_window_ms > 0 or self.encoding != "json"
+
+    def describe(self) -> Dict[str, Any]:
+        return {"batch_ms": self.batch_window_ms, "encoding": self.encoding}
+
+    def prepare(self, message: Union[SocketMessage, Dict]) -> Dict:
+        if isinstance(message, SocketMessage):
+            message = message.model_dump(mode="json")
+        if not self.compact or message.get("type") == "connection_ack":
+            return message
+        message = {key: value for key, value in message.items() if key != "connection_id"}
+        data = message.get("data")
+        if isinstance(data, dict) and "connection_id" in data:
+            message["data"] = {key: value for key, value in data.items() if key != "connection_id"}
+        return message
+
+    def encode(self, messages: List[Dict]) -> Union[str, bytes]:
+        payload = messages[0] if len(messages) == 1 else {"type": "batch", "data": messages}
+        if self.encoding == "msgpack":
+            return msgpack.packb(payload, default=str)
+        return json.dumps(payload, separators=(",", ":"), default=str)
+
+
+class MessageDispatcher:
+    """
+    Delivers socket messages to their websocket from the event loop.
+
+    Producers on run threads call `dispatch`, which hands the message over to the loop with
+    `call_soon_threadsafe`. Every registered connection has its own asyncio.Queue drained by a
+    single writer task, so messages for a socket are sent in order and never concurrently.
+
+    Queues hold at most `max_queued` messages, so a slow socket can't grow memory without
+    bound. Runs never wait for a socket: once a queue is full, token deltas are dropped since
+    the complete agent message follows them, and other messages evict the oldest queued one.
+
+    :param websocket_manager: Sends the messages over the sockets.
+    :param max_queued: Maximum number of messages queued per connection.
+    """
+
+    def __init__(self, websocket_manager: "WebSocketConnectionManager", max_queued: int = 1000) -> None:
+        self.websocket_manager = websocket_manager
+        self.max_queued = max_queued
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.writers: Dict[str, asyncio.Task] = {}
+        self.dropped: Dict[str, int] = {}
+
+    def start(self) -> None:
+        """Bind the dispatcher to the running event loop."""
+        self.loop = asyncio.get_running_loop()
+
+    def register(self,
+                 connection_id: str,
+                 websocket: WebSocket,
+                 transport: Optional[SocketTransport] = None) -> None:
+        """
+        Create the queue and writer task for a connection. Must be called on the loop.
 
+        :param transport: Wire format of the connection. Defaults to one JSON frame per message.
+        """
+        queue = asyncio.Queue(maxsize=self.max_queued)
+        self.queues[connection_id] = queue
+        if transport is None or not transport.compact:
+            writer = self._writer(websocket, queue)
+        else:
+            writer = self._batch_writer(websocket, queue, transport)
+        self.writers[connection_id] = asyncio.create_task(writer)
+
+    async def unregister(self, connection_id: str) -> None:
+        self.queues.pop(connection_id, None)
+        self.dropped.pop(connection_id, None)
+        writer = self.writers.pop(connection_id, None)
+        if writer is not None:
+            writer.cancel()
+
+    async def stop(self) -> None:
+        for connection_id in list(self.writers):
+            await self.unregister(connection_id)
+
+    def dispatch(self, message: Union[SocketMessage, Dict]) -> None:
+        """
+        Queue a message for its connection. Safe to call from any thread.
 
-
-
+        :param message: A SocketMessage or a dict carrying a `connection_id` key.
+        """
+        if self.loop is None or self.loop.is_closed():
+            logger.warning("Message dispatcher is not running, dropping message")
+            return
+        self.loop.call_soon_threadsafe(self._enqueue, message)
+
+    async def send(self, message: Union[SocketMessage, Dict]) -> None:
+        """Queue a message from the event loop, preserving order with dispatched agent messages."""
+        self._enqueue(message)
+
+    def _enqueue(self, message: Union[SocketMessage, Dict]) -> None:
+        connection_id = (
+            message.connection_id
+            if isinstance(message, SocketMessage)
+            else message.get("connection_id")
+        )
+        queue = self.queues.get(str(connection_id))
+        if queue is None:
+            logger.info(f"Skipping message for unknown connection_id: {connection_id}")
+            return
+        if queue.full():
+            message_type = message.type if isinstance(message, SocketMessage) else message.get("type")
+            if message_type != "agent_message_delta":
+                queue.get_nowait()
+            self._count_drop(str(connection_id))
+            if message_type == "agent_message_delta":
+                return
+        queue.put_nowait(message)
+
+    def _count_drop(self, connection_id: str) -> None:
+        dropped = self.dropped.get(connection_id, 0) + 1
+        self.dropped[connection_id] = dropped
+        # log the first drop and then every hundredth, a stalled socket drops a lot
+        if dropped % 100 == 1:
+            logger.warning(f"Socket queue of connection {connection_id} is full, {dropped} messages dropped")
+
+    async def _writer(self, websocket: WebSocket, queue: asyncio.Queue) -> None:
+        while True:
+            message = await queue.get()
+            if isinstance(message, SocketMessage):
+                message = message.model_dump(mode="json")
+            await self.websocket_manager.send_message(message, websocket)
+
+    async def _batch_writer(self, websocket: WebSocket, queue: asyncio.Queue, transport: SocketTransport) -> None:
+        window = transport.batch_window_ms / 1000
+        while True:
+            batch = [transport.prepare(await queue.get())]
+            deadline = self.loop.time() + window
+            while len(batch) < transport.max_batch_size:
+                # drain what is already queued, then wait out the rest of the window
+                if queue.empty():
+                    remaining = deadline - self.loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        message = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    message = queue.get_nowait()
+                batch.append(transport.prepare(message))
+            await self.websocket_manager.send_frame(transport.encode(batch), websocket)
@@ -1,11 +1,23 @@
 import os
-from typing import Union, Sequence, Optional
-from langchain_openai import OpenAIEmbeddings
-from sentence_transformers import SentenceTransformer
-from fastembed import TextEmbedding
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Union, Sequence, Optional, Tuple
+
+from loguru import logger
+
+from agent_builder.utils.embedding_cache import CachedEmbeddingFunction, EmbeddingCache
 
 
 Embeddings = Union[Sequence[float], Sequence[int]]
+EmbeddingFunction = Callable[[List[str]], List[Embeddings]]
+
+# embedding backends, the models are loaded by the registry on first use
+FASTEMBED = "fastembed"
+SENTENCE_TRANSFORMERS = "sentence_transformers"
+OPENAI = "openai"
+
 
 class FastEmbedEmbeddingFunction:
     """Embedding function implementation using FastEmbed - https://qdrant.github.io/fastembed."""
@@ -36,6 +48,8 @@ class FastEmbedEmbeddingFunction:
         Raises:
             ValueError: If the model_name is not in the format `<org>/<model>` e.g. BAAI/bge-small-en-v1.5.
         """
+        from fastembed import TextEmbedding
+
         self._batch_size = batch_size
         self._parallel = parallel
         self._model = TextEmbedding(model_name=model_name, cache_dir=cache_dir, threads=threads, **kwargs)
@@ -46,7 +60,275 @@ class FastEmbedEmbeddingFunction:
         return [embedding.tolist() for embedding in embeddings]
 
 
+class SentenceTransformerEmbeddingFunction:
+    """Embedding function implementation using sentence-transformers."""
+
+    def __init__(self, model_name: str = "BAAI/bge-large-en-v1.5", **kwargs):
+        from sentence_transformers import SentenceTransformer
+
+        self._model = SentenceTransformer(model_name, **kwargs)
+
+    def __call__(self, inputs: list[str]) -> list[Embeddings]:
+        return self._model.encode(inputs)
+
+
+class OpenAIEmbeddingFunction:
+    """Embedding function implementation using the OpenAI embeddings api."""
+
+    def __init__(self, model_name: str = "text-embedding-ada-002", **kwargs):
+        from langchain_openai import OpenAIEmbeddings
+
+        self._model = OpenAIEmbeddings(model=model_name, **kwargs)
+
+    def __call__(self, inputs: list[str]) -> list[Embeddings]:
+        return self._model.embed_documents(inputs)
+
+
+class EmbeddingBatcher:
+    """
+    Embedding function that collects the texts of concurrent callers into micro-batches and
+    embeds them with one call of the wrapped function on background threads. A batch is sent
+    once it holds `max_batch_size` texts or `max_wait_ms` after its first request arrived.
+    Calls with at least `max_batch_size` texts, e.g. indexing documents, bypass the batching.
+
+    If a batch fails, its requests are retried one by one so a single bad input only fails
+    its own caller. The threads start on first use in every process, forked processes start
+    their own.
+
+    :param embedding_function: The embedding function to batch.
+    :param max_batch_size: Maximum number of texts embedded at once.
+    :param max_wait_ms: Milliseconds the first request of a batch waits for more requests.
+    :param workers: Number of batches embedded at once.
+    :param timeout: Seconds a caller waits for its embeddings, None waits forever.
+    """
+
+    def __init__(self,
+                 embedding_function: EmbeddingFunction,
+                 max_batch_size: int = 64,
+                 max_wait_ms: float = 5,
+                 workers: int = 1,
+                 timeout: Optional[float] = 60,
+                 ) -> None:
+        self.embedding_function = embedding_function
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers
+        self.timeout = timeout
+        self._requests: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+
+    def __call__(self, inputs: list[str]) -> list[Embeddings]:
+        if not inputs:
+            return []
+        if len(inputs) >= self.max_batch_size:
+            return self.embedding_function(inputs)
+        future: Future = Future()
+        self._start().put((list(inputs), future))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Embedding {len(inputs)} texts took more than {self.timeout}s")
+
+    def _start(self) -> "queue.Queue[Tuple[List[str], Future]]":
+        # threads do not survive a fork, a forked process starts its own on a fresh queue
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._requests = queue.Queue()
+                    for _ in range(self.workers):
+                        threading.Thread(
+                            target=self._batch_loop, args=(self._requests,), name="embedding-batcher", daemon=True
+                        ).start()
+                    self._pid = os.getpid()
+        return self._requests
+
+    def _next_batch(self, requests: "queue.Queue[Tuple[List[str], Future]]") -> List[Tuple[List[str], Future]]:
+        batch = [requests.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request[0])
+        # callers that timed out cancelled their futures
+        return [(inputs, future) for inputs, future in batch if future.set_running_or_notify_cancel()]
+
+    def _batch_loop(self, requests: "queue.Queue[Tuple[List[str], Future]]") -> None:
+        while True:
+            batch = self._next_batch(requests)
+            if not batch:
+                continue
+            texts = [text for inputs, _ in batch for text in inputs]
+            try:
+                embeddings = list(self.embedding_function(texts))
+            except Exception as ex_error:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(ex_error)
+                else:
+                    self._embed_each(batch)
+                continue
+            offset = 0
+            for inputs, future in batch:
+                future.set_result(embeddings[offset:offset + len(inputs)])
+                offset += len(inputs)
+
+    def _embed_each(self, batch: List[Tuple[List[str], Future]]) -> None:
+        for inputs, future in batch:
+            try:
+                future.set_result(list(self.embedding_function(inputs)))
+            except Exception as ex_error:
+                future.set_exception(ex_error)
+
+
+EMBEDDING_BACKENDS = {
+    FASTEMBED: FastEmbedEmbeddingFunction,
+    SENTENCE_TRANSFORMERS: SentenceTransformerEmbeddingFunction,
+    OPENAI: OpenAIEmbeddingFunction,
+}
+
+
+def parse_embedding_model(embedding_model: str, backend: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Split an embedding model spec into backend and model name. Specs may carry the backend as
+    prefix, e.g. `fastembed:BAAI/bge-small-en-v1.5`. Otherwise OpenAI models are recognized by
+    name and every other model is loaded with sentence-transformers.
+    """
+    backend = getattr(backend, "value", backend)
+    prefix, _, model_name = embedding_model.partition(":")
+    if model_name and prefix in EMBEDDING_BACKENDS:
+        return prefix, model_name
+    if backend is None:
+        backend = OPENAI if embedding_model.startswith("text-embedding-") else SENTENCE_TRANSFORMERS
+    return backend, embedding_model
+
+
+class EmbeddingModelRegistry:
+    """
+    Process wide registry of embedding functions, keyed by backend and model name. Models are
+    loaded on first use and shared by every agent, retriever and cache of the process, the
+    concurrent calls of all of them are micro-batched by an EmbeddingBatcher per model, and
+    the embeddings of queries are cached by an EmbeddingCache.
+
+    :param batch_size: Maximum number of texts embedded at once, 0 disables the batching.
+    :param batch_wait_ms: Milliseconds a request waits for others to join its batch.
+    :param batch_workers: Number of batches of a model embedded at once.
+    :param batch_timeout: Seconds a caller waits for the embeddings of its batch.
+    :param threads: Number of onnxruntime threads of fastembed models.
+    :param cache: Cache of query embeddings, None disables the caching.
+    """
+
+    def __init__(self,
+                 batch_size: int = 64,
+                 batch_wait_ms: float = 5,
+                 batch_workers: int = 1,
+                 batch_timeout: float = 60,
+                 threads: Optional[int] = None,
+                 cache: Optional[EmbeddingCache] = None,
+                 ) -> None:
+        self.batch_size = batch_size
+        self.batch_wait_ms = batch_wait_ms
+        self.batch_workers = batch_workers
+        self.batch_timeout = batch_timeout
+        self.threads = threads
+        self.cache = cache
+        self._models: Dict[Tuple[str, str], EmbeddingFunction] = {}
+        self._dimensions: Dict[Tuple[str, str], int] = {}
+        self._loading: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingModelRegistry":
+        threads = os.getenv("AGENT_BUILDER_EMBEDDING_THREADS")
+        return cls(
+            batch_size=int(os.getenv("AGENT_BUILDER_EMBEDDING_BATCH_SIZE", "64")),
+            batch_wait_ms=float(os.getenv("AGENT_BUILDER_EMBEDDING_BATCH_WAIT_MS", "5")),
+            batch_workers=int(os.getenv("AGENT_BUILDER_EMBEDDING_BATCH_WORKERS", "1")),
+            batch_timeout=float(os.getenv("AGENT_BUILDER_EMBEDDING_BATCH_TIMEOUT", "60")),
+            threads=int(threads) if threads else None,
+            cache=(
+                EmbeddingCache.from_env()
+                if os.getenv("AGENT_BUILDER_EMBEDDING_CACHE", "true").lower() == "true"
+                else None
+            ),
+        )
+
+    def get(self, embedding_model: str, backend: Optional[str] = None) -> EmbeddingFunction:
+        """
+        Embedding function of a model, e.g. `RetrieverConfig.embedding_model`.
+
+        :param embedding_model: Model name, optionally prefixed with the backend.
+        :param backend: Backend used when the model name has no prefix.
+        """
+        key = parse_embedding_model(embedding_model, backend)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                return model
+            loading = self._loading.setdefault(key, threading.Lock())
+        # models load outside the registry lock, other models stay available meanwhile
+        with loading:
+            with self._lock:
+                model = self._models.get(key)
+            if model is None:
+                logger.info(f"Loading embedding model {key[1]} with {key[0]}")
+                model = self._load(*key)
+                with self._lock:
+                    self._models[key] = model
+                    self._loading.pop(key, None)
+        return model
+
+    def _load(self, backend: str, model_name: str) -> EmbeddingFunction:
+        options = {}
+        if backend == FASTEMBED:
+            options = {"batch_size": max(self.batch_size, 1), "threads": self.threads}
+        model = EMBEDDING_BACKENDS[backend](model_name=model_name, **options)
+        if self.batch_size > 0:
+            model = EmbeddingBatcher(
+                model,
+                max_batch_size=self.batch_size,
+                max_wait_ms=self.batch_wait_ms,
+                workers=self.batch_workers,
+                timeout=self.batch_timeout,
+            )
+        if self.cache is not None:
+            model = CachedEmbeddingFunction(model, f"{backend}:{model_name}", self.cache)
+        return model
+
+    def dimension(self, embedding_model: str, backend: Optional[str] = None) -> int:
+        """Size of the vectors of a model, measured once by embedding a probe text."""
+        key = parse_embedding_model(embedding_model, backend)
+        with self._lock:
+            dimension = self._dimensions.get(key)
+        if dimension is None:
+            dimension = len(self.get(key[1], backend=key[0])(["dimension probe"])[0])
+            with self._lock:
+                self._dimensions[key] = dimension
+        return dimension
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return [f"{backend}:{model_name}" for backend, model_name in self._models]
+
+    def warmup(self, embedding_models: List[str]) -> None:
+        """Load embedding models ahead of their first use."""
+        for embedding_model in embedding_models:
+            try:
+                self.get(embedding_model)
+            except Exception as ex_error:
+                logger.warning(f"Could not preload embedding model {embedding_model}: {ex_error}")
+
+    def warmup_from_env(self) -> None:
+        """Load the comma separated models of AGENT_BUILDER_EMBEDDING_WARMUP."""
+        models = os.getenv("AGENT_BUILDER_EMBEDDING_WARMUP", "")
+        self.warmup([model.strip() for model in models.split(",") if model.strip()])
 
-openai_embedding = OpenAIEmbeddings(model="text-embedding-ada-002").embed_documents
 
-sentence_transformer_ef = SentenceTransformer("BAAI/bge-large-en-v1.5").encode
\ No newline at end of file
+embedding_registry = EmbeddingModelRegistry.from_env()
@@ -0,0 +1,170 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from autogen import OpenAIWrapper
+from loguru import logger
+
+from agent_builder.database import DBManager
+from agent_builder.datamodel import Message, SessionSummary
+from agent_builder.utils import count_tokens, sanitize_model, summarize_conversation
+from agent_builder.utils.llm_clients import llm_client_registry
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def workflow_model(workflow: Dict) -> str:
+    """Model of the workflow's receiver, used to count tokens for the history budget."""
+    llm_config = ((workflow.get("receiver") or {}).get("config") or {}).get("llm_config") or {}
+    config_list = llm_config.get("config_list") or []
+    return config_list[0].get("model", "gpt-4o") if config_list else "gpt-4o"
+
+
+def window_history(history: List[Dict],
+                   max_turns: Optional[int] = None,
+                   token_budget: Optional[int] = None,
+                   model: str = "gpt-4o"
+                   ) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Split a session history, sorted oldest first, into the messages kept in the window and the
+    older messages that aged out of it. A turn starts with a user message and runs up to the
+    next one, so tool calls and their results always stay together. The window is cut between
+    turns only, and the latest turn is always kept.
+
+    :param max_turns: Maximum number of turns kept.
+    :param token_budget: Maximum number of tokens, counted for `model`, of the kept messages.
+    """
+    if not history:
+        return [], []
+    boundaries = [index for index, message in enumerate(history) if message.get("role") == "user"]
+    if not boundaries or boundaries[0] != 0:
+        # messages before the first user message form a turn of their own
+        boundaries.insert(0, 0)
+    start = len(history)
+    turns = 0
+    tokens = 0
+    for boundary in reversed(boundaries):
+        if token_budget:
+            tokens += sum(count_tokens(message.get("content") or "", model) for message in history[boundary:start])
+        if start < len(history) and (
+            (max_turns and turns >= max_turns) or (token_budget and tokens > token_budget)
+        ):
+            break
+        turns += 1
+        start = boundary
+    return history[start:], history[:start]
+
+
+class HistoryManager:
+    """
+    Applies the history policy of a workflow (`history_max_turns`, `history_token_budget`) to the
+    session history passed to the agents. Messages that age out of the window are folded into a
+    rolling SessionSummary in the background after each run, and the summary is passed to the
+    agents in their place, so the prompt size stays flat over long sessions.
+
+    :param dbmanager: The database manager.
+    :param max_workers: Number of summaries computed at once.
+    """
+
+    def __init__(self, dbmanager: DBManager, max_workers: int = 1) -> None:
+        self.dbmanager = dbmanager
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="session-summary")
+        self._pending: Set[int] = set()
+        self._pending_lock = threading.Lock()
+
+    @staticmethod
+    def has_policy(workflow: Dict) -> bool:
+        return bool(workflow.get("history_max_turns") or workflow.get("history_token_budget"))
+
+    def prepare(self, session_id: Optional[int], history: List[Dict], workflow: Dict) -> Tuple[List[Dict], bool]:
+        """
+        Returns the history to pass to the agents and whether it was trimmed.
+
+        Aged out messages that are not part of the summary yet, because the summary of the
+        previous run is still being computed, stay in the history.
+        """
+        history = sorted(history, key=lambda msg: (msg.get("created_at") is None, msg.get("created_at"), msg.get("id") or 0))
+        if session_id is None or not self.has_policy(workflow):
+            return history, False
+
+        kept, aged_out = self._window(history, workflow)
+        if not aged_out:
+            return history, False
+        summary = self.get_summary(session_id)
+        summarized_until_id = summary.summarized_until_id if summary else 0
+        kept = [msg for msg in aged_out if (msg.get("id") or 0) > summarized_until_id] + kept
+        if summary and summary.summary:
+            kept = [self._summary_message(summary, history[0])] + kept
+        return kept, True
+
+    def schedule_summary(self, session_id: Optional[int], user_id: str, workflow: Dict) -> None:
+        """Fold the messages that aged out of the window into the session summary, in the background."""
+        if session_id is None or not self.has_policy(workflow):
+            return
+        with self._pending_lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+        self.executor.submit(self._update_summary, session_id, user_id, workflow)
+
+    def get_summary(self, session_id: int) -> Optional[SessionSummary]:
+        summaries = self.dbmanager.get(SessionSummary, filters={"session_id": session_id}).data
+        return summaries[0] if summaries else None
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
+
+    def _window(self, history: List[Dict], workflow: Dict) -> Tuple[List[Dict], List[Dict]]:
+        return window_history(
+            history,
+            max_turns=workflow.get("history_max_turns"),
+            token_budget=workflow.get("history_token_budget"),
+            model=workflow_model(workflow),
+        )
+
+    @staticmethod
+    def _summary_message(summary: SessionSummary, first_message: Dict) -> Dict:
+        # a system note, the agents must not take the summary for something the user said
+        return {
+            "role": "system",
+            "content": SUMMARY_PREFIX + summary.summary,
+            "user_id": first_message.get("user_id"),
+            "session_id": summary.session_id,
+            "created_at": first_message.get("created_at"),
+        }
+
+    def _update_summary(self, session_id: int, user_id: str, workflow: Dict) -> None:
+        try:
+            history = self.dbmanager.get(
+                Message,
+                filters={"user_id": user_id, "session_id": session_id},
+                return_json=True,
+                order="asc",
+            ).data
+            _, aged_out = self._window(history, workflow)
+            summary = self.get_summary(session_id) or SessionSummary(session_id=session_id)
+            new_messages = [msg for msg in aged_out if (msg.get("id") or 0) > summary.summarized_until_id]
+            if not new_messages:
+                return
+            client = self._client(workflow)
+            if client is not None:
+                summary.summary = summarize_conversation(summary.summary, new_messages, client)
+            else:
+                logger.warning(f"No llm configured to summarize session {session_id}, dropping old messages")
+            summary.summarized_until_id = max(msg.get("id") or 0 for msg in new_messages)
+            summary.updated_at = datetime.now()
+            self.dbmanager.upsert(summary)
+        except Exception as ex_error:
+            logger.error(f"Error while summarizing session {session_id}: {ex_error}")
+        finally:
+            with self._pending_lock:
+                self._pending.discard(session_id)
+
+    @staticmethod
+    def _client(workflow: Dict) -> Optional[Any]:
+        llm_config = ((workflow.get("receiver") or {}).get("config") or {}).get("llm_config") or {}
+        config_list = [sanitize_model(llm) for llm in llm_config.get("config_list") or []]
+        if not config_list:
+            return None
+        return OpenAIWrapper(config_list=llm_client_registry.bind_config_list(config_list))
@@ -0,0 +1,355 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from autogen.retrieve_utils import TEXT_FORMATS, get_file_from_url, is_url, split_files_to_chunks
+from loguru import logger
+from qdrant_client import QdrantClient, models
+from sqlmodel import Session, select
+
+from agent_builder.database import DBManager
+from agent_builder.datamodel import KnowledgeHub, KnowledgeHubDocument, KnowledgeHubType
+from agent_builder.manager.agents import ensure_collection
+from agent_builder.manager.embedding_functions import embedding_registry, parse_embedding_model
+from agent_builder.manager.run_executor import RunCancelledError
+
+DEFAULT_EMBEDDING_MODEL = "BAAI/bge-large-en-v1.5"
+# payload keys of autogen's QdrantVectorDB, so retriever agents read the synced chunks
+CONTENT_PAYLOAD_KEY = "_content"
+METADATA_PAYLOAD_KEY = "_metadata"
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source: str, index: int, chunk: str) -> str:
+    """Point id of a chunk. Ids are scoped by source, removing a document never removes chunks of another."""
+    return str(uuid.UUID(hex=hashlib.md5(f"{source}\0{index}\0{chunk}".encode("utf-8")).hexdigest()))
+
+
+class KnowledgeHubSync:
+    """
+    Incrementally ingests the documents of a knowledge hub into its vector collection.
+
+    Every hub keeps a manifest of KnowledgeHubDocument rows: source, size, mtime, content hash
+    and the ids of its chunks. A sync lists the sources, skips files whose size and mtime are
+    unchanged, hashes the others, re-embeds only new or changed documents and deletes the
+    chunks of changed and removed documents. Documents are processed in batches, each batch is
+    committed to the manifest after its vectors are written, so an interrupted sync resumes.
+
+    The backend and model the collection is embedded with are stored on the hub, retrievers of
+    the collection must embed their queries with the same model.
+
+    :param dbmanager: The database manager.
+    :param qdrant_url: URL of the qdrant server, defaults to AGENT_BUILDER_QDRANT_URI.
+    :param chunk_token_size: Maximum number of tokens of a chunk.
+    :param batch_size: Number of changed documents embedded and written at once.
+    """
+
+    def __init__(self,
+                 dbmanager: DBManager,
+                 qdrant_url: Optional[str] = None,
+                 chunk_token_size: int = 4000,
+                 batch_size: int = 64,
+                 ) -> None:
+        self.dbmanager = dbmanager
+        self.qdrant_url = qdrant_url or os.getenv("AGENT_BUILDER_QDRANT_URI")
+        self.chunk_token_size = chunk_token_size
+        self.batch_size = batch_size
+        self._running = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, dbmanager: DBManager) -> "KnowledgeHubSync":
+        return cls(
+            dbmanager,
+            chunk_token_size=int(os.getenv("AGENT_BUILDER_HUB_CHUNK_TOKENS", "4000")),
+            batch_size=int(os.getenv("AGENT_BUILDER_HUB_SYNC_BATCH", "64")),
+        )
+
+    def sync(self,
+             knowledge_hub_id: int,
+             user_id: str,
+             cancel_event: Optional[threading.Event] = None,
+             ) -> Dict:
+        """
+        Bring the vector collection of a knowledge hub in line with its sources. Blocking.
+
+        :param cancel_event: Stops the sync before its next batch once set, the batches already
+            written stay in the manifest.
+        :raises RunCancelledError: If the sync was cancelled.
+        """
+        with self._lock:
+            if knowledge_hub_id in self._running:
+                return {"status": False, "message": "A sync of this knowledge hub is already running"}
+            self._running.add(knowledge_hub_id)
+        try:
+            return self._sync(knowledge_hub_id, user_id, cancel_event)
+        except RunCancelledError:
+            raise
+        except Exception as ex_error:
+            logger.error(f"Error while syncing knowledge hub {knowledge_hub_id}: {ex_error}")
+            return {"status": False, "message": f"Error while syncing knowledge hub: {ex_error}"}
+        finally:
+            with self._lock:
+                self._running.discard(knowledge_hub_id)
+
+    def _sync(self, knowledge_hub_id: int, user_id: str, cancel_event: Optional[threading.Event]) -> Dict:
+        with Session(self.dbmanager.engine) as session:
+            hub = session.exec(
+                select(KnowledgeHub).where(KnowledgeHub.id == knowledge_hub_id, KnowledgeHub.user_id == user_id)
+            ).first()
+            if hub is None:
+                return {"status": False, "message": "Knowledge hub not found"}
+            if not hub.collection_name:
+                return {"status": False, "message": "Knowledge hub has no collection_name"}
+            if not self.qdrant_url:
+                return {"status": False, "message": "AGENT_BUILDER_QDRANT_URI is not set"}
+            # listed before anything is written, a missing source directory aborts the sync
+            sources = self._list_sources(hub)
+
+            backend, embedding_model = parse_embedding_model(
+                hub.embedding_model or DEFAULT_EMBEDDING_MODEL, hub.embedding_backend
+            )
+            embedding_function = embedding_registry.get(embedding_model, backend=backend)
+            client = QdrantClient(self.qdrant_url)
+            ensure_collection(
+                client,
+                hub.collection_name,
+                embedding_registry.dimension(embedding_model, backend=backend),
+                f"{backend}:{embedding_model}",
+            )
+
+            manifest = {
+                document.source: document
+                for document in session.exec(
+                    select(KnowledgeHubDocument).where(KnowledgeHubDocument.knowledge_hub_id == hub.id)
+                ).all()
+            }
+            stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "failed": 0, "chunks": 0, "purged": 0}
+
+            with tempfile.TemporaryDirectory() as download_dir:
+                changed: List[Tuple[str, str, Optional[int], Optional[float], str]] = []
+                for source in sources:
+                    try:
+                        entry = self._check_source(source, manifest.get(source), download_dir)
+                    except Exception as ex_error:
+                        logger.warning(f"Skipping {source}: {ex_error}")
+                        stats["failed"] += 1
+                        continue
+                    document = manifest.get(source)
+                    if entry is None:
+                        stats["unchanged"] += 1
+                    elif document is not None and document.content_hash == entry[4]:
+                        # touched but identical content, only the stat changed
+                        document.size, document.mtime = entry[2], entry[3]
+                        session.add(document)
+                        stats["unchanged"] += 1
+                    else:
+                        changed.append(entry)
+                session.commit()
+
+                for start in range(0, len(changed), self.batch_size):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise RunCancelledError(f"Sync of knowledge hub {knowledge_hub_id} was cancelled")
+                    self._ingest(
+                        session, client, hub, embedding_function, changed[start:start + self.batch_size],
+                        manifest, stats,
+                    )
+
+            listed = set(sources)
+            removed = [document for source, document in manifest.items() if source not in listed]
+            for document in removed:
+                self._delete_points(client, hub.collection_name, document.chunk_ids)
+                session.delete(document)
+            stats["removed"] = len(removed)
+            if hub.synced_at is None:
+                # retrievers ingested into the collection before it had a manifest, under ids of
+                # autogen's scheme. Retrievers stop ingesting once synced_at is set, so drop them
+                known_ids = {
+                    point_id for source, document in manifest.items() if source in listed
+                    for point_id in document.chunk_ids
+                }
+                stats["purged"] = self._delete_unmanaged_points(client, hub.collection_name, known_ids)
+            hub.embedding_backend, hub.embedding_model = backend, embedding_model
+            hub.synced_at = datetime.now()
+            session.add(hub)
+            session.commit()
+
+        logger.info(f"Synced knowledge hub {knowledge_hub_id}: {stats}")
+        return {"status": True, "message": "Knowledge hub synced", "data": stats}
+
+    def remove(self, knowledge_hub_id: int, user_id: str) -> Dict:
+        """
+        Delete the vectors and the manifest of a knowledge hub before the hub is deleted. Blocking.
+
+        The collection is dropped unless another knowledge hub shares it, then only the hub's
+        own chunks are deleted.
+        """
+        with self._lock:
+            if knowledge_hub_id in self._running:
+                return {"status": False, "message": "A sync of this knowledge hub is running"}
+            self._running.add(knowledge_hub_id)
+        try:
+            with Session(self.dbmanager.engine) as session:
+                hub = session.exec(
+                    select(KnowledgeHub).where(KnowledgeHub.id == knowledge_hub_id, KnowledgeHub.user_id == user_id)
+                ).first()
+                if hub is None:
+                    return {"status": False, "message": "Knowledge hub not found"}
+                documents = session.exec(
+                    select(KnowledgeHubDocument).where(KnowledgeHubDocument.knowledge_hub_id == hub.id)
+                ).all()
+                if hub.collection_name and hub.synced_at is not None and self.qdrant_url:
+                    client = QdrantClient(self.qdrant_url)
+                    shared = session.exec(
+                        select(KnowledgeHub.id).where(
+                            KnowledgeHub.collection_name == hub.collection_name, KnowledgeHub.id != hub.id
+                        )
+                    ).first()
+                    if shared is not None:
+                        for document in documents:
+                            self._delete_points(client, hub.collection_name, document.chunk_ids)
+                    elif client.collection_exists(hub.collection_name):
+                        client.delete_collection(hub.collection_name)
+                for document in documents:
+                    session.delete(document)
+                session.commit()
+            return {"status": True, "message": "Knowledge hub vectors deleted"}
+        except Exception as ex_error:
+            logger.error(f"Error while deleting the vectors of knowledge hub {knowledge_hub_id}: {ex_error}")
+            return {"status": False, "message": f"Error while deleting the knowledge hub vectors: {ex_error}"}
+        finally:
+            with self._lock:
+                self._running.discard(knowledge_hub_id)
+
+    @staticmethod
+    def _raise(error: OSError) -> None:
+        raise error
+
+    @classmethod
+    def _list_sources(cls, hub: KnowledgeHub) -> List[str]:
+        """
+        Sources of a knowledge hub.
+
+        :raises OSError: If the hub's file or directory is missing or unreadable. The sync is
+            aborted then, an unmounted or mistyped path must not remove every document.
+        """
+        details = hub.details.strip()
+        if hub.type == KnowledgeHubType.website:
+            return [url if is_url(url) else f"https://{url}" for url in re.split(r"[\s,]+", details) if url]
+        if hub.type == KnowledgeHubType.file:
+            if not os.path.isfile(details) or not os.access(details, os.R_OK):
+                raise FileNotFoundError(f"Knowledge hub file {details} is missing or unreadable")
+            return [details]
+        if not os.path.isdir(details) or not os.access(details, os.R_OK | os.X_OK):
+            raise FileNotFoundError(f"Knowledge hub directory {details} is missing or unreadable")
+        types = {t.lower() for t in TEXT_FORMATS}
+        sources = []
+        for root, dirs, files in os.walk(details, onerror=cls._raise):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            sources += [
+                os.path.join(root, name) for name in files
+                if os.path.splitext(name)[1][1:].lower() in types
+            ]
+        return sorted(sources)
+
+    @staticmethod
+    def _check_source(source: str,
+                      document: Optional[KnowledgeHubDocument],
+                      download_dir: str
+                      ) -> Optional[Tuple[str, str, Optional[int], Optional[float], str]]:
+        """
+        Returns None for sources unchanged since the last sync, otherwise
+        (source, local path, size, mtime, content hash).
+        """
+        if is_url(source):
+            downloaded = get_file_from_url(source, save_path=download_dir)
+            if not downloaded:
+                raise ValueError("download failed")
+            path, mtime = downloaded[0], None
+        else:
+            path = source
+            stat = os.stat(path)
+            mtime = stat.st_mtime
+            if document is not None and document.size == stat.st_size and document.mtime == mtime:
+                return None
+        return source, path, os.path.getsize(path), mtime, file_hash(path)
+
+    def _ingest(self,
+                session: Session,
+                client: QdrantClient,
+                hub: KnowledgeHub,
+                embedding_function,
+                entries: List[Tuple[str, str, Optional[int], Optional[float], str]],
+                manifest: Dict[str, KnowledgeHubDocument],
+                stats: Dict[str, int],
+                ) -> None:
+        points, documents, stale_ids = [], [], []
+        for source, path, size, mtime, content_hash in entries:
+            chunks, _ = split_files_to_chunks([path], self.chunk_token_size)
+            ids = [chunk_id(source, index, chunk) for index, chunk in enumerate(chunks)]
+            points += [
+                (point_id, chunk, {"source": source}) for point_id, chunk in zip(ids, chunks)
+            ]
+            document = manifest.get(source)
+            if document is None:
+                document = KnowledgeHubDocument(knowledge_hub_id=hub.id, source=source, content_hash=content_hash)
+                manifest[source] = document
+                stats["added"] += 1
+            else:
+                new_ids = set(ids)
+                stale_ids += [point_id for point_id in document.chunk_ids if point_id not in new_ids]
+                stats["updated"] += 1
+            document.size, document.mtime, document.content_hash = size, mtime, content_hash
+            document.chunk_ids = ids
+            document.updated_at = datetime.now()
+            documents.append(document)
+
+        if points:
+            vectors = embedding_function([chunk for _, chunk, _ in points])
+            client.upsert(
+                hub.collection_name,
+                points=[
+                    models.PointStruct(
+                        id=point_id,
+                        vector=[float(value) for value in vector],
+                        payload={CONTENT_PAYLOAD_KEY: chunk, METADATA_PAYLOAD_KEY: metadata},
+                    )
+                    for (point_id, chunk, metadata), vector in zip(points, vectors)
+                ],
+            )
+            stats["chunks"] += len(points)
+        self._delete_points(client, hub.collection_name, stale_ids)
+        for document in documents:
+            session.add(document)
+        session.commit()
+
+    @classmethod
+    def _delete_unmanaged_points(cls, client: QdrantClient, collection_name: str, known_ids: Set[str]) -> int:
+        """Delete the points of a collection that are not in the manifest, returns their number."""
+        unmanaged, offset = [], None
+        while True:
+            points, offset = client.scroll(
+                collection_name, limit=1000, offset=offset, with_payload=False, with_vectors=False
+            )
+            unmanaged += [point.id for point in points if str(point.id) not in known_ids]
+            if offset is None:
+                break
+        cls._delete_points(client, collection_name, unmanaged)
+        return len(unmanaged)
+
+    @staticmethod
+    def _delete_points(client: QdrantClient, collection_name: str, point_ids: List[str]) -> None:
+        if point_ids:
+            client.delete(collection_name, points_selector=models.PointIdsList(points=point_ids))
@@ -0,0 +1,212 @@
+import asyncio
+import functools
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+
+
+class RunStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    completed = "completed"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+class RunCancelledError(Exception):
+    """Raised from inside a workflow run once its handle has been cancelled."""
+
+
+class RunHandle:
+    """
+    Tracks a single workflow run submitted to the RunExecutor.
+
+    :param run_id: Unique identifier of the run.
+    """
+
+    def __init__(self, run_id: str) -> None:
+        self.run_id = run_id
+        self.status = RunStatus.queued
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+        self.cancel_event = threading.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        # mark failures as retrieved so runs nobody awaits do not log warnings
+        self.future.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+    @property
+    def done(self) -> bool:
+        return self.future.done()
+
+    def cancel(self) -> bool:
+        """
+        Request cancellation of the run. Queued runs never start, running
+        runs stop at the next agent message they process.
+
+        :return: False if the run had already finished.
+        """
+        if self.done:
+            return False
+        self.cancel_event.set()
+        return True
+
+    async def result(self) -> Any:
+        """Wait for the run to finish and return its result."""
+        return await asyncio.shield(self.future)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "run_id": self.run_id,
+            "status": self.status.value,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error,
+        }
+
+
+class RunExecutor:
+    """
+    Runs blocking workflow executions off the event loop on a thread pool, admitting at most
+    `max_concurrent_runs` runs at a time. Submitted callables receive the run's `cancel_event`
+    keyword argument so they can stop cooperatively.
+
+    Runs stream their messages through the dispatcher of the API process, so they can't run in
+    a process pool. To run workflows in other processes, set AGENT_BUILDER_RUN_QUEUE and start
+    `agent-builder worker` processes, see QueuedRunExecutor.
+
+    :param max_workers: Size of the underlying pool.
+    :param max_concurrent_runs: Maximum number of runs executing at once. Defaults to max_workers.
+    :param max_finished_runs: Number of finished run handles kept for status lookups.
+    :param run_workflow: Blocking callable `(message, session_id, workflow_id, cancel_event)`
+        executing the runs of `submit_workflow`.
+    """
+
+    def __init__(self,
+                 max_workers: Optional[int] = None,
+                 max_concurrent_runs: Optional[int] = None,
+                 max_finished_runs: int = 1000,
+                 run_workflow: Optional[Callable] = None,
+                 ) -> None:
+        self.run_workflow = run_workflow
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.max_concurrent_runs = max_concurrent_runs or self.max_workers
+        self.max_finished_runs = max_finished_runs
+        self.runs: Dict[str, RunHandle] = {}
+        self._finished_runs: "OrderedDict[str, None]" = OrderedDict()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @classmethod
+    def from_env(cls, run_workflow: Optional[Callable] = None) -> "RunExecutor":
+        """Build a RunExecutor from the AGENT_BUILDER_RUN_* environment variables."""
+        max_workers = os.getenv("AGENT_BUILDER_RUN_WORKERS")
+        max_concurrent_runs = os.getenv("AGENT_BUILDER_MAX_CONCURRENT_RUNS")
+        return cls(
+            max_workers=int(max_workers) if max_workers else None,
+            max_concurrent_runs=int(max_concurrent_runs) if max_concurrent_runs else None,
+            run_workflow=run_workflow,
+        )
+
+    def start(self) -> None:
+        if self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="agent-run"
+        )
+        logger.info(
+            f"Run executor started: workers={self.max_workers}, "
+            f"max_concurrent_runs={self.max_concurrent_runs}"
+        )
+
+    def shutdown(self, wait: bool = True) -> None:
+        for handle in list(self.runs.values()):
+            handle.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    def get(self, run_id: str) -> Optional[RunHandle]:
+        return self.runs.get(run_id)
+
+    def active_runs(self) -> int:
+        return sum(1 for handle in self.runs.values() if handle.status == RunStatus.running)
+
+    def submit(self, fn: Callable, *args, run_id: Optional[str] = None, **kwargs) -> RunHandle:
+        """
+        Schedule `fn(*args, **kwargs)` on the pool and return its handle immediately.
+
+        :param fn: The blocking callable to run.
+        :param run_id: Optional identifier for the run. A uuid4 is generated if omitted.
+        :return: The RunHandle tracking the run.
+        """
+        self.start()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_runs)
+
+        handle = RunHandle(run_id or str(uuid.uuid4()))
+        self.runs[handle.run_id] = handle
+        kwargs["cancel_event"] = handle.cancel_event
+
+        handle.task = asyncio.get_running_loop().create_task(
+            self._execute(handle, functools.partial(fn, *args, **kwargs))
+        )
+        return handle
+
+    def submit_workflow(self,
+                        message: Any,
+                        session_id: Optional[int],
+                        workflow_id: int,
+                        run_id: Optional[str] = None,
+                        ) -> RunHandle:
+        """
+        Schedule a session workflow run on the message and return its handle immediately.
+
+        :param message: The datamodel Message to run the workflow on.
+        :param session_id: The session of the message.
+        :param workflow_id: The workflow to run.
+        :param run_id: Optional identifier for the run. A uuid4 is generated if omitted.
+        """
+        if self.run_workflow is None:
+            raise RuntimeError("The run executor has no run_workflow callable to run workflows with")
+        return self.submit(self.run_workflow, message, session_id, workflow_id, run_id=run_id)
+
+    async def _execute(self, handle: RunHandle, call: Callable) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._semaphore:
+                if handle.cancel_event.is_set():
+                    raise RunCancelledError(f"Run {handle.run_id} was cancelled before it started")
+                handle.status = RunStatus.running
+                handle.started_at = datetime.now()
+                result = await loop.run_in_executor(self._executor, call)
+            handle.status = RunStatus.completed
+            handle.future.set_result(result)
+        except RunCancelledError as ex_error:
+            handle.status = RunStatus.cancelled
+            handle.error = str(ex_error)
+            handle.future.set_exception(ex_error)
+        except Exception as ex_error:
+            logger.error(f"Run {handle.run_id} failed: {ex_error}")
+            handle.status = RunStatus.failed
+            handle.error = str(ex_error)
+            handle.future.set_exception(ex_error)
+        finally:
+            handle.finished_at = datetime.now()
+            self._retire(handle)
+
+    def _retire(self, handle: RunHandle) -> None:
+        self._finished_runs[handle.run_id] = None
+        while len(self._finished_runs) > self.max_finished_runs:
+            run_id, _ = self._finished_runs.popitem(last=False)
+            self.runs.pop(run_id, None)
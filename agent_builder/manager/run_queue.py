@@ -0,0 +1,589 @@
+import asyncio
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from agent_builder.manager.run_executor import RunCancelledError, RunExecutor, RunHandle, RunStatus
+
+
+class QueuedRun:
+    """
+    A run taken off the queue by a worker.
+
+    :param run_id: Identifier of the run.
+    :param payload: JSON payload describing the run.
+    :param receipt: Backend specific token used to acknowledge the run.
+    :param consumer: Name of the consumer holding the run.
+    """
+
+    def __init__(self,
+                 run_id: str,
+                 payload: Dict[str, Any],
+                 receipt: Any = None,
+                 consumer: Optional[str] = None,
+                 ) -> None:
+        self.run_id = run_id
+        self.payload = payload
+        self.receipt = receipt
+        self.consumer = consumer
+
+
+class RunSubscription(ABC):
+    """Receives the events a worker publishes for a single run."""
+
+    @abstractmethod
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Wait for the next event of the run. Returns None if none arrived within `timeout` seconds."""
+
+    async def close(self) -> None:
+        pass
+
+
+class RunQueue(ABC):
+    """
+    A queue of workflow runs shared by the API and `agent-builder worker` processes.
+
+    The API side is async: it subscribes to a run's events, enqueues the run and requests
+    cancellation. The worker side is blocking: it consumes runs, publishes their events,
+    heartbeats them while they execute and acknowledges them once done. Runs whose worker
+    stops heartbeating are handed to another worker.
+    """
+
+    @abstractmethod
+    async def aenqueue(self, run_id: str, payload: Dict[str, Any]) -> None:
+        """Add a run to the queue."""
+
+    @abstractmethod
+    async def subscribe(self, run_id: str) -> RunSubscription:
+        """Subscribe to the events of a run, before it is enqueued so no event is missed."""
+
+    @abstractmethod
+    async def cancel(self, run_id: str) -> None:
+        """Ask the worker of a run to cancel it, or to skip it if it did not start yet."""
+
+    @abstractmethod
+    def consume(self, consumer: str, block_ms: int = 1000) -> Optional[QueuedRun]:
+        """Take the next run off the queue, waiting up to `block_ms`. Returns None if there is none."""
+
+    @abstractmethod
+    def ack(self, run: QueuedRun) -> None:
+        """Mark a consumed run as done so it is never handed out again."""
+
+    @abstractmethod
+    def heartbeat(self, run: QueuedRun) -> None:
+        """Renew the lease of a consumed run that is still executing, so it is not reclaimed."""
+
+    @abstractmethod
+    def publish(self, run_id: str, event: Dict[str, Any]) -> None:
+        """Send an event of a run to its subscribers."""
+
+    @abstractmethod
+    def is_cancelled(self, run_id: str) -> bool:
+        """Whether cancellation of a run was requested."""
+
+    def close(self) -> None:
+        pass
+
+
+class RedisRunSubscription(RunSubscription):
+
+    def __init__(self, pubsub: Any) -> None:
+        self.pubsub = pubsub
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            wait = 1.0 if deadline is None else max(0.0, min(1.0, deadline - time.monotonic()))
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=wait)
+            if message is not None and message["type"] == "message":
+                return json.loads(message["data"])
+        return None
+
+    async def close(self) -> None:
+        await self.pubsub.unsubscribe()
+        await self.pubsub.aclose()
+
+
+class RedisStreamRunQueue(RunQueue):
+    """
+    Run queue backed by a Redis stream and consumer group. Workers heartbeat the runs they
+    execute by re-claiming them, which resets their idle time. Runs left unacknowledged and
+    without heartbeat for `claim_idle_ms` are reclaimed by other workers, so runs survive worker
+    crashes. Run events are published on a pub/sub channel per run.
+
+    :param url: Redis connection url.
+    :param stream: Name of the stream holding queued runs.
+    :param group: Name of the worker consumer group.
+    :param claim_idle_ms: Time without heartbeat after which an unacknowledged run is handed to
+        another worker. Must be well above the worker heartbeat interval.
+    :param max_length: Approximate maximum number of entries kept in the stream.
+    """
+
+    def __init__(self,
+                 url: str = "redis://localhost:6379/0",
+                 stream: str = "agent_builder:runs",
+                 group: str = "agent_builder_workers",
+                 claim_idle_ms: int = 60 * 1000,
+                 max_length: int = 10000,
+                 ) -> None:
+        import redis
+        import redis.asyncio as redis_conn
+
+        self.url = url
+        self.stream = stream
+        self.group = group
+        self.claim_idle_ms = claim_idle_ms
+        self.max_length = max_length
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._aredis = redis_conn.Redis.from_url(url, decode_responses=True)
+        self._group_ready = False
+
+    @staticmethod
+    def _channel(run_id: str) -> str:
+        return f"agent_builder:run:{run_id}"
+
+    @staticmethod
+    def _cancel_key(run_id: str) -> str:
+        return f"agent_builder:run_cancel:{run_id}"
+
+    async def aenqueue(self, run_id: str, payload: Dict[str, Any]) -> None:
+        await self._aredis.xadd(
+            self.stream,
+            {"run_id": run_id, "payload": json.dumps(payload)},
+            maxlen=self.max_length,
+            approximate=True,
+        )
+
+    async def subscribe(self, run_id: str) -> RunSubscription:
+        pubsub = self._aredis.pubsub()
+        await pubsub.subscribe(self._channel(run_id))
+        return RedisRunSubscription(pubsub)
+
+    async def cancel(self, run_id: str) -> None:
+        await self._aredis.set(self._cancel_key(run_id), 1, ex=3600)
+
+    def _ensure_group(self) -> None:
+        import redis
+
+        if self._group_ready:
+            return
+        try:
+            self._redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as ex_error:
+            if "BUSYGROUP" not in str(ex_error):
+                raise
+        self._group_ready = True
+
+    def consume(self, consumer: str, block_ms: int = 1000) -> Optional[QueuedRun]:
+        self._ensure_group()
+        # runs left pending by a crashed worker come first
+        claimed = self._redis.xautoclaim(
+            self.stream, self.group, consumer, min_idle_time=self.claim_idle_ms, start_id="0-0", count=1
+        )
+        entries = claimed[1] if claimed else []
+        if not entries:
+            response = self._redis.xreadgroup(
+                self.group, consumer, {self.stream: ">"}, count=1, block=block_ms
+            )
+            entries = response[0][1] if response else []
+        if not entries:
+            return None
+        entry_id, fields = entries[0]
+        return QueuedRun(fields["run_id"], json.loads(fields["payload"]), receipt=entry_id, consumer=consumer)
+
+    def ack(self, run: QueuedRun) -> None:
+        self._redis.xack(self.stream, self.group, run.receipt)
+
+    def heartbeat(self, run: QueuedRun) -> None:
+        # claiming an entry the consumer already owns only resets its idle time
+        self._redis.xclaim(
+            self.stream, self.group, run.consumer, min_idle_time=0, message_ids=[run.receipt], justid=True
+        )
+
+    def publish(self, run_id: str, event: Dict[str, Any]) -> None:
+        self._redis.publish(self._channel(run_id), json.dumps(event, default=str))
+
+    def is_cancelled(self, run_id: str) -> bool:
+        return bool(self._redis.exists(self._cancel_key(run_id)))
+
+    def close(self) -> None:
+        self._redis.close()
+
+
+class MemoryRunSubscription(RunSubscription):
+
+    def __init__(self, run_queue: "InMemoryRunQueue", run_id: str) -> None:
+        self.run_queue = run_queue
+        self.run_id = run_id
+        self.loop = asyncio.get_running_loop()
+        self.events: asyncio.Queue = asyncio.Queue()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(self.events.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self) -> None:
+        self.run_queue._unsubscribe(self)
+
+
+class InMemoryRunQueue(RunQueue):
+    """Run queue living in the API process, served by in-process worker threads. Meant for tests."""
+
+    def __init__(self) -> None:
+        self._runs: "queue.Queue[QueuedRun]" = queue.Queue()
+        self._subscriptions: Dict[str, List[MemoryRunSubscription]] = defaultdict(list)
+        self._cancelled = set()
+        self._lock = threading.Lock()
+
+    async def aenqueue(self, run_id: str, payload: Dict[str, Any]) -> None:
+        self._runs.put(QueuedRun(run_id, json.loads(json.dumps(payload))))
+
+    async def subscribe(self, run_id: str) -> RunSubscription:
+        subscription = MemoryRunSubscription(self, run_id)
+        with self._lock:
+            self._subscriptions[run_id].append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: MemoryRunSubscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.run_id, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.run_id, None)
+
+    async def cancel(self, run_id: str) -> None:
+        with self._lock:
+            self._cancelled.add(run_id)
+
+    def consume(self, consumer: str, block_ms: int = 1000) -> Optional[QueuedRun]:
+        try:
+            return self._runs.get(timeout=block_ms / 1000)
+        except queue.Empty:
+            return None
+
+    def ack(self, run: QueuedRun) -> None:
+        with self._lock:
+            self._cancelled.discard(run.run_id)
+
+    def heartbeat(self, run: QueuedRun) -> None:
+        # runs never outlive the process serving them, so there is nothing to reclaim
+        pass
+
+    def publish(self, run_id: str, event: Dict[str, Any]) -> None:
+        event = json.loads(json.dumps(event, default=str))
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(run_id, []))
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.events.put_nowait, event)
+
+    def is_cancelled(self, run_id: str) -> bool:
+        with self._lock:
+            return run_id in self._cancelled
+
+
+class SQLiteRunSubscription(RunSubscription):
+
+    def __init__(self, run_queue: "SQLiteRunQueue", run_id: str, poll_interval: float) -> None:
+        self.run_queue = run_queue
+        self.run_id = run_id
+        self.poll_interval = poll_interval
+        self.last_event_id = 0
+        self.pending: List[Dict[str, Any]] = []
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.pending:
+            rows = await asyncio.to_thread(self.run_queue._events_after, self.run_id, self.last_event_id)
+            for event_id, event in rows:
+                self.last_event_id = event_id
+                self.pending.append(json.loads(event))
+            if not self.pending:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+                await asyncio.sleep(self.poll_interval)
+        return self.pending.pop(0)
+
+
+class SQLiteRunQueue(RunQueue):
+    """
+    Run queue stored in a SQLite file, so an API process and worker processes on the same
+    machine can share it without Redis. Meant for tests and single host setups. Running runs
+    without heartbeat for `claim_timeout` are handed to another worker.
+
+    :param path: Path of the SQLite database file.
+    :param poll_interval: Seconds between polls for new runs and run events.
+    :param claim_timeout: Seconds without heartbeat after which a running run is reclaimed.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.1, claim_timeout: float = 60) -> None:
+        self.path = path
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        with self._connect() as connection:
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    consumer TEXT,
+                    cancelled INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    heartbeat_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS run_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT NOT NULL,
+                    event TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS run_events_run_id ON run_events (run_id, id);
+                """
+            )
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(runs)")]
+            if "heartbeat_at" not in columns:
+                connection.execute("ALTER TABLE runs ADD COLUMN heartbeat_at REAL")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _execute(self, statement: str, parameters: Tuple = ()) -> List[Tuple]:
+        connection = self._connect()
+        try:
+            return connection.execute(statement, parameters).fetchall()
+        finally:
+            connection.close()
+
+    def _events_after(self, run_id: str, event_id: int) -> List[Tuple[int, str]]:
+        return self._execute(
+            "SELECT id, event FROM run_events WHERE run_id = ? AND id > ? ORDER BY id",
+            (run_id, event_id),
+        )
+
+    async def aenqueue(self, run_id: str, payload: Dict[str, Any]) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO runs (run_id, payload, created_at) VALUES (?, ?, ?)",
+            (run_id, json.dumps(payload), time.time()),
+        )
+
+    async def subscribe(self, run_id: str) -> RunSubscription:
+        return SQLiteRunSubscription(self, run_id, self.poll_interval)
+
+    async def cancel(self, run_id: str) -> None:
+        await asyncio.to_thread(
+            self._execute, "UPDATE runs SET cancelled = 1 WHERE run_id = ?", (run_id,)
+        )
+
+    def consume(self, consumer: str, block_ms: int = 1000) -> Optional[QueuedRun]:
+        deadline = time.time() + block_ms / 1000
+        while True:
+            connection = self._connect()
+            try:
+                now = time.time()
+                connection.execute("BEGIN IMMEDIATE")
+                # runs left running by a crashed worker come back once their heartbeat is stale
+                row = connection.execute(
+                    "SELECT run_id, payload FROM runs WHERE status = 'queued' "
+                    "OR (status = 'running' AND heartbeat_at < ?) ORDER BY created_at LIMIT 1",
+                    (now - self.claim_timeout,),
+                ).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE runs SET status = 'running', consumer = ?, heartbeat_at = ? WHERE run_id = ?",
+                        (consumer, now, row[0]),
+                    )
+                connection.execute("COMMIT")
+            finally:
+                connection.close()
+            if row is not None:
+                return QueuedRun(row[0], json.loads(row[1]), consumer=consumer)
+            if time.time() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def ack(self, run: QueuedRun) -> None:
+        # a run reclaimed by another worker belongs to that worker now
+        self._execute(
+            "UPDATE runs SET status = 'done' WHERE run_id = ? AND consumer = ?", (run.run_id, run.consumer)
+        )
+
+    def heartbeat(self, run: QueuedRun) -> None:
+        self._execute(
+            "UPDATE runs SET heartbeat_at = ? WHERE run_id = ? AND status = 'running' AND consumer = ?",
+            (time.time(), run.run_id, run.consumer),
+        )
+
+    def publish(self, run_id: str, event: Dict[str, Any]) -> None:
+        self._execute(
+            "INSERT INTO run_events (run_id, event) VALUES (?, ?)",
+            (run_id, json.dumps(event, default=str)),
+        )
+
+    def is_cancelled(self, run_id: str) -> bool:
+        rows = self._execute("SELECT cancelled FROM runs WHERE run_id = ?", (run_id,))
+        return bool(rows and rows[0][0])
+
+
+def run_queue_from_url(url: str) -> RunQueue:
+    """
+    Create a run queue from a url: redis://..., sqlite:///path/to/queue.db or memory://.
+
+    :param url: The queue url.
+    :return: The run queue.
+    """
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStreamRunQueue(url=url)
+    if url.startswith("sqlite:///"):
+        return SQLiteRunQueue(path=url[len("sqlite:///"):])
+    if url.startswith("memory://"):
+        return InMemoryRunQueue()
+    raise ValueError(f"Invalid run queue url: {url}. Valid schemes are: redis://, sqlite:///, memory://")
+
+
+class QueuedRunHandle(RunHandle):
+    """
+    RunHandle of a run executed by a worker. Cancelling it notifies the worker through the queue.
+    A run cancelled before any worker picked it up is resolved right away, since there may be no
+    worker to report it.
+    """
+
+    def __init__(self, run_id: str, run_queue: RunQueue) -> None:
+        super().__init__(run_id)
+        self.run_queue = run_queue
+
+    def cancel(self) -> bool:
+        if not super().cancel():
+            return False
+        asyncio.get_running_loop().create_task(self.run_queue.cancel(self.run_id))
+        if self.status == RunStatus.queued:
+            self.status = RunStatus.cancelled
+            self.error = f"Run {self.run_id} was cancelled before it started"
+            self.future.set_exception(RunCancelledError(self.error))
+        return True
+
+
+class QueuedRunExecutor(RunExecutor):
+    """
+    Drop-in replacement for RunExecutor that enqueues runs for `agent-builder worker` processes
+    instead of running them in the API process. Socket messages the worker publishes for a run
+    are handed to `on_event`, and the run result resolves the handle.
+
+    Runs no worker starts within `start_timeout` seconds, and running runs silent for
+    `idle_timeout` seconds (workers heartbeat every few seconds), fail with a TimeoutError and
+    are cancelled on the queue so a late worker skips them.
+
+    :param run_queue: The queue shared with the workers.
+    :param on_event: Coroutine function receiving every socket message of a run.
+    :param start_timeout: Seconds a run may wait in the queue for a worker.
+    :param idle_timeout: Seconds a running run may go without any event.
+    """
+
+    def __init__(self,
+                 run_queue: RunQueue,
+                 on_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+                 max_finished_runs: int = 1000,
+                 start_timeout: float = 300,
+                 idle_timeout: float = 120,
+                 ) -> None:
+        super().__init__(max_finished_runs=max_finished_runs)
+        self.run_queue = run_queue
+        self.on_event = on_event
+        self.start_timeout = start_timeout
+        self.idle_timeout = idle_timeout
+
+    def start(self) -> None:
+        pass
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.run_queue.close()
+
+    def submit(self, fn: Callable, *args, run_id: Optional[str] = None, **kwargs) -> RunHandle:
+        raise NotImplementedError("Workers only run workflows, use submit_workflow")
+
+    def submit_workflow(self,
+                        message: Any,
+                        session_id: Optional[int],
+                        workflow_id: int,
+                        run_id: Optional[str] = None,
+                        ) -> RunHandle:
+        payload = {
+            "message": message.model_dump(mode="json", exclude={"created_at", "updated_at"}),
+            "session_id": session_id,
+            "workflow_id": workflow_id,
+        }
+        return self.enqueue(payload, run_id=run_id)
+
+    def enqueue(self, payload: Dict[str, Any], run_id: Optional[str] = None) -> RunHandle:
+        """
+        Enqueue a run and return its handle immediately.
+
+        :param payload: JSON serializable description of the run.
+        :param run_id: Optional identifier for the run. A uuid4 is generated if omitted.
+        """
+        handle = QueuedRunHandle(run_id or str(uuid.uuid4()), self.run_queue)
+        self.runs[handle.run_id] = handle
+        handle.task = asyncio.get_running_loop().create_task(self._follow(handle, payload))
+        return handle
+
+    async def _follow(self, handle: RunHandle, payload: Dict[str, Any]) -> None:
+        # subscribe before enqueueing so no event of the run can be missed
+        subscription = await self.run_queue.subscribe(handle.run_id)
+        try:
+            await self.run_queue.aenqueue(handle.run_id, payload)
+            deadline = time.monotonic() + self.start_timeout
+            while not handle.done:
+                # wake up regularly so a handle cancelled while queued stops being followed
+                event = await subscription.get(timeout=max(0.0, min(1.0, deadline - time.monotonic())))
+                if event is None:
+                    if handle.done or time.monotonic() < deadline:
+                        continue
+                    if handle.status == RunStatus.queued:
+                        raise TimeoutError(f"No worker started run {handle.run_id} within {self.start_timeout}s")
+                    raise TimeoutError(f"Run {handle.run_id} sent no event for {self.idle_timeout}s")
+                event_type = event.get("type")
+                if event_type == "run_status":
+                    handle.status = RunStatus(event["data"]["status"])
+                    handle.started_at = handle.started_at or datetime.now()
+                elif event_type == "socket_message":
+                    if self.on_event is not None:
+                        await self.on_event(event["data"])
+                elif event_type == "run_result":
+                    handle.status = RunStatus.completed
+                    handle.future.set_result(event["data"])
+                elif event_type == "run_cancelled":
+                    handle.status = RunStatus.cancelled
+                    handle.error = event["data"]["message"]
+                    handle.future.set_exception(RunCancelledError(handle.error))
+                elif event_type == "run_error":
+                    handle.status = RunStatus.failed
+                    handle.error = event["data"]["message"]
+                    handle.future.set_exception(RuntimeError(handle.error))
+                if handle.status != RunStatus.queued:
+                    deadline = time.monotonic() + self.idle_timeout
+        except Exception as ex_error:
+            logger.error(f"Lost track of queued run {handle.run_id}: {ex_error}")
+            if not handle.done:
+                handle.status = RunStatus.failed
+                handle.error = str(ex_error)
+                handle.future.set_exception(ex_error)
+            if isinstance(ex_error, TimeoutError):
+                try:
+                    await self.run_queue.cancel(handle.run_id)
+                except Exception as cancel_error:
+                    logger.error(f"Could not cancel timed out run {handle.run_id}: {cancel_error}")
+        finally:
+            await subscription.close()
+            handle.finished_at = datetime.now()
+            self._retire(handle)
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+
+from agent_builder.manager.agent_orchestrator import AgentOrchestrator
+
+
+class WarmSessionCache:
+    """
+    LRU of live AgentOrchestrators keyed by session, so the next turn of a session reuses the
+    built agents instead of compiling and loading the workflow again. The agents' conversations
+    are reset to the stored session messages on every turn, see `AgentOrchestrator.prepare_run`.
+
+    An orchestrator is checked out for the duration of a run, so concurrent runs of one session
+    never share agents, and only checked back in after a successful run. A warm orchestrator is
+    only reused when the workflow fingerprint, the work dir and the number of stored session
+    messages still match; anything else falls back to a cold build.
+
+    :param max_sessions: Maximum number of warm sessions kept, least recently used are evicted first.
+    :param idle_ttl: Seconds a warm session is kept without a new turn.
+    :param max_chars: Approximate budget in characters of all warm conversations together.
+    """
+
+    def __init__(self, max_sessions: int = 64, idle_ttl: float = 900, max_chars: int = 20_000_000) -> None:
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_chars = max_chars
+        # session key -> (last used, size, orchestrator)
+        self._sessions: "OrderedDict[str, Tuple[float, int, AgentOrchestrator]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "WarmSessionCache":
+        return cls(
+            max_sessions=int(os.getenv("AGENT_BUILDER_WARM_SESSIONS", "64")),
+            idle_ttl=float(os.getenv("AGENT_BUILDER_WARM_SESSION_TTL", "900")),
+            max_chars=int(os.getenv("AGENT_BUILDER_WARM_SESSION_MAX_CHARS", "20000000")),
+        )
+
+    def checkout(self,
+                 session_key: str,
+                 fingerprint: Optional[str],
+                 work_dir: str,
+                 history_length: int
+                 ) -> Optional[AgentOrchestrator]:
+        """Remove and return the warm orchestrator of a session if it is still valid for this turn."""
+        with self._lock:
+            self._expire()
+            entry = self._sessions.pop(session_key, None)
+        orchestrator = entry[2] if entry is not None else None
+        if (
+            orchestrator is None
+            or fingerprint is None
+            or orchestrator.fingerprint != fingerprint
+            or str(orchestrator.work_dir) != str(work_dir)
+            or orchestrator.history_length != history_length
+        ):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return orchestrator
+
+    def checkin(self, session_key: str, orchestrator: AgentOrchestrator) -> None:
+        """Keep an orchestrator warm after a successful run."""
+        if self.max_sessions <= 0 or orchestrator.fingerprint is None:
+            return
+        size = orchestrator.conversation_size()
+        if size > self.max_chars:
+            return
+        with self._lock:
+            self._sessions[session_key] = (time.monotonic(), size, orchestrator)
+            self._sessions.move_to_end(session_key)
+            total = sum(entry[1] for entry in self._sessions.values())
+            while self._sessions and (len(self._sessions) > self.max_sessions or total > self.max_chars):
+                evicted_key, (_, evicted_size, _) = self._sessions.popitem(last=False)
+                total -= evicted_size
+                logger.debug(f"Evicted warm session {evicted_key}")
+
+    def discard(self, session_key: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_key, None)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "chars": sum(entry[1] for entry in self._sessions.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self.idle_ttl
+        expired = [key for key, entry in self._sessions.items() if entry[0] < deadline]
+        for key in expired:
+            del self._sessions[key]
+
+
+warm_session_cache = WarmSessionCache.from_env()
@@ -0,0 +1,150 @@
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from loguru import logger
+
+from agent_builder.datamodel import Message, SocketMessage
+from agent_builder.manager.chatmanager import ChatManager
+from agent_builder.manager.run_executor import RunCancelledError, RunStatus
+from agent_builder.manager.run_queue import QueuedRun, RunQueue
+from agent_builder.manager.workflow_runner import WorkflowRunner
+
+
+class RunWorker:
+    """
+    Consumes workflow runs from a RunQueue and executes them, publishing agent socket messages,
+    status changes and the final result back on the queue. Active runs are heartbeated every
+    `heartbeat_interval` seconds so the queue does not hand them to another worker, and a
+    `run_heartbeat` event tells the API side the run is still alive.
+
+    :param run_queue: The queue to consume runs from.
+    :param runner: The WorkflowRunner executing the runs.
+    :param concurrency: Number of runs executed at once.
+    :param name: Consumer name of this worker. Defaults to host name and pid.
+    :param cancel_poll_interval: Seconds between checks for cancelled runs.
+    :param heartbeat_interval: Seconds between heartbeats of active runs.
+    """
+
+    def __init__(self,
+                 run_queue: RunQueue,
+                 runner: WorkflowRunner,
+                 concurrency: int = 1,
+                 name: Optional[str] = None,
+                 cancel_poll_interval: float = 1.0,
+                 heartbeat_interval: float = 10.0,
+                 ) -> None:
+        self.run_queue = run_queue
+        self.runner = runner
+        self.concurrency = concurrency
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.cancel_poll_interval = cancel_poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self._active: Dict[str, Tuple[QueuedRun, threading.Event]] = {}
+        self._active_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        """Start the consumer threads and the watcher of active runs."""
+        for index in range(self.concurrency):
+            thread = threading.Thread(
+                target=self._consume_loop, args=(f"{self.name}-{index}",),
+                name=f"run-worker-{index}", daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+        watcher = threading.Thread(target=self._watch_active_runs, name="run-worker-watch", daemon=True)
+        watcher.start()
+        self._threads.append(watcher)
+        logger.info(f"Run worker {self.name} started with concurrency {self.concurrency}")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop_event.set()
+        with self._active_lock:
+            for _, cancel_event in self._active.values():
+                cancel_event.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+    def run_forever(self) -> None:
+        """Start the worker and block until interrupted."""
+        self.start()
+        try:
+            while not self._stop_event.is_set():
+                time.sleep(1)
+        except KeyboardInterrupt:
+            logger.info(f"Run worker {self.name} stopping")
+        finally:
+            self.stop(timeout=30)
+            self.run_queue.close()
+
+    def _consume_loop(self, consumer: str) -> None:
+        while not self._stop_event.is_set():
+            try:
+                run = self.run_queue.consume(consumer)
+            except Exception as ex_error:
+                logger.error(f"Error while consuming runs: {ex_error}")
+                time.sleep(1)
+                continue
+            if run is not None:
+                self._execute(run)
+
+    def _execute(self, run: QueuedRun) -> None:
+        run_id = run.run_id
+        cancel_event = threading.Event()
+        with self._active_lock:
+            self._active[run_id] = (run, cancel_event)
+
+        def publish_socket_message(message: Union[SocketMessage, Dict[str, Any]]) -> None:
+            if isinstance(message, SocketMessage):
+                message = message.model_dump(mode="json")
+            self.run_queue.publish(run_id, {"type": "socket_message", "data": message})
+
+        try:
+            if self.run_queue.is_cancelled(run_id):
+                raise RunCancelledError(f"Run {run_id} was cancelled before it started")
+            self.run_queue.publish(run_id, {"type": "run_status", "data": {"status": RunStatus.running.value}})
+            payload = run.payload
+            response = self.runner.run(
+                message=Message(**payload["message"]),
+                session_id=payload.get("session_id"),
+                workflow_id=payload["workflow_id"],
+                chat_manager=ChatManager(send_message_function=publish_socket_message),
+                cancel_event=cancel_event,
+            )
+            self.run_queue.publish(run_id, {"type": "run_result", "data": response})
+        except RunCancelledError as ex_error:
+            self.run_queue.publish(run_id, {"type": "run_cancelled", "data": {"message": str(ex_error)}})
+        except Exception as ex_error:
+            logger.error(f"Run {run_id} failed: {ex_error}")
+            self.run_queue.publish(run_id, {"type": "run_error", "data": {"message": str(ex_error)}})
+        finally:
+            with self._active_lock:
+                self._active.pop(run_id, None)
+            self.run_queue.ack(run)
+
+    def _watch_active_runs(self) -> None:
+        last_heartbeat = time.monotonic()
+        while not self._stop_event.wait(self.cancel_poll_interval):
+            with self._active_lock:
+                active = list(self._active.values())
+            for run, cancel_event in active:
+                try:
+                    if self.run_queue.is_cancelled(run.run_id):
+                        cancel_event.set()
+                except Exception as ex_error:
+                    logger.error(f"Error while checking cancellation of run {run.run_id}: {ex_error}")
+            if time.monotonic() - last_heartbeat >= self.heartbeat_interval:
+                last_heartbeat = time.monotonic()
+                self._heartbeat([run for run, _ in active])
+
+    def _heartbeat(self, runs: List[QueuedRun]) -> None:
+        for run in runs:
+            try:
+                self.run_queue.heartbeat(run)
+                self.run_queue.publish(run.run_id, {"type": "run_heartbeat", "data": {"worker": self.name}})
+            except Exception as ex_error:
+                logger.error(f"Error while heartbeating run {run.run_id}: {ex_error}")
@@ -0,0 +1,81 @@
+import os
+import threading
+import traceback
+from typing import Dict, Optional
+
+from agent_builder.database import DBManager, workflow_from_id
+from agent_builder.datamodel import Message, Response
+from agent_builder.manager.chatmanager import ChatManager
+from agent_builder.manager.history import HistoryManager
+from agent_builder.manager.run_executor import RunCancelledError
+from agent_builder.manager.workspace import WorkspaceManager
+from agent_builder.utils import md5_hash
+
+
+class WorkflowRunner:
+    """
+    Executes a workflow run for a session message: loads the history and workflow, runs the
+    agents and persists both messages. Shared by the API process and `agent-builder worker`.
+
+    :param dbmanager: The database manager.
+    :param files_static_root: Root folder of the per user work directories.
+    """
+
+    def __init__(self, dbmanager: DBManager, files_static_root: str) -> None:
+        self.dbmanager = dbmanager
+        self.files_static_root = files_static_root
+        self.history_manager = HistoryManager(dbmanager)
+        self.workspace_manager = WorkspaceManager.from_env(os.path.join(files_static_root, "user"))
+
+    def run(self,
+            message: Message,
+            session_id: Optional[int],
+            workflow_id: int,
+            chat_manager: ChatManager,
+            cancel_event: Optional[threading.Event] = None,
+            ) -> Dict:
+        """Runs a workflow on provided message. Blocking."""
+        try:
+            user_message_history = (
+                self.dbmanager.get(
+                    Message,
+                    filters={"user_id": message.user_id, "session_id": message.session_id},
+                    return_json=True,
+                ).data
+                if session_id is not None
+                else []
+            )
+            workflow = workflow_from_id(workflow_id, dbmanager=self.dbmanager)
+            user_message_history, history_trimmed = self.history_manager.prepare(
+                session_id, user_message_history, workflow
+            )
+            user_dir = os.path.join(
+                self.files_static_root, "user", md5_hash(message.user_id)
+            )
+            self.workspace_manager.check_quota(user_dir)
+            # save incoming message
+            self.dbmanager.upsert(message)
+
+            os.makedirs(user_dir, exist_ok=True)
+            agent_response: Message = chat_manager.chat(
+                message=message,
+                history=user_message_history,
+                user_dir=user_dir,
+                workflow=workflow,
+                connection_id=message.connection_id,
+                cancel_event=cancel_event,
+                warm_session=not history_trimmed,
+                workspace_manager=self.workspace_manager,
+            )
+
+            response: Response = self.dbmanager.upsert(agent_response)
+            self.history_manager.schedule_summary(session_id, message.user_id, workflow)
+            return response.model_dump(mode="json")
+        except RunCancelledError:
+            raise
+        except Exception as ex_error:
+            print(traceback.format_exc())
+            return {
+                "status": False,
+                "message": "Error occurred while processing message: " + str(ex_error),
+            }
@@ -0,0 +1,320 @@
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from agent_builder.utils import IGNORED_FILES, describe_file, get_modified_files, is_ignored_file
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+    inotify_flags = None
+
+# path -> (mtime_ns, size)
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+def snapshot_directory(directory: str) -> Snapshot:
+    """Modification time and size of every visible file below a directory."""
+    snapshot: Snapshot = {}
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        try:
+            entries = list(os.scandir(current))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in IGNORED_FILES:
+                    pending.append(entry.path)
+            elif entry.is_file() and not is_ignored_file(entry.name):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def directory_size(directory: str) -> int:
+    return sum(size for _, size in snapshot_directory(directory).values())
+
+
+class WorkspaceRun:
+    """
+    Records the files a run creates or modifies in its work directory. Used as a context
+    manager around the run, `files` holds the changed files afterwards.
+
+    With inotify the kernel reports the written files and only the directories are visited to
+    place the watches. Without it, the files are diffed against a snapshot, the previous run's
+    final snapshot of the work directory is reused so a run costs a single scan.
+    """
+
+    def __init__(self, manager: "WorkspaceManager", work_dir: str) -> None:
+        self.manager = manager
+        self.work_dir = str(work_dir)
+        self.files: List[Dict[str, str]] = []
+        self.bytes_written = 0
+        self._inotify = None
+        self._watches: Dict[int, str] = {}
+        self._snapshot: Optional[Snapshot] = None
+        self._start_time = 0.0
+
+    def __enter__(self) -> "WorkspaceRun":
+        self._start_time = time.time()
+        self.manager._acquire(self.work_dir)
+        if self.manager.use_inotify:
+            try:
+                self._start_inotify()
+                return self
+            except OSError as ex_error:
+                # e.g. the inotify watch limit of the user is reached
+                logger.warning(f"inotify unavailable for {self.work_dir}, using snapshots: {ex_error}")
+                self._close_inotify()
+        self._snapshot = self.manager._cached_snapshot(self.work_dir)
+        if self._snapshot is None:
+            self._snapshot = snapshot_directory(self.work_dir)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if self._inotify is not None:
+                changed = self._inotify_changes()
+            else:
+                changed = self._snapshot_changes()
+            if changed is None:
+                # events were lost, fall back to the modification time window
+                self.files = get_modified_files(self._start_time, time.time(), source_dir=self.work_dir)
+            else:
+                self.files = [describe_file(path) for path in sorted(changed)]
+                self.files.sort(key=lambda x: x["extension"])
+        finally:
+            self._close_inotify()
+            self.manager._release(self.work_dir, self.bytes_written)
+
+    def _start_inotify(self) -> None:
+        self._inotify = INotify()
+        mask = inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE
+        for directory, dirs, _ in os.walk(self.work_dir):
+            dirs[:] = [d for d in dirs if d not in IGNORED_FILES]
+            self._watches[self._inotify.add_watch(directory, mask)] = directory
+
+    def _close_inotify(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _inotify_changes(self) -> Optional[Set[str]]:
+        changed: Set[str] = set()
+        for event in self._inotify.read(timeout=0):
+            if event.mask & inotify_flags.Q_OVERFLOW:
+                return None
+            directory = self._watches.get(event.wd)
+            if directory is None or not event.name:
+                continue
+            path = os.path.join(directory, event.name)
+            if event.mask & inotify_flags.ISDIR:
+                if event.name not in IGNORED_FILES:
+                    # everything below a directory created during the run is new
+                    changed.update(snapshot_directory(path))
+            elif not is_ignored_file(event.name) and event.mask & (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO):
+                changed.add(path)
+        changed = {path for path in changed if os.path.isfile(path)}
+        self.bytes_written = sum(os.path.getsize(path) for path in changed)
+        return changed
+
+    def _snapshot_changes(self) -> Set[str]:
+        snapshot = snapshot_directory(self.work_dir)
+        start_ns = int(self._start_time * 1e9)
+        changed = set()
+        for path, (mtime_ns, size) in snapshot.items():
+            # the cached snapshot can predate files written while the agents were built
+            if snapshot.get(path) != self._snapshot.get(path) and mtime_ns >= start_ns:
+                changed.add(path)
+                self.bytes_written += size - self._snapshot.get(path, (0, 0))[1]
+        # deleted files free their space in the quota
+        self.bytes_written -= sum(size for path, (_, size) in self._snapshot.items() if path not in snapshot)
+        self.manager._store_snapshot(self.work_dir, snapshot)
+        return changed
+
+
+class WorkspaceManager:
+    """
+    Manages the per session work directories below `root` (`<user>/<session>/<date>`): creates
+    them, records the files each run changes, enforces per user quotas and removes workspaces
+    that were not used for `retention_days` in a background thread.
+
+    :param root: Directory holding the per user work directories.
+    :param tmpfs_root: Directory on a tmpfs to create the workspaces in, they are linked into `root`.
+    :param quota_bytes: Maximum size of all workspaces of a user, 0 disables the quota. The usage
+        is measured by the garbage collection and updated after every run.
+    :param retention_days: Days after the last change a workspace is removed, 0 keeps them.
+    :param gc_interval: Seconds between garbage collections.
+    :param use_inotify: Whether to record changes with inotify, requires inotify_simple.
+    :param max_snapshots: Maximum number of work directory snapshots kept between runs.
+    """
+
+    def __init__(self,
+                 root: str,
+                 tmpfs_root: Optional[str] = None,
+                 quota_bytes: int = 0,
+                 retention_days: float = 0,
+                 gc_interval: float = 3600,
+                 use_inotify: bool = True,
+                 max_snapshots: int = 256,
+                 ) -> None:
+        self.root = Path(root)
+        self.tmpfs_root = Path(tmpfs_root) if tmpfs_root else None
+        self.quota_bytes = quota_bytes
+        self.retention_days = retention_days
+        self.gc_interval = gc_interval
+        if use_inotify and INotify is None:
+            logger.info("inotify_simple is not installed, workspaces are tracked with snapshots")
+            use_inotify = False
+        self.use_inotify = use_inotify
+        self.max_snapshots = max_snapshots
+        self._snapshots: "OrderedDict[str, Snapshot]" = OrderedDict()
+        self._usage: Dict[str, int] = {}
+        self._active: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls, root: str) -> "WorkspaceManager":
+        return cls(
+            root,
+            tmpfs_root=os.getenv("AGENT_BUILDER_WORKSPACE_TMPFS") or None,
+            quota_bytes=int(float(os.getenv("AGENT_BUILDER_WORKSPACE_QUOTA_MB", "0")) * 1024 * 1024),
+            retention_days=float(os.getenv("AGENT_BUILDER_WORKSPACE_RETENTION_DAYS", "0")),
+            gc_interval=float(os.getenv("AGENT_BUILDER_WORKSPACE_GC_INTERVAL", "3600")),
+            use_inotify=os.getenv("AGENT_BUILDER_WORKSPACE_INOTIFY", "true").lower() == "true",
+        )
+
+    def workspace(self, user_dir: str, session_id: Optional[int]) -> Path:
+        """Work directory of a session for today, created on first use."""
+        work_dir = Path(user_dir) / str(session_id) / datetime.now().strftime("%Y%m%d")
+        if work_dir.exists():
+            return work_dir
+        if self.tmpfs_root is not None:
+            target = self.tmpfs_root / work_dir.relative_to(self.root)
+            target.mkdir(parents=True, exist_ok=True)
+            work_dir.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                work_dir.symlink_to(target, target_is_directory=True)
+            except FileExistsError:
+                pass
+        else:
+            work_dir.mkdir(parents=True, exist_ok=True)
+        return work_dir
+
+    def check_quota(self, user_dir: str) -> None:
+        """Raises a ValueError when the workspaces of a user exceed the quota."""
+        if not self.quota_bytes:
+            return
+        with self._lock:
+            usage = self._usage.get(str(user_dir), 0)
+        if usage > self.quota_bytes:
+            raise ValueError(
+                f"Workspace quota exceeded: {usage // (1024 * 1024)} MB used of "
+                f"{self.quota_bytes // (1024 * 1024)} MB"
+            )
+
+    def track(self, work_dir: str) -> WorkspaceRun:
+        return WorkspaceRun(self, work_dir)
+
+    def start(self) -> None:
+        """Start the background garbage collection."""
+        if self._thread is not None or not (self.retention_days or self.quota_bytes):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._gc_loop, name="workspace-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._thread = None
+
+    def collect_garbage(self) -> None:
+        """Remove expired workspaces and measure the usage of every user."""
+        if not self.root.exists():
+            return
+        deadline = time.time() - self.retention_days * 24 * 3600
+        for user_dir in self.root.iterdir():
+            if not user_dir.is_dir():
+                continue
+            usage = 0
+            for session_dir in user_dir.iterdir():
+                if not session_dir.is_dir():
+                    continue
+                for work_dir in list(session_dir.iterdir()):
+                    if self.retention_days and self._expired(work_dir, deadline):
+                        self._remove(work_dir)
+                    else:
+                        usage += directory_size(str(work_dir))
+                if not any(session_dir.iterdir()):
+                    session_dir.rmdir()
+            with self._lock:
+                self._usage[str(user_dir)] = usage
+
+    def _gc_loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.collect_garbage()
+            except Exception as ex_error:
+                logger.error(f"Error while collecting workspaces: {ex_error}")
+            self._stop_event.wait(self.gc_interval)
+
+    def _expired(self, work_dir: Path, deadline: float) -> bool:
+        with self._lock:
+            if self._active.get(str(work_dir)):
+                return False
+        try:
+            return work_dir.stat().st_mtime < deadline
+        except FileNotFoundError:
+            return False
+
+    def _remove(self, work_dir: Path) -> None:
+        logger.debug(f"Removing expired workspace {work_dir}")
+        if work_dir.is_symlink():
+            shutil.rmtree(work_dir.resolve(), ignore_errors=True)
+            work_dir.unlink()
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        with self._lock:
+            self._snapshots.pop(str(work_dir), None)
+
+    def _user_dir(self, work_dir: str) -> str:
+        # work dirs are <root>/<user>/<session>/<date>
+        return str(Path(work_dir).parent.parent)
+
+    def _acquire(self, work_dir: str) -> None:
+        with self._lock:
+            self._active[work_dir] = self._active.get(work_dir, 0) + 1
+
+    def _release(self, work_dir: str, bytes_written: int) -> None:
+        user_dir = self._user_dir(work_dir)
+        with self._lock:
+            self._active[work_dir] -= 1
+            if not self._active[work_dir]:
+                del self._active[work_dir]
+            self._usage[user_dir] = max(self._usage.get(user_dir, 0) + bytes_written, 0)
+
+    def _cached_snapshot(self, work_dir: str) -> Optional[Snapshot]:
+        with self._lock:
+            return self._snapshots.pop(work_dir, None)
+
+    def _store_snapshot(self, work_dir: str, snapshot: Snapshot) -> None:
+        with self._lock:
+            self._snapshots[work_dir] = snapshot
+            self._snapshots.move_to_end(work_dir)
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
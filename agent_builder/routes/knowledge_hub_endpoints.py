@@ -1,11 +1,22 @@
+import asyncio
+import os
+from typing import Dict
+
 from agent_builder.database import DBManager
-from agent_builder.datamodel import KnowledgeHub
+from agent_builder.datamodel import KnowledgeHub, KnowledgeHubDocument
+from agent_builder.manager.knowledge_hub import KnowledgeHubSync
+from agent_builder.manager.run_executor import RunExecutor, RunStatus
 from agent_builder.utils import list_entity, create_entity, delete_entity
 from fastapi import APIRouter
 
 
 def setup_router(router: APIRouter,dbmanager: DBManager):
 
+    hub_sync = KnowledgeHubSync.from_env(dbmanager)
+    # syncs embed whole directories, they run as jobs polled through /knowledgehub/sync/{job_id}
+    sync_executor = RunExecutor(max_workers=int(os.getenv("AGENT_BUILDER_HUB_SYNC_WORKERS", "2")))
+    sync_jobs: Dict[int, str] = {}
+
     @router.get("/knowledgehub", tags=["Knowledge Hub"])
     async def list_knowledge_hub(user_id: str):
         """List all agents for a user"""
@@ -21,6 +32,40 @@ def setup_router(router: APIRouter,dbmanager: DBManager):
     async def delete_agent(knowledgehub_id: int, user_id: str):
         """Delete an agent"""
         filters = {"id": knowledgehub_id, "user_id": user_id}
+        if dbmanager.get(KnowledgeHub, filters=filters).data:
+            # the manifest is kept when the vectors can't be deleted, so the delete can be retried
+            removed = await asyncio.to_thread(hub_sync.remove, knowledgehub_id, user_id)
+            if not removed["status"]:
+                return removed
         return delete_entity(dbmanager, KnowledgeHub, filters=filters)
 
+    @router.post("/knowledgehub/sync", tags=["Knowledge Hub"])
+    async def sync_knowledge_hub(knowledgehub_id: int, user_id: str):
+        """Start a job embedding the new and changed documents of a knowledge hub and removing the deleted ones"""
+        if not dbmanager.get(KnowledgeHub, filters={"id": knowledgehub_id, "user_id": user_id}).data:
+            return {"status": False, "message": "Knowledge hub not found"}
+        handle = sync_executor.get(sync_jobs.get(knowledgehub_id))
+        if handle is None or handle.done:
+            handle = sync_executor.submit(hub_sync.sync, knowledgehub_id, user_id)
+            sync_jobs[knowledgehub_id] = handle.run_id
+        return {"status": True, "message": "Knowledge hub sync started", "data": handle.to_dict()}
+
+    @router.get("/knowledgehub/sync/{job_id}", tags=["Knowledge Hub"])
+    async def get_knowledge_hub_sync(job_id: str):
+        """Get the status of a knowledge hub sync job, and its result once it completed"""
+        handle = sync_executor.get(job_id)
+        if handle is None:
+            return {"status": False, "message": f"Sync job {job_id} not found"}
+        data = handle.to_dict()
+        if handle.status == RunStatus.completed:
+            data["result"] = handle.future.result()
+        return {"status": True, "message": "Sync job retrieved successfully", "data": data}
+
+    @router.get("/knowledgehub/documents", tags=["Knowledge Hub"])
+    async def list_knowledge_hub_documents(knowledgehub_id: int, user_id: str):
+        """List the document manifest of a knowledge hub"""
+        if not dbmanager.get(KnowledgeHub, filters={"id": knowledgehub_id, "user_id": user_id}).data:
+            return {"status": False, "message": "Knowledge hub not found"}
+        return list_entity(dbmanager, KnowledgeHubDocument, filters={"knowledge_hub_id": knowledgehub_id})
+
     return router
\ No newline at end of file
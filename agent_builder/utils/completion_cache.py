@@ -0,0 +1,273 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from loguru import logger
+
+from agent_builder.utils.utils import get_app_root
+
+COMPLETION_CACHE_PREFIX = "agent_builder:completion:"
+
+
+class CompletionCache(ABC):
+    """
+    Base of the LLM completion caches passed to autogen as `cache`. autogen keys entries by
+    model, messages and request params; entries are additionally scoped by the `cache_seed`
+    of the llm_config, so changing the seed starts from an empty cache.
+
+    Instances are shared by all runs of a process, `scoped(seed)` returns the per run view
+    that autogen uses and that counts the run's hits and misses.
+    """
+
+    @abstractmethod
+    def get(self, seed: int, key: str) -> Optional[Any]:
+        """The cached completion of a key in the scope of a seed, None on a miss."""
+
+    @abstractmethod
+    def set(self, seed: int, key: str, value: Any) -> None:
+        """Store a completion under a key in the scope of a seed."""
+
+    def close(self) -> None:
+        pass
+
+    def scoped(self, seed: int) -> "ScopedCompletionCache":
+        return ScopedCompletionCache(self, seed)
+
+
+class ScopedCompletionCache:
+    """autogen AbstractCache view of a CompletionCache for one cache_seed, counting hits and misses."""
+
+    def __init__(self, cache: CompletionCache, seed: int) -> None:
+        self.cache = cache
+        self.seed = seed
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Optional[Any] = None) -> Optional[Any]:
+        try:
+            value = self.cache.get(self.seed, key)
+        except Exception as ex_error:
+            logger.warning(f"Completion cache lookup failed: {ex_error}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return default if value is None else value
+
+    def set(self, key: str, value: Any) -> None:
+        try:
+            self.cache.set(self.seed, key, value)
+        except Exception as ex_error:
+            logger.warning(f"Completion cache store failed: {ex_error}")
+
+    def close(self) -> None:
+        # the underlying cache is shared by every run
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "seed": self.seed,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def __enter__(self) -> "ScopedCompletionCache":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+class InMemoryCompletionCache(CompletionCache):
+    """
+    Process local LRU completion cache.
+
+    :param max_entries: Maximum number of completions kept, least recently used are evicted first.
+    """
+
+    def __init__(self, max_entries: int = 10000) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, seed: int, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get((seed, key))
+            if value is not None:
+                self._entries.move_to_end((seed, key))
+            return value
+
+    def set(self, seed: int, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[(seed, key)] = value
+            self._entries.move_to_end((seed, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteCompletionCache(CompletionCache):
+    """
+    On disk completion cache in a SQLite database, shared by the processes of one host.
+
+    Reads never write: the last use of a hit is only recorded when it is older than
+    `touch_interval`, and those updates are batched and written with the next `set`, or once
+    `touch_batch` of them are pending, so concurrent hits don't serialize on the write lock.
+
+    :param path: Path of the SQLite database file.
+    :param max_entries: Maximum number of completions kept, least recently used are evicted first.
+    :param touch_interval: Seconds within which repeated hits of an entry don't update its last use.
+    :param touch_batch: Number of pending last use updates that are written without waiting for a `set`.
+    """
+
+    def __init__(self,
+                 path: str,
+                 max_entries: int = 100000,
+                 touch_interval: float = 60,
+                 touch_batch: int = 100,
+                 ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.touch_batch = touch_batch
+        self._local = threading.local()
+        # (seed, key) -> last use not yet written
+        self._touched: Dict[Tuple[int, str], float] = {}
+        self._touched_lock = threading.Lock()
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "seed INTEGER NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, last_used REAL NOT NULL, "
+                "PRIMARY KEY (seed, key))"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, seed: int, key: str) -> Optional[Any]:
+        row = self._connection().execute(
+            "SELECT value, last_used FROM completions WHERE seed = ? AND key = ?", (seed, key)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] >= self.touch_interval:
+            with self._touched_lock:
+                self._touched[(seed, key)] = now
+                flush = len(self._touched) >= self.touch_batch
+            if flush:
+                with self._connection() as connection:
+                    self._write_touched(connection)
+        return pickle.loads(row[0])
+
+    def set(self, seed: int, key: str, value: Any) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO completions (seed, key, value, last_used) VALUES (?, ?, ?, ?)",
+                (seed, key, pickle.dumps(value), time.time()),
+            )
+            # pending hits count for the eviction below
+            self._write_touched(connection)
+            connection.execute(
+                "DELETE FROM completions WHERE rowid IN ("
+                "SELECT rowid FROM completions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def close(self) -> None:
+        if self._touched:
+            with self._connection() as connection:
+                self._write_touched(connection)
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _write_touched(self, connection: sqlite3.Connection) -> None:
+        with self._touched_lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            connection.executemany(
+                "UPDATE completions SET last_used = MAX(last_used, ?) WHERE seed = ? AND key = ?",
+                [(last_used, seed, key) for (seed, key), last_used in touched.items()],
+            )
+
+
+class RedisCompletionCache(CompletionCache):
+    """
+    Completion cache in Redis, shared by every API and worker process. Entries expire after
+    `ttl` seconds, the total size is bounded by the Redis maxmemory policy.
+
+    :param redis_url: URL of the Redis server.
+    :param ttl: Seconds a completion is kept.
+    """
+
+    def __init__(self, redis_url: str, ttl: int = 7 * 24 * 3600) -> None:
+        import redis
+
+        self.redis = redis.Redis.from_url(redis_url)
+        self.ttl = ttl
+
+    def get(self, seed: int, key: str) -> Optional[Any]:
+        value = self.redis.get(f"{COMPLETION_CACHE_PREFIX}{seed}:{key}")
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, seed: int, key: str, value: Any) -> None:
+        self.redis.set(f"{COMPLETION_CACHE_PREFIX}{seed}:{key}", pickle.dumps(value), ex=self.ttl)
+
+    def close(self) -> None:
+        self.redis.close()
+
+
+def completion_cache_from_env() -> Optional[CompletionCache]:
+    """
+    Build the completion cache selected with AGENT_BUILDER_COMPLETION_CACHE: memory, sqlite,
+    redis or none. The cache is only used by agents whose llm_config sets a cache_seed.
+    """
+    backend = os.getenv("AGENT_BUILDER_COMPLETION_CACHE", "sqlite").lower()
+    max_entries = int(os.getenv("AGENT_BUILDER_COMPLETION_CACHE_SIZE", "10000"))
+    if backend == "memory":
+        return InMemoryCompletionCache(max_entries=max_entries)
+    if backend == "sqlite":
+        path = os.getenv(
+            "AGENT_BUILDER_COMPLETION_CACHE_PATH", os.path.join(get_app_root(), "completion_cache.db")
+        )
+        return SQLiteCompletionCache(path, max_entries=max_entries)
+    if backend == "redis":
+        redis_url = os.getenv(
+            "AGENT_BUILDER_COMPLETION_CACHE_URL", f"redis://{os.getenv('REDIS_HOST', 'localhost')}:6379/0"
+        )
+        return RedisCompletionCache(
+            redis_url, ttl=int(os.getenv("AGENT_BUILDER_COMPLETION_CACHE_TTL", str(7 * 24 * 3600)))
+        )
+    return None
+
+
+_completion_cache: Optional[CompletionCache] = None
+_completion_cache_loaded = False
+_completion_cache_lock = threading.Lock()
+
+
+def get_completion_cache() -> Optional[CompletionCache]:
+    """Process wide completion cache, created on first use. None when the backend is none."""
+    global _completion_cache, _completion_cache_loaded
+    with _completion_cache_lock:
+        if not _completion_cache_loaded:
+            _completion_cache = completion_cache_from_env()
+            _completion_cache_loaded = True
+        return _completion_cache
@@ -0,0 +1,272 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from loguru import logger
+
+from agent_builder.utils.utils import get_app_root
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def embedding_key(model: str, text: str) -> str:
+    """Cache key of the embedding of a text by a model, the text is whitespace normalized."""
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class MemmapEmbeddingStore:
+    """
+    On disk embeddings of one model: the vectors live in a memory-mapped float32 array of
+    `capacity` rows, a SQLite index maps keys to rows and tracks their last use so the least
+    recently used row is overwritten once the array is full.
+
+    Every row carries a tag derived from its key, written after the vector, so a reader never
+    returns a row that another process is overwriting.
+
+    :param path: Path prefix of the array, tag and index files.
+    :param dimension: Size of the vectors.
+    :param capacity: Maximum number of vectors stored.
+    """
+
+    def __init__(self, path: str, dimension: int, capacity: int) -> None:
+        self.dimension = dimension
+        self.capacity = capacity
+        self.vectors = self._open_memmap(f"{path}.f32", np.float32, (capacity, dimension))
+        self.tags = self._open_memmap(f"{path}.tags", np.int64, (capacity,))
+        self.index_path = f"{path}.index.sqlite"
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, slot INTEGER NOT NULL UNIQUE, last_used REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+
+    @staticmethod
+    def _open_memmap(path: str, dtype, shape) -> np.memmap:
+        mode = "r+" if os.path.exists(path) else "w+"
+        return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+    @staticmethod
+    def _tag(key: str) -> int:
+        # never 0, the tag of a row that is being written
+        return int(key[:15], 16) or 1
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        connection = self._connection()
+        row = connection.execute("SELECT slot FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        slot, tag = row[0], self._tag(key)
+        vector = np.array(self.vectors[slot])
+        if self.tags[slot] != tag:
+            return None
+        connection.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+        return vector
+
+    def set(self, key: str, vector: np.ndarray) -> None:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT slot FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                connection.execute("COMMIT")
+                return
+            count = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count < self.capacity:
+                slot = count
+            else:
+                slot = connection.execute(
+                    "SELECT slot FROM embeddings ORDER BY last_used LIMIT 1"
+                ).fetchone()[0]
+                connection.execute("DELETE FROM embeddings WHERE slot = ?", (slot,))
+            connection.execute(
+                "INSERT INTO embeddings (key, slot, last_used) VALUES (?, ?, ?)", (key, slot, time.time())
+            )
+            self.tags[slot] = 0
+            self.vectors[slot] = vector
+            self.tags[slot] = self._tag(key)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def flush(self) -> None:
+        self.vectors.flush()
+        self.tags.flush()
+
+
+class EmbeddingCache:
+    """
+    Two tier cache of text embeddings keyed by model and normalized text: an in-memory LRU in
+    front of a memory-mapped store per model on disk, which survives restarts.
+
+    :param directory: Directory of the on disk stores, None keeps embeddings in memory only.
+    :param memory_entries: Maximum number of embeddings kept in memory.
+    :param disk_entries: Maximum number of embeddings stored on disk per model.
+    """
+
+    def __init__(self,
+                 directory: Optional[str] = None,
+                 memory_entries: int = 10000,
+                 disk_entries: int = 100000,
+                 ) -> None:
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._stores: Dict[str, Optional[MemmapEmbeddingStore]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingCache":
+        disk = os.getenv("AGENT_BUILDER_EMBEDDING_CACHE_DISK", "true").lower() == "true"
+        return cls(
+            directory=(
+                os.getenv("AGENT_BUILDER_EMBEDDING_CACHE_DIR") or os.path.join(get_app_root(), "embeddings")
+                if disk
+                else None
+            ),
+            memory_entries=int(os.getenv("AGENT_BUILDER_EMBEDDING_CACHE_SIZE", "10000")),
+            disk_entries=int(os.getenv("AGENT_BUILDER_EMBEDDING_CACHE_DISK_ENTRIES", "100000")),
+        )
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        key = embedding_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+        store = self._store(model)
+        if store is not None:
+            try:
+                vector = store.get(key)
+            except Exception as ex_error:
+                logger.warning(f"Embedding cache lookup failed: {ex_error}")
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, vector)
+        return vector
+
+    def set(self, model: str, text: str, vector: Sequence[float]) -> None:
+        key = embedding_key(model, text)
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+        store = self._store(model, dimension=len(vector))
+        if store is not None and store.dimension == len(vector):
+            try:
+                store.set(key, vector)
+            except Exception as ex_error:
+                logger.warning(f"Embedding cache store failed: {ex_error}")
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"memory": len(self._memory), "hits": self.hits, "misses": self.misses}
+
+    def flush(self) -> None:
+        with self._lock:
+            stores = [store for store in self._stores.values() if store is not None]
+        for store in stores:
+            store.flush()
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _store(self, model: str, dimension: Optional[int] = None) -> Optional[MemmapEmbeddingStore]:
+        """On disk store of a model. Created on the first write, when the dimension is known."""
+        if self.directory is None or self.disk_entries <= 0:
+            return None
+        with self._lock:
+            if model in self._stores:
+                return self._stores[model]
+            prefix = os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", model))
+            if dimension is None:
+                dimension = self._stored_dimension(prefix)
+                if dimension is None:
+                    return None
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                store = MemmapEmbeddingStore(f"{prefix}-{dimension}", dimension, self.disk_entries)
+                with open(f"{prefix}.dimension", "w") as f:
+                    f.write(str(dimension))
+            except Exception as ex_error:
+                logger.warning(f"Embedding cache disabled on disk for {model}: {ex_error}")
+                store = None
+            self._stores[model] = store
+            return store
+
+    @staticmethod
+    def _stored_dimension(prefix: str) -> Optional[int]:
+        try:
+            with open(f"{prefix}.dimension") as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+
+class CachedEmbeddingFunction:
+    """
+    Embedding function that looks up texts in an EmbeddingCache and only embeds the misses.
+    Calls with more than `max_inputs` texts, i.e. documents being indexed, bypass the cache.
+
+    :param embedding_function: The embedding function to cache.
+    :param model: Name of the model, part of the cache key.
+    :param cache: The embedding cache.
+    :param max_inputs: Maximum number of texts of a cached call.
+    """
+
+    def __init__(self,
+                 embedding_function: Callable[[List[str]], Sequence[Sequence[float]]],
+                 model: str,
+                 cache: EmbeddingCache,
+                 max_inputs: int = 16,
+                 ) -> None:
+        self.embedding_function = embedding_function
+        self.model = model
+        self.cache = cache
+        self.max_inputs = max_inputs
+
+    def __call__(self, inputs: List[str]) -> List[List[float]]:
+        if len(inputs) > self.max_inputs:
+            return self.embedding_function(inputs)
+        embeddings: List[Optional[List[float]]] = []
+        missing = []
+        for index, text in enumerate(inputs):
+            vector = self.cache.get(self.model, text)
+            embeddings.append(vector.tolist() if vector is not None else None)
+            if vector is None:
+                missing.append(index)
+        if missing:
+            computed = self.embedding_function([inputs[index] for index in missing])
+            for index, vector in zip(missing, computed):
+                vector = np.asarray(vector, dtype=np.float32)
+                self.cache.set(self.model, inputs[index], vector)
+                embeddings[index] = vector.tolist()
+        return embeddings
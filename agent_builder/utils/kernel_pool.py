@@ -0,0 +1,320 @@
+import json
+import os
+import select
+import subprocess
+import sys
+import threading
+import time
+import weakref
+from hashlib import md5
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from autogen.code_utils import PYTHON_VARIANTS
+from autogen.coding import CodeBlock, LocalCommandLineCodeExecutor
+from autogen.coding.base import CommandLineCodeResult
+from autogen.coding.utils import _get_file_name_from_content, silence_pip
+from loguru import logger
+
+KERNEL_WORKER = str(Path(__file__).resolve().parent / "kernel_worker.py")
+DEFAULT_PRELOAD = ("numpy", "pandas", "matplotlib.pyplot")
+
+
+class KernelError(Exception):
+    """Raised when a kernel died or stopped answering."""
+
+
+class PythonKernel:
+    """
+    A pre-started python process that imported the preload modules and forks a child for
+    every code file it runs, see kernel_worker.
+
+    :param preload: Modules imported once when the kernel starts.
+    """
+
+    def __init__(self, preload: List[str]) -> None:
+        read_fd, write_fd = os.pipe()
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, "-u", KERNEL_WORKER, str(write_fd), json.dumps(list(preload))],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                pass_fds=(write_fd,),
+                start_new_session=True,
+                text=True,
+            )
+        finally:
+            os.close(write_fd)
+        self._responses = os.fdopen(read_fd, "r")
+        self.executions = 0
+        self.rss = 0
+        # peak rss of the forked children, the code blocks' memory never shows in the kernel's rss
+        self.child_rss = 0
+        self.last_used = time.monotonic()
+        self.ready = False
+
+    def wait_ready(self, timeout: float) -> None:
+        response = self._read(timeout)
+        self.rss = response.get("rss", 0)
+        self.ready = True
+
+    def execute(self, path: str, work_dir: str, timeout: float, memory_limit: int) -> Tuple[int, str]:
+        request = {"path": path, "work_dir": work_dir, "timeout": timeout, "memory_limit": memory_limit}
+        try:
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as ex_error:
+            raise KernelError(f"Kernel is not running: {ex_error}")
+        # the kernel enforces the timeout itself, allow some slack for killing the child
+        response = self._read(timeout + 10)
+        self.executions += 1
+        self.rss = response.get("rss", 0)
+        self.child_rss = max(self.child_rss, response.get("child_rss", 0))
+        self.last_used = time.monotonic()
+        return response["exit_code"], response["output"]
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self) -> None:
+        if self.alive():
+            self.process.kill()
+            self.process.wait()
+        self.close_pipes()
+
+    def close_pipes(self) -> None:
+        """Close this process' ends of the kernel pipes, leaving the kernel running."""
+        self._responses.close()
+        if self.process.stdin is not None:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+
+    def _read(self, timeout: float) -> dict:
+        ready, _, _ = select.select([self._responses], [], [], timeout)
+        line = self._responses.readline() if ready else ""
+        if not line:
+            raise KernelError("Kernel did not respond")
+        return json.loads(line)
+
+
+class KernelPool:
+    """
+    Pool of warm python kernels shared by the pooled code executors of every run. Code blocks
+    skip the interpreter startup and the import of the preload modules, while each block still
+    runs in a fresh forked process in its run's work dir.
+
+    Kernels are recycled after `max_executions` code blocks, when the kernel or a code block it
+    ran grew beyond `memory_limit_mb` or after `idle_ttl` seconds without use, and replaced in
+    the background.
+    The pool starts its kernels once a PooledCodeExecutor uses it, and forked processes start
+    with an empty pool since the kernels belong to the parent.
+
+    :param size: Number of idle kernels kept warm.
+    :param max_executions: Number of code blocks a kernel runs before it is recycled.
+    :param memory_limit_mb: Memory ceiling of a code block, and of the kernel itself.
+    :param preload: Modules imported by the kernels before they run code.
+    :param idle_ttl: Seconds an idle kernel is kept.
+    :param startup_timeout: Seconds to wait for a kernel to import the preload modules.
+    """
+
+    def __init__(self,
+                 size: int = 2,
+                 max_executions: int = 100,
+                 memory_limit_mb: int = 4096,
+                 preload: Tuple[str, ...] = DEFAULT_PRELOAD,
+                 idle_ttl: float = 600,
+                 startup_timeout: float = 60,
+                 ) -> None:
+        self.size = size
+        self.max_executions = max_executions
+        self.memory_limit = memory_limit_mb * 1024 * 1024
+        self.preload = list(preload)
+        self.idle_ttl = idle_ttl
+        self.startup_timeout = startup_timeout
+        # forking kernels rely on posix pipes and fork
+        self.supported = os.name == "posix" and hasattr(os, "fork")
+        self._idle: List[PythonKernel] = []
+        self._starting = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        _pools.add(self)
+
+    @classmethod
+    def from_env(cls) -> "KernelPool":
+        preload = os.getenv("AGENT_BUILDER_KERNEL_PRELOAD")
+        return cls(
+            size=int(os.getenv("AGENT_BUILDER_KERNEL_POOL_SIZE", "2")),
+            max_executions=int(os.getenv("AGENT_BUILDER_KERNEL_MAX_EXECUTIONS", "100")),
+            memory_limit_mb=int(os.getenv("AGENT_BUILDER_KERNEL_MEMORY_MB", "4096")),
+            preload=tuple(m.strip() for m in preload.split(",") if m.strip()) if preload is not None else DEFAULT_PRELOAD,
+            idle_ttl=float(os.getenv("AGENT_BUILDER_KERNEL_IDLE_TTL", "600")),
+        )
+
+    def start(self) -> None:
+        """Start the warm kernels in the background. Calling it again only replaces missing kernels."""
+        self._closed = False
+        self._replenish()
+
+    def execute(self, path: str, work_dir: str, timeout: float) -> Tuple[int, str]:
+        """Run a python file in a warm kernel, returns the exit code and the output."""
+        kernel = None
+        try:
+            kernel = self._acquire()
+            result = kernel.execute(path, work_dir, timeout, self.memory_limit)
+        except (KernelError, OSError) as ex_error:
+            if kernel is not None:
+                kernel.close()
+            self._replenish()
+            return 1, str(ex_error)
+        self._release(kernel)
+        return result
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"idle": len(self._idle), "starting": self._starting}
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            kernels, self._idle = self._idle, []
+        for kernel in kernels:
+            kernel.close()
+
+    def _acquire(self) -> PythonKernel:
+        now = time.monotonic()
+        kernel = None
+        expired = []
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.pop()
+                if candidate.alive() and now - candidate.last_used < self.idle_ttl:
+                    kernel = candidate
+                    break
+                expired.append(candidate)
+        for candidate in expired:
+            candidate.close()
+        self._replenish()
+        if kernel is None:
+            # every warm kernel is busy, start one for this block
+            kernel = PythonKernel(self.preload)
+            try:
+                kernel.wait_ready(self.startup_timeout)
+            except BaseException:
+                kernel.close()
+                raise
+        return kernel
+
+    def _release(self, kernel: PythonKernel) -> None:
+        recycle = (
+            not kernel.alive()
+            or kernel.executions >= self.max_executions
+            or max(kernel.rss, kernel.child_rss) > self.memory_limit
+        )
+        if not recycle:
+            with self._lock:
+                if not self._closed and len(self._idle) < self.size:
+                    self._idle.append(kernel)
+                    return
+        kernel.close()
+        self._replenish()
+
+    def _replenish(self) -> None:
+        with self._lock:
+            missing = 0 if self._closed else self.size - len(self._idle) - self._starting
+            self._starting += max(missing, 0)
+        for _ in range(missing):
+            threading.Thread(target=self._start_kernel, name="kernel-start", daemon=True).start()
+
+    def _start_kernel(self) -> None:
+        kernel = None
+        try:
+            kernel = PythonKernel(self.preload)
+            kernel.wait_ready(self.startup_timeout)
+        except Exception as ex_error:
+            logger.error(f"Error while starting a python kernel: {ex_error}")
+            if kernel is not None:
+                kernel.close()
+            kernel = None
+        with self._lock:
+            self._starting -= 1
+            if kernel is not None and not self._closed and len(self._idle) < self.size:
+                self._idle.append(kernel)
+                kernel = None
+        if kernel is not None:
+            kernel.close()
+
+    def _after_fork(self) -> None:
+        # the kernels and the threads starting them stay with the parent process
+        for kernel in self._idle:
+            kernel.close_pipes()
+        self._idle = []
+        self._starting = 0
+        self._lock = threading.Lock()
+
+
+_pools: "weakref.WeakSet[KernelPool]" = weakref.WeakSet()
+
+
+def _reset_pools_after_fork() -> None:
+    for pool in list(_pools):
+        pool._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+kernel_pool = KernelPool.from_env()
+
+
+class PooledCodeExecutor(LocalCommandLineCodeExecutor):
+    """
+    LocalCommandLineCodeExecutor that runs python code blocks in the warm kernels of a
+    KernelPool instead of a fresh interpreter. Other languages run as before.
+
+    :param pool: The kernel pool, defaults to the process wide pool.
+    """
+
+    def __init__(self, pool: Optional[KernelPool] = None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.pool = pool if pool is not None else kernel_pool
+        if self.pool.supported:
+            # warm the kernels up while the agents produce the first code block
+            self.pool.start()
+
+    def _execute_code_dont_check_setup(self, code_blocks: List[CodeBlock]) -> CommandLineCodeResult:
+        if not self.pool.supported:
+            return super()._execute_code_dont_check_setup(code_blocks)
+        logs_all = ""
+        file_names = []
+        exitcode = 0
+        for code_block in code_blocks:
+            lang = code_block.language.lower()
+            if lang not in PYTHON_VARIANTS or not self.execution_policies.get("python", False):
+                result = super()._execute_code_dont_check_setup([code_block])
+                logs_all += result.output
+                file_names += [result.code_file] if result.code_file else []
+                exitcode = result.exit_code
+            else:
+                code = silence_pip(code_block.code, lang)
+                self.sanitize_command(lang, code)
+                try:
+                    filename = _get_file_name_from_content(code, self._work_dir)
+                except ValueError:
+                    return CommandLineCodeResult(exit_code=1, output="Filename is not in the workspace")
+                if filename is None:
+                    filename = f"tmp_code_{md5(code.encode()).hexdigest()}.py"
+                written_file = (self._work_dir / filename).resolve()
+                with written_file.open("w", encoding="utf-8") as f:
+                    f.write(code)
+                file_names.append(str(written_file))
+                exitcode, output = self.pool.execute(
+                    str(written_file), str(self._work_dir.resolve()), float(self._timeout)
+                )
+                logs_all += output
+            if exitcode != 0:
+                break
+
+        code_file = str(file_names[0]) if len(file_names) > 0 else None
+        return CommandLineCodeResult(exit_code=exitcode, output=logs_all, code_file=code_file)
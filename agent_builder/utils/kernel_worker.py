@@ -0,0 +1,123 @@
+"""
+Warm python kernel of the KernelPool. Runs as a standalone script, it must only use the
+standard library and must not import agent_builder.
+
+The kernel imports the preload modules once and then forks a child for every code file it is
+asked to run, so each code block starts with the modules already imported but with fresh
+state, in its own work dir and under the memory ceiling. Requests are read as JSON lines from
+stdin, responses are written as JSON lines to the file descriptor passed as first argument.
+"""
+import json
+import os
+import resource
+import runpy
+import signal
+import sys
+import tempfile
+import time
+import traceback
+
+TIMEOUT_MSG = "Timeout"
+# cap of the output returned for a code block
+MAX_OUTPUT_CHARS = 1_000_000
+
+
+def preload(modules):
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    for module in modules:
+        try:
+            __import__(module)
+        except Exception:
+            pass
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def run_child(path, work_dir, memory_limit, output):
+    os.setsid()
+    os.dup2(output.fileno(), 1)
+    os.dup2(output.fileno(), 2)
+    exit_code = 0
+    try:
+        if memory_limit:
+            resource.setrlimit(resource.RLIMIT_DATA, (memory_limit, memory_limit))
+        os.chdir(work_dir)
+        sys.path.insert(0, work_dir)
+        sys.argv = [path]
+        runpy.run_path(path, run_name="__main__")
+    except SystemExit as ex_exit:
+        if isinstance(ex_exit.code, int):
+            exit_code = ex_exit.code
+        elif ex_exit.code is not None:
+            print(ex_exit.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException as ex_error:
+        # drop the runpy frames, the traceback starts in the code file like a fresh interpreter
+        tb = ex_error.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != path:
+            tb = tb.tb_next
+        traceback.print_exception(type(ex_error), ex_error, tb or ex_error.__traceback__)
+        exit_code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+    os._exit(exit_code)
+
+
+def peak_rss_bytes(usage):
+    # ru_maxrss is in kilobytes on linux and in bytes on macos
+    return usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def wait_child(pid, timeout):
+    """Returns the exit code, whether the child timed out and the child's peak rss."""
+    deadline = time.monotonic() + timeout
+    delay = 0.001
+    while True:
+        waited_pid, status, usage = os.wait4(pid, os.WNOHANG)
+        if waited_pid:
+            return os.waitstatus_to_exitcode(status), False, peak_rss_bytes(usage)
+        if time.monotonic() >= deadline:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            _, _, usage = os.wait4(pid, 0)
+            return 124, True, peak_rss_bytes(usage)
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+
+
+def execute(request):
+    with tempfile.TemporaryFile() as output:
+        pid = os.fork()
+        if pid == 0:
+            run_child(request["path"], request["work_dir"], request.get("memory_limit"), output)
+        exit_code, timed_out, child_rss = wait_child(pid, request.get("timeout", 60))
+        output.seek(0)
+        logs = output.read(MAX_OUTPUT_CHARS).decode("utf-8", errors="replace")
+    if timed_out:
+        logs += "\n" + TIMEOUT_MSG
+    return {"exit_code": exit_code, "output": logs, "rss": rss_bytes(), "child_rss": child_rss}
+
+
+def main():
+    responses = os.fdopen(int(sys.argv[1]), "w", buffering=1)
+    preload(json.loads(sys.argv[2]))
+    responses.write(json.dumps({"ready": True, "rss": rss_bytes()}) + "\n")
+    for line in sys.stdin:
+        try:
+            response = execute(json.loads(line))
+        except Exception as ex_error:
+            response = {"exit_code": 1, "output": f"Kernel error: {ex_error}", "rss": rss_bytes()}
+        responses.write(json.dumps(response) + "\n")
+
+
+if __name__ == "__main__":
+    main()
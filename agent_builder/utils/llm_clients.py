@@ -0,0 +1,131 @@
+import hashlib
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import httpx
+import openai
+from loguru import logger
+
+from agent_builder.datamodel import Model
+from agent_builder.utils.utils import sanitize_model
+
+# api types whose autogen client is built on the openai sdk and accepts an http_client
+HTTP_CLIENT_API_TYPES = ("open_ai", "openai", "azure")
+
+
+class PooledHttpClient(openai.DefaultHttpxClient):
+    """HTTP client shared by every agent. autogen deep copies llm_config, copies keep the same pool."""
+
+    def __deepcopy__(self, memo: Dict) -> "PooledHttpClient":
+        return self
+
+
+class LLMClientRegistry:
+    """
+    Process wide registry of pooled HTTP clients for LLM endpoints.
+
+    Clients are keyed by the connection relevant part of the sanitized model config (base url,
+    api type, api version and api key), so every agent, run and helper talking to the same
+    endpoint reuses one keep-alive connection pool instead of opening new TLS connections.
+
+    :param max_connections: Maximum number of connections per endpoint.
+    :param max_keepalive_connections: Maximum number of idle connections kept open per endpoint.
+    :param keepalive_expiry: Seconds an idle connection is kept open.
+    :param http2: Whether to negotiate HTTP/2. Requires the h2 package.
+    """
+
+    def __init__(self,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30,
+                 http2: bool = False,
+                 ) -> None:
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("h2 is not installed, LLM clients fall back to HTTP/1.1")
+                http2 = False
+        self.http2 = http2
+        self._http_clients: Dict[Tuple, PooledHttpClient] = {}
+        self._openai_clients: Dict[Tuple, openai.OpenAI] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "LLMClientRegistry":
+        return cls(
+            max_connections=int(os.getenv("AGENT_BUILDER_LLM_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("AGENT_BUILDER_LLM_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("AGENT_BUILDER_LLM_KEEPALIVE_EXPIRY", "30")),
+            http2=os.getenv("AGENT_BUILDER_LLM_HTTP2", "false").lower() == "true",
+        )
+
+    @staticmethod
+    def _key(config: Dict[str, Any]) -> Tuple:
+        api_key = config.get("api_key") or os.getenv("OPENAI_API_KEY") or ""
+        return (
+            config.get("base_url"),
+            config.get("api_type"),
+            config.get("api_version"),
+            hashlib.sha256(api_key.encode("utf-8")).hexdigest(),
+        )
+
+    def http_client(self, config: Union[Model, Dict[str, Any]]) -> PooledHttpClient:
+        """Pooled HTTP client for the endpoint of a model config."""
+        key = self._key(sanitize_model(config))
+        with self._lock:
+            client = self._http_clients.get(key)
+            if client is None:
+                client = PooledHttpClient(limits=self.limits, http2=self.http2)
+                self._http_clients[key] = client
+            return client
+
+    def openai_client(self, config: Optional[Dict[str, Any]] = None) -> openai.OpenAI:
+        """Shared openai client for a model config, defaults to OPENAI_API_KEY and the OpenAI api."""
+        config = sanitize_model(config or {"api_key": os.getenv("OPENAI_API_KEY")})
+        key = self._key(config)
+        with self._lock:
+            client = self._openai_clients.get(key)
+        if client is None:
+            client = openai.OpenAI(
+                api_key=config.get("api_key"),
+                base_url=config.get("base_url"),
+                http_client=self.http_client(config),
+            )
+            with self._lock:
+                client = self._openai_clients.setdefault(key, client)
+        return client
+
+    def bind_config_list(self, config_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Copy of an autogen config_list whose openai compatible entries use the pooled clients."""
+        bound = []
+        for config in config_list:
+            config = dict(config)
+            api_type = config.get("api_type")
+            if (api_type is None or api_type.startswith(HTTP_CLIENT_API_TYPES)) and "http_client" not in config:
+                config["http_client"] = self.http_client(config)
+            bound.append(config)
+        return bound
+
+    def bind(self, llm_config: Union[Dict[str, Any], bool, None]) -> Union[Dict[str, Any], bool, None]:
+        """Copy of an autogen llm_config whose openai compatible entries use the pooled clients."""
+        if not isinstance(llm_config, dict) or not llm_config.get("config_list"):
+            return llm_config
+        return {**llm_config, "config_list": self.bind_config_list(llm_config["config_list"])}
+
+    def close(self) -> None:
+        with self._lock:
+            clients = list(self._http_clients.values())
+            self._http_clients.clear()
+            self._openai_clients.clear()
+        for client in clients:
+            client.close()
+
+
+llm_client_registry = LLMClientRegistry.from_env()
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from agent_builder.utils.utils import cache_response, get_cached_response
+
+RESPONSE_CACHE_PREFIX = "agent_builder:response:"
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lower-case a prompt and collapse its whitespace."""
+    return " ".join((prompt or "").lower().split())
+
+
+def response_cache_key(workflow_id: Any,
+                       workflow_updated_at: Any,
+                       prompt: str,
+                       history: Optional[List[Dict[str, Any]]] = None,
+                       history_turns: int = 4,
+                       ) -> str:
+    """
+    Build the cache key of a workflow response.
+
+    :param workflow_id: The workflow answering the prompt.
+    :param workflow_updated_at: Last update time of the workflow, so edits invalidate old answers.
+    :param prompt: The user prompt.
+    :param history: Session messages in chronological order.
+    :param history_turns: Number of trailing history messages that take part in the key.
+    :return: A namespaced sha256 key.
+    """
+    recent_history = [
+        (message.get("role"), normalize_prompt(message.get("content")))
+        for message in (history or [])[-history_turns:]
+    ] if history_turns else []
+    payload = json.dumps(
+        {
+            "workflow_id": workflow_id,
+            "workflow_updated_at": workflow_updated_at,
+            "prompt": normalize_prompt(prompt),
+            "history": recent_history,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return RESPONSE_CACHE_PREFIX + hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier response cache: an in-process LRU in front of Redis.
+
+    Redis errors are logged and treated as misses so the cache never fails a request.
+
+    :param redis: An async Redis client, or None to only use the in-process tier.
+    :param max_entries: Capacity of the in-process LRU.
+    :param ttl: Lifetime of an entry in seconds, in both tiers.
+    """
+
+    def __init__(self, redis: Any = None, max_entries: int = 1024, ttl: int = 3600) -> None:
+        self.redis = redis
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._local.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.time():
+                self._local.move_to_end(key)
+                return value
+            del self._local[key]
+
+        if self.redis is None:
+            return None
+        try:
+            value = await get_cached_response(self.redis, key)
+        except Exception as ex_error:
+            logger.warning(f"Redis response cache lookup failed: {ex_error}")
+            return None
+        if value is not None:
+            self._set_local(key, value)
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        self._set_local(key, value)
+        if self.redis is None:
+            return
+        try:
+            await cache_response(self.redis, key, value, ttl=self.ttl)
+        except Exception as ex_error:
+            logger.warning(f"Redis response cache write failed: {ex_error}")
+
+    def _set_local(self, key: str, value: Any) -> None:
+        self._local[key] = (time.time() + self.ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key, so only the first caller does the work
+    and the others await its result.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run `fn` unless a call with the same key is already in flight.
+
+        :return: The result and whether it was shared from another caller's call.
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as ex_error:
+            future.set_exception(ex_error)
+            # the leader re-raises, so followers awaiting the future are the only consumers
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
@@ -0,0 +1,197 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+
+class SemanticCacheEntry:
+
+    def __init__(self, prompt: str, embedding: np.ndarray, response: Any) -> None:
+        self.prompt = prompt
+        self.embedding = embedding
+        self.response = response
+        self.created_at = time.time()
+        self.last_used = self.created_at
+
+
+class SemanticResponseCache:
+    """
+    Caches workflow responses by prompt meaning rather than prompt text.
+
+    Prompts are embedded with a local embedding function and compared by cosine similarity
+    against the prompts previously answered by the same version of the same workflow. A lookup
+    is a hit when the nearest stored prompt reaches `similarity_threshold`, and a near miss when
+    it falls within `near_miss_margin` below it. Entries expire after `ttl` seconds and every
+    workflow keeps at most `max_entries` prompts, evicting the least recently used.
+
+    Prompts are matched without their conversation, so only prompts that open a session may be
+    looked up and stored.
+
+    The embedding function is only called on the first `embed`, so a function that loads its
+    model on first use keeps the model out of server start up.
+
+    :param embedding_function: Callable that embeds a list of texts, e.g. FastEmbedEmbeddingFunction.
+    :param similarity_threshold: Minimum cosine similarity for a hit.
+    :param near_miss_margin: Width of the band below the threshold reported as near misses.
+    :param ttl: Lifetime of an entry in seconds. None disables expiry.
+    :param max_entries: Maximum number of prompts cached per workflow.
+    """
+
+    def __init__(self,
+                 embedding_function: Callable[[List[str]], Sequence[Sequence[float]]],
+                 similarity_threshold: float = 0.92,
+                 near_miss_margin: float = 0.05,
+                 ttl: Optional[float] = 3600,
+                 max_entries: int = 1000,
+                 ) -> None:
+        self.embedding_function = embedding_function
+        self.similarity_threshold = similarity_threshold
+        self.near_miss_margin = near_miss_margin
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[str, Dict[str, SemanticCacheEntry]] = {}
+        self._versions: Dict[str, str] = {}
+        self._owners: Dict[str, Optional[str]] = {}
+        self._matrices: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "near_misses": 0, "evictions": 0}
+
+    def embed(self, prompt: str) -> np.ndarray:
+        """Embed and L2-normalise a prompt so dot products are cosine similarities."""
+        embedding = np.asarray(self.embedding_function([prompt])[0], dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def lookup(self, workflow_id: Any, embedding: np.ndarray, version: Any = None) -> Optional[Any]:
+        """
+        Return the cached response of the nearest prompt answered by the workflow.
+
+        :param workflow_id: The workflow the prompt is addressed to.
+        :param embedding: The normalised prompt embedding returned by `embed`.
+        :param version: Version of the workflow, e.g. its `updated_at`. Entries of other versions never match.
+        :return: The cached response on a hit, otherwise None.
+        """
+        key = str(workflow_id)
+        with self._lock:
+            self._check_version(key, version)
+            self._expire(key)
+            entries = self._entries.get(key)
+            if not entries:
+                self._stats["misses"] += 1
+                return None
+
+            prompts, matrix = self._matrix(key)
+            similarities = matrix @ embedding
+            best = int(np.argmax(similarities))
+            score = float(similarities[best])
+            entry = entries[prompts[best]]
+
+            if score >= self.similarity_threshold:
+                self._stats["hits"] += 1
+                entry.last_used = time.time()
+                logger.info(f"Semantic cache hit for workflow {key} (similarity {score:.3f})")
+                return entry.response
+
+            if score >= self.similarity_threshold - self.near_miss_margin:
+                self._stats["near_misses"] += 1
+                logger.info(f"Semantic cache near miss for workflow {key} (similarity {score:.3f})")
+            else:
+                self._stats["misses"] += 1
+            return None
+
+    def store(self,
+              workflow_id: Any,
+              prompt: str,
+              embedding: np.ndarray,
+              response: Any,
+              version: Any = None,
+              user_id: Optional[str] = None,
+              ) -> None:
+        """
+        Cache the response a workflow produced for a prompt.
+
+        :param workflow_id: The workflow that answered the prompt.
+        :param prompt: The prompt text.
+        :param embedding: The normalised prompt embedding returned by `embed`.
+        :param response: The JSON serializable response to cache.
+        :param version: Version of the workflow that answered, see `lookup`.
+        :param user_id: Owner of the workflow, whose building block writes invalidate the entry.
+        """
+        key = str(workflow_id)
+        with self._lock:
+            self._check_version(key, version)
+            self._owners[key] = user_id
+            entries = self._entries.setdefault(key, {})
+            entries[prompt] = SemanticCacheEntry(prompt, embedding, response)
+            while len(entries) > self.max_entries:
+                least_recently_used = min(entries.values(), key=lambda item: item.last_used)
+                del entries[least_recently_used.prompt]
+                self._stats["evictions"] += 1
+            self._matrices.pop(key, None)
+
+    def invalidate(self, workflow_id: Any) -> None:
+        with self._lock:
+            self._drop(str(workflow_id))
+
+    def invalidate_user(self, user_id: Optional[str]) -> None:
+        """Drop the answers of the workflows of a user, or of every workflow when no user is given."""
+        if user_id is None:
+            self.clear()
+            return
+        with self._lock:
+            for key in [key for key, owner in self._owners.items() if owner in (user_id, None)]:
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+            self._versions.clear()
+            self._owners.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"] + self._stats["near_misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": sum(len(entries) for entries in self._entries.values()),
+                "workflows": len(self._entries),
+            }
+
+    def _drop(self, key: str) -> None:
+        self._entries.pop(key, None)
+        self._matrices.pop(key, None)
+        self._versions.pop(key, None)
+        self._owners.pop(key, None)
+
+    def _matrix(self, key: str) -> Tuple[List[str], np.ndarray]:
+        # stacked embeddings are rebuilt only after the workflow's entries change
+        cached = self._matrices.get(key)
+        if cached is None:
+            entries = self._entries[key]
+            cached = (list(entries), np.stack([entry.embedding for entry in entries.values()]))
+            self._matrices[key] = cached
+        return cached
+
+    def _check_version(self, key: str, version: Any) -> None:
+        # entries of an older version of the workflow are dropped
+        version = str(version)
+        if self._versions.get(key, version) != version:
+            self._entries.pop(key, None)
+            self._matrices.pop(key, None)
+        self._versions[key] = version
+
+    def _expire(self, key: str) -> None:
+        entries = self._entries.get(key)
+        if not entries or self.ttl is None:
+            return
+        deadline = time.time() - self.ttl
+        expired = [prompt for prompt, entry in entries.items() if entry.created_at < deadline]
+        for prompt in expired:
+            del entries[prompt]
+            self._stats["evictions"] += 1
+        if expired:
+            self._matrices.pop(key, None)
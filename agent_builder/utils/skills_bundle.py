@@ -0,0 +1,116 @@
+import hashlib
+import os
+import py_compile
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from loguru import logger
+
+from agent_builder.datamodel import Skill
+from agent_builder.utils.utils import SKILLS_INSTRUCTION, get_app_root, get_skills_source
+
+# a star import would drop the underscore names and the names outside __all__ of the skills
+SKILLS_SHIM = '''# skills bundle {digest}, generated by agent builder
+import importlib as _importlib
+import sys as _sys
+
+if {bundle_dir!r} not in _sys.path:
+    _sys.path.append({bundle_dir!r})
+globals().update({{
+    _name: _value
+    for _name, _value in vars(_importlib.import_module({module!r})).items()
+    if not (_name.startswith("__") and _name.endswith("__"))
+}})
+'''
+
+
+def skills_digest(skills: List[Skill]) -> str:
+    """Content hash of an ordered list of skills."""
+    digest = hashlib.sha256()
+    for skill in skills:
+        digest.update(skill.name.encode("utf-8") + b"\0" + skill.content.encode("utf-8") + b"\0")
+    return digest.hexdigest()[:24]
+
+
+class SkillsBundleCache:
+    """
+    Builds the skills.py of a set of skills once per content hash. The bundle is written to the
+    shared `cache_dir` as `skills_<hash>.py` and compiled to bytecode; work dirs only get a
+    small skills.py that imports the bundle, so agents with the same skills share the compiled
+    module across sessions and runs. The skills prompt is memoized by the same hash.
+
+    :param cache_dir: Directory holding the bundles, shared by every worker of a host.
+    :param max_prompts: Maximum number of memoized skills prompts.
+    """
+
+    def __init__(self, cache_dir: str, max_prompts: int = 256) -> None:
+        self.cache_dir = cache_dir
+        self.max_prompts = max_prompts
+        self._prompts: "OrderedDict[str, str]" = OrderedDict()
+        self._built = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SkillsBundleCache":
+        return cls(
+            os.getenv("AGENT_BUILDER_SKILLS_CACHE_DIR") or os.path.join(get_app_root(), "skills"),
+            max_prompts=int(os.getenv("AGENT_BUILDER_SKILLS_PROMPT_CACHE_SIZE", "256")),
+        )
+
+    def prompt(self, skills: List[Skill], digest: Optional[str] = None) -> str:
+        """The skills prompt added to the system message of an agent."""
+        digest = digest or skills_digest(skills)
+        with self._lock:
+            prompt = self._prompts.get(digest)
+            if prompt is not None:
+                self._prompts.move_to_end(digest)
+                return prompt
+        prompt = SKILLS_INSTRUCTION + get_skills_source(skills)
+        with self._lock:
+            self._prompts[digest] = prompt
+            while len(self._prompts) > self.max_prompts:
+                self._prompts.popitem(last=False)
+        return prompt
+
+    def link(self, skills: List[Skill], work_dir: str, digest: Optional[str] = None) -> None:
+        """Build the bundle of the skills if needed and point the work dir's skills.py at it."""
+        digest = digest or skills_digest(skills)
+        module = self.build(skills, digest)
+        shim = SKILLS_SHIM.format(digest=digest, bundle_dir=self.cache_dir, module=module)
+        path = os.path.join(work_dir, "skills.py")
+        try:
+            with open(path, encoding="utf-8") as f:
+                if f.read() == shim:
+                    return
+        except (FileNotFoundError, UnicodeDecodeError):
+            pass
+        os.makedirs(work_dir, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(shim)
+
+    def build(self, skills: List[Skill], digest: str) -> str:
+        """Write and compile the bundle of the skills unless it exists, returns its module name."""
+        module = f"skills_{digest}"
+        if digest in self._built:
+            return module
+        path = os.path.join(self.cache_dir, f"{module}.py")
+        if not os.path.exists(path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # written to a temporary file and renamed, other workers may build the same bundle
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(get_skills_source(skills))
+            os.replace(tmp_path, path)
+        try:
+            py_compile.compile(path, doraise=True)
+        except py_compile.PyCompileError as ex_error:
+            # the error surfaces to the agents when they import the skills
+            logger.warning(f"Skills bundle {digest} does not compile: {ex_error.msg}")
+        with self._lock:
+            self._built.add(digest)
+        return module
+
+
+skills_bundle_cache = SkillsBundleCache.from_env()
@@ -0,0 +1,82 @@
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+STATE_STORE_PREFIX = "agent_builder:state:"
+
+
+class ConversationStateStore(ABC):
+    """Stores per session conversation state as JSON serializable dicts."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The state stored under a key, None if there is none or it expired."""
+
+    @abstractmethod
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store the state of a key, replacing the previous state."""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Drop the state of a key."""
+
+
+class InMemoryStateStore(ConversationStateStore):
+    """
+    Conversation state kept in the worker process, evicted after `ttl` seconds of inactivity or
+    when more than `max_entries` sessions are stored. Only correct with a single API worker.
+
+    :param ttl: Seconds after the last write before a session's state expires.
+    :param max_entries: Maximum number of sessions kept, least recently used are evicted first.
+    """
+
+    def __init__(self, ttl: int = 3600, max_entries: int = 10000) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        # stored serialized so callers never share mutable state across requests
+        return json.loads(value)
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._entries[key] = (time.time() + self.ttl, json.dumps(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+
+class RedisStateStore(ConversationStateStore):
+    """
+    Conversation state kept in Redis with a TTL, shared by every API worker.
+
+    :param redis: An async Redis client created with decode_responses=True.
+    :param ttl: Seconds after the last write before a session's state expires.
+    """
+
+    def __init__(self, redis: Any, ttl: int = 3600) -> None:
+        self.redis = redis
+        self.ttl = ttl
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = await self.redis.get(STATE_STORE_PREFIX + key)
+        return json.loads(value) if value else None
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        await self.redis.set(STATE_STORE_PREFIX + key, json.dumps(value), ex=self.ttl)
+
+    async def delete(self, key: str) -> None:
+        await self.redis.delete(STATE_STORE_PREFIX + key)
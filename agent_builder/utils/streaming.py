@@ -0,0 +1,50 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional
+
+from autogen.io import IOConsole
+
+current_speaker: ContextVar[Optional[str]] = ContextVar("current_speaker", default=None)
+
+
+@contextmanager
+def streaming_speaker(name: str) -> Iterator[None]:
+    """Attribute the token deltas streamed inside the block to the agent `name`."""
+    token = current_speaker.set(name)
+    try:
+        yield
+    finally:
+        current_speaker.reset(token)
+
+
+class DeltaIOStream(IOConsole):
+    """
+    autogen IOStream that forwards streamed completion tokens to a callback.
+
+    autogen emits one stream message per token delta when `stream` is enabled in an llm_config.
+    Deltas produced while an agent is inside `streaming_speaker` are passed to
+    `on_delta(speaker, content)`. Everything else is printed to the console as usual.
+
+    :param on_delta: Callable receiving the speaking agent's name and the token delta.
+    """
+
+    def __init__(self, on_delta: Callable[[str, str], None]) -> None:
+        self.on_delta = on_delta
+
+    def send(self, message: Any) -> None:
+        content = self._stream_content(message)
+        speaker = current_speaker.get()
+        if content is not None and speaker is not None:
+            self.on_delta(speaker, content)
+            return
+        super().send(message)
+
+    @staticmethod
+    def _stream_content(message: Any) -> Optional[str]:
+        # stream messages are wrapped: the outer message has type "stream" and
+        # carries the StreamMessage, whose content is the token delta
+        if getattr(message, "type", None) != "stream":
+            return None
+        content = getattr(message, "content", None)
+        content = getattr(content, "content", content)
+        return content if isinstance(content, str) else None
@@ -2,20 +2,19 @@ import json
 import os
 from pathlib import Path
 import re
-from pydantic import BaseModel, Field, model_validator, field_validator
-import openai
+from pydantic import BaseModel, model_validator
 from typing import Union, List, Literal, Optional, Self
 from sqlmodel import Session
 from agent_builder.database.database_manager import DBManager
 from agent_builder.datamodel import RetrieverConfig, AgentConfig, CodeExecutionConfigTypes, Agent, AgentType, Workflow, \
-    Model, AgentClassification, KnowledgeHubType, KnowledgeHub
+    Model, AgentClassification, KnowledgeHub
+from agent_builder.utils.llm_clients import llm_client_registry
 from dotenv import load_dotenv
-from autogen import AssistantAgent
 
 
 load_dotenv()
 
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = llm_client_registry.openai_client()
 
 
 optimized_prompt = """
@@ -285,6 +284,8 @@ def create_retrieval_agent(agent_name: str,
         details=docs_path,
         user_id="guestuser@hdfcbank.com",
         type=hub_type,
+        collection_name=f"{agent_name}_collection",
+        embedding_model=embedding_model,
     )
 
     # default_assistant_config = AgentConfig(
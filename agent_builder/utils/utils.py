@@ -5,16 +5,21 @@ import shutil
 import hashlib
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
 import re
 
 from agent_builder.database import DBManager
 from agent_builder.datamodel import Model, CodeExecutionConfigTypes, Skill, Response
+from autogen.io import IOStream
 from autogen.oai.client import ModelClient, OpenAIWrapper
+from autogen.token_count_utils import count_token
 from autogen.coding import DockerCommandLineCodeExecutor, LocalCommandLineCodeExecutor
 from loguru import logger
 from dotenv import load_dotenv
 from version import APP_NAME
+from agent_builder.utils.streaming import DeltaIOStream, streaming_speaker
+from agent_builder.utils.kernel_pool import PooledCodeExecutor
 
 
 def md5_hash(text: str) -> str:
@@ -107,6 +112,8 @@ def load_code_execution_config(
         executor = LocalCommandLineCodeExecutor(work_dir=work_dir)
     elif code_execution_type == CodeExecutionConfigTypes.docker:
         executor = DockerCommandLineCodeExecutor(work_dir=work_dir)
+    elif code_execution_type == CodeExecutionConfigTypes.pooled:
+        executor = PooledCodeExecutor(work_dir=work_dir)
     elif code_execution_type == CodeExecutionConfigTypes.none:
         return False
     else:
@@ -205,6 +212,37 @@ def get_file_type(file_path: str) -> str:
     return file_type
 
 
+IGNORED_FILES = {"__pycache__", "__init__.py"}
+IGNORED_EXTENSIONS = {".pyc", ".cache"}
+
+
+def is_ignored_file(name: str) -> bool:
+    """Whether a generated file is hidden from the user, e.g. python bytecode."""
+    return name in IGNORED_FILES or os.path.splitext(name)[1] in IGNORED_EXTENSIONS
+
+
+def describe_file(file_path: str) -> Dict[str, str]:
+    """
+    Describe a file of a work directory for the client.
+
+    :return: Dictionary format: {path: "", name: "", extension: "", type: ""}, where path is
+             relative to the files static root.
+    """
+    file_relative_path = (
+        "files/user" + file_path.split("files/user", 1)[1]
+        if "files/user" in file_path
+        else ""
+    )
+    name = os.path.basename(file_path)
+    return {
+        "path": file_relative_path,
+        "name": name,
+        # Remove the dot
+        "extension": os.path.splitext(name)[1].lstrip("."),
+        "type": get_file_type(file_path),
+    }
+
+
 def get_modified_files(
     start_timestamp: float, end_timestamp: float, source_dir: str
 ) -> List[Dict[str, str]]:
@@ -222,18 +260,12 @@ def get_modified_files(
              are ignored.
     """
     modified_files = []
-    ignore_extensions = {".pyc", ".cache"}
-    ignore_files = {"__pycache__", "__init__.py"}
 
     # Walk through the directory tree
     for root, dirs, files in os.walk(source_dir):
         # Update directories and files to exclude those to be ignored
-        dirs[:] = [d for d in dirs if d not in ignore_files]
-        files[:] = [
-            f
-            for f in files
-            if f not in ignore_files and os.path.splitext(f)[1] not in ignore_extensions
-        ]
+        dirs[:] = [d for d in dirs if d not in IGNORED_FILES]
+        files[:] = [f for f in files if not is_ignored_file(f)]
 
         for file in files:
             file_path = os.path.join(root, file)
@@ -241,35 +273,13 @@ def get_modified_files(
 
             # Verify if the file was modified within the given timestamp range
             if start_timestamp <= file_mtime <= end_timestamp:
-                file_relative_path = (
-                    "files/user" + file_path.split("files/user", 1)[1]
-                    if "files/user" in file_path
-                    else ""
-                )
-                file_type = get_file_type(file_path)
-
-                file_dict = {
-                    "path": file_relative_path,
-                    "name": os.path.basename(file),
-                    # Remove the dot
-                    "extension": os.path.splitext(file)[1].lstrip("."),
-                    "type": file_type,
-                }
-                modified_files.append(file_dict)
+                modified_files.append(describe_file(file_path))
 
     # Sort the modified files by extension
     modified_files.sort(key=lambda x: x["extension"])
     return modified_files
 
-def get_skills_from_prompt(skills: List[Skill], work_dir: str) -> str:
-    """
-    Create a prompt with the content of all skills and write the skills to a file named skills.py in the work_dir.
-
-    :param skills: A dictionary skills
-    :return: A string containing the content of all skills
-    """
-
-    instruction = """
+SKILLS_INSTRUCTION = """
 
 While solving the task you may use functions below which will be available in a file called skills.py .
 To use a function skill.py in code, IMPORT THE FUNCTION FROM skills.py  and then use the function.
@@ -277,9 +287,18 @@ If you need to install python packages, write shell code to
 install via pip and use --quiet option.
 
          """
-    prompt = ""  # filename:  skills.py
+
+
+def get_skills_source(skills: List[Skill]) -> str:
+    """
+    Concatenate the content of all skills into the source of skills.py.
+
+    :param skills: A list of skills
+    :return: The source of skills.py, also used as the skills prompt
+    """
+    source = ""  # filename:  skills.py
     for skill in skills:
-        prompt += f"""
+        source += f"""
 
 ##### Begin of {skill.name} #####
 
@@ -288,6 +307,18 @@ install via pip and use --quiet option.
 #### End of {skill.name} ####
 
         """
+    return source
+
+
+def get_skills_from_prompt(skills: List[Skill], work_dir: str) -> str:
+    """
+    Create a prompt with the content of all skills and write the skills to a file named skills.py in the work_dir.
+
+    :param skills: A dictionary skills
+    :return: A string containing the content of all skills
+    """
+
+    prompt = get_skills_source(skills)
 
     # check if work_dir exists
     if not os.path.exists(work_dir):
@@ -297,7 +328,7 @@ install via pip and use --quiet option.
     with open(os.path.join(work_dir, "skills.py"), "w", encoding="utf-8") as f:
         f.write(prompt)
 
-    return instruction + prompt
+    return SKILLS_INSTRUCTION + prompt
 
 
 def extract_successful_code_blocks(messages: List[Dict[str, str]]) -> List[str]:
@@ -331,12 +362,69 @@ def extract_successful_code_blocks(messages: List[Dict[str, str]]) -> List[str]:
 
 
 
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """
+    Count the tokens of a text for a model, estimating 4 characters per token when the
+    tokenizer is unavailable, e.g. offline without a cached encoding.
+    """
+    try:
+        return count_token(text, model)
+    except Exception:
+        return len(text) // 4
+
+
+def _history_lines(messages: List[Dict[str, Any]]) -> List[str]:
+    """Reduce agent history payloads to `sender: content` lines, dropping the metadata."""
+    lines = []
+    for message in messages:
+        inner = message.get("message", message)
+        content = inner.get("content") if isinstance(inner, dict) else inner
+        if not content:
+            continue
+        sender = message.get("sender") or (inner.get("name") if isinstance(inner, dict) else None)
+        sender = sender or inner.get("role", "agent")
+        lines.append(f"{sender}: {content}")
+    return lines
+
+
+def _chunk_lines(lines: List[str], max_tokens: int, model: str) -> List[str]:
+    chunks, current, current_tokens = [], [], 0
+    for line in lines:
+        tokens = count_tokens(line, model)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
 def summarize_chat_history(
-    task: str, messages: List[Dict[str, str]], client: ModelClient
+    task: str,
+    messages: List[Dict[str, str]],
+    client: ModelClient,
+    chunk_tokens: int = None,
+    max_workers: int = None,
+    on_delta: Optional[Callable[[str], None]] = None,
 ):
     """
     Summarize the chat history using the model endpoint and returning the response.
+
+    The history is reduced to sender and content and split into chunks of at most
+    `chunk_tokens` tokens. Chunks are summarized concurrently and the partial summaries are
+    reduced into the final summary, which is streamed to `on_delta` when given.
+
+    :param chunk_tokens: Token budget of a chunk. Defaults to AGENT_BUILDER_SUMMARY_CHUNK_TOKENS or 6000.
+    :param max_workers: Number of chunks summarized at once. Defaults to AGENT_BUILDER_SUMMARY_WORKERS or 4.
+    :param on_delta: Callable receiving the token deltas of the final summary.
     """
+    chunk_tokens = chunk_tokens or int(os.getenv("AGENT_BUILDER_SUMMARY_CHUNK_TOKENS", "6000"))
+    max_workers = max_workers or int(os.getenv("AGENT_BUILDER_SUMMARY_WORKERS", "4"))
+    config_list = getattr(client, "_config_list", None) or [{}]
+    model = config_list[0].get("model") or "gpt-4o"
+
     summarization_system_prompt = f"""
     You are a helpful assistant that is able to review the chat history between a set of agents (userproxy agents, assistants etc) as they try to address a given TASK and provide a summary. Be SUCCINCT but also comprehensive enough to allow others (who cannot see the chat history) understand and recreate the solution.
 
@@ -346,6 +434,57 @@ def summarize_chat_history(
     ===
     The summary should focus on extracting the actual solution to the task from the chat history (assuming the task was addressed) such that any other agent reading the summary will understand what the actual solution is. Use a neutral tone and DO NOT directly mention the agents. Instead only focus on the actions that were carried out (e.g. do not say 'assistant agent generated some code visualization code ..'  instead say say 'visualization code was generated ..'. The answer should be framed as a response to the user task. E.g. if the task is "What is the height of the Eiffel tower", the summary should be "The height of the Eiffel Tower is ...").
     """
+
+    def summarize(content: str, stream: bool = False) -> str:
+        summarization_prompt = [
+            {
+                "role": "system",
+                "content": summarization_system_prompt,
+            },
+            {
+                "role": "user",
+                "content": content,
+            },
+        ]
+        if not stream:
+            response = client.create(messages=summarization_prompt, cache_seed=None)
+            return response.choices[0].message.content
+        # the final summary is streamed as token deltas through the default IOStream
+        with IOStream.set_default(DeltaIOStream(on_delta=lambda _, delta: on_delta(delta))):
+            with streaming_speaker("summarizer"):
+                response = client.create(messages=summarization_prompt, cache_seed=None, stream=True)
+        return response.choices[0].message.content
+
+    chunks = _chunk_lines(_history_lines(messages), chunk_tokens, model)
+    while len(chunks) > 1:
+        # map: summarize every chunk concurrently, then reduce the partial summaries
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            partial_summaries = list(
+                executor.map(
+                    lambda chunk: summarize(f"Summarize this part of the chat history.\n{chunk}"),
+                    chunks,
+                )
+            )
+        chunks = _chunk_lines(partial_summaries, chunk_tokens, model)
+        if len(chunks) > 1 and len(chunks) >= len(partial_summaries):
+            # partial summaries don't shrink any further, reduce them as they are
+            chunks = ["\n".join(partial_summaries)]
+
+    history = chunks[0] if chunks else ""
+    return summarize(
+        f"Summarize the following chat history.\n{history}", stream=on_delta is not None
+    )
+
+def summarize_conversation(
+    previous_summary: str, messages: List[Dict[str, str]], client: ModelClient
+) -> str:
+    """
+    Fold messages into a rolling conversation summary using the model endpoint.
+    """
+    summarization_system_prompt = """
+    You maintain a running summary of a conversation between a user and an AI assistant. Update the summary with the new messages. Keep every fact, decision, preference and open question the assistant needs to continue the conversation, drop pleasantries and repetition. Be SUCCINCT and write in a neutral tone.
+    """
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
     summarization_prompt = [
         {
             "role": "system",
@@ -353,12 +492,13 @@ def summarize_chat_history(
         },
         {
             "role": "user",
-            "content": f"Summarize the following chat history. {str(messages)}",
+            "content": f"Current summary:\n{previous_summary or '(empty)'}\n\nNew messages:\n{transcript}",
         },
     ]
     response = client.create(messages=summarization_prompt, cache_seed=None)
     return response.choices[0].message.content
 
+
 def get_app_root() -> str:
     """
     Get the root directory of the application.
@@ -422,15 +562,15 @@ def test_model(model: Model):
 
 
 
-async def get_cached_response(redis,prompt: str):
+async def get_cached_response(redis, key: str):
     """Retrieve response from Redis cache"""
-    data =  await redis.get(prompt)
+    data =  await redis.get(key)
     return json.loads(data) if data else None
 
-async def cache_response(redis, prompt: str, response: str):
+async def cache_response(redis, key: str, response: Any, ttl: int = 3600):
     """Store response in Redis cache with expiration"""
     json_val = json.dumps(response)
-    await redis.set(prompt, json_val, ex=3600)
+    await redis.set(key, json_val, ex=ttl)
 
 def create_entity(dbmanager: DBManager, model: Any, model_class: Any, filters: dict = None):
     """Create a new entity"""
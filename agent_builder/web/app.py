@@ -1,18 +1,16 @@
 import asyncio
 import json
 import os
-import queue
 import threading
-import time
+import uuid
 
-import httpx
 from agent_builder.routes import wf_router, sk_router, ss_router, md_router, le_router, ag_router, kh_router
 from fastapi import APIRouter
 
 import redis.asyncio as redis_conn
-import traceback
 from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import Any, List, Optional, Tuple
 
 
 from agent_builder.utils.models import UserInput, CreateAgentResponse, BuildingBlocks
@@ -21,65 +19,110 @@ from agent_builder.utils.tools import extract_agent_parameters, create_retrieval
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 
-from agent_builder.manager.chatmanager import WebSocketConnectionManager
-from agent_builder.database import DBManager, workflow_from_id
-from agent_builder.utils import init_app_folders, md5_hash, cache_response, \
-    get_cached_response
+from agent_builder.manager.chatmanager import WebSocketConnectionManager, MessageDispatcher, SocketTransport
+from agent_builder.database import DBManager
+from agent_builder.utils import init_app_folders
 from loguru import logger
 
 
 from agent_builder.manager.chatmanager import ChatManager
-from agent_builder.datamodel import Response, Message
+from agent_builder.manager.run_executor import RunExecutor, RunHandle, RunCancelledError, RunStatus
+from agent_builder.manager.run_queue import QueuedRunExecutor, InMemoryRunQueue, run_queue_from_url
+from agent_builder.manager.worker import RunWorker
+from agent_builder.manager.workflow_runner import WorkflowRunner
+from agent_builder.manager.embedding_functions import FASTEMBED, embedding_registry
+from agent_builder.utils.semantic_cache import SemanticResponseCache
+from agent_builder.utils.response_cache import ResponseCache, SingleFlight, response_cache_key
+from agent_builder.utils.llm_clients import llm_client_registry
+from agent_builder.utils.kernel_pool import kernel_pool
+from agent_builder.utils.state_store import ConversationStateStore, InMemoryStateStore, RedisStateStore
+from agent_builder.datamodel import Message, Workflow
+
+managers = {"chat": None}
+
+websocket_manager = WebSocketConnectionManager()
+message_dispatcher = MessageDispatcher(
+    websocket_manager, max_queued=int(os.getenv("AGENT_BUILDER_SOCKET_QUEUE_SIZE", "1000"))
+)
+
+app_file_path = current_directory = Path(__file__).resolve().parent
+folders = init_app_folders(app_file_path)
+ui_folder_path = Path(__file__).resolve().parent / "ui"
 
-managers = {"chat": None, "user_prompt": ""}
-session = {}
-client = httpx.AsyncClient()
+database_engine_uri = folders["database_engine_uri"]
+dbmanager = DBManager(
+    engine_uri=database_engine_uri,
+    building_blocks_ttl=float(os.getenv("AGENT_BUILDER_BUILDING_BLOCKS_TTL", "60")),
+)
 
-message_queue = queue.Queue()
-active_connections = []
-active_connections_lock = asyncio.Lock()
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 
-websocket_manager = WebSocketConnectionManager(
-    active_connections=active_connections,
-    active_connections_lock=active_connections_lock
+workflow_runner = WorkflowRunner(dbmanager, folders["files_static_root"])
+
+
+def execute_session_workflow(message: Message,
+                             session_id: int,
+                             workflow_id: int,
+                             cancel_event: Optional[threading.Event] = None):
+    """Runs a workflow on provided message. Blocking, executed on the run executor."""
+    return workflow_runner.run(
+        message=message,
+        session_id=session_id,
+        workflow_id=workflow_id,
+        chat_manager=managers["chat"],
+        cancel_event=cancel_event,
+    )
+
+
+# with AGENT_BUILDER_RUN_QUEUE set, runs are executed by `agent-builder worker` processes
+RUN_QUEUE_URL = os.getenv("AGENT_BUILDER_RUN_QUEUE")
+run_queue = run_queue_from_url(RUN_QUEUE_URL) if RUN_QUEUE_URL else None
+run_executor = (
+    QueuedRunExecutor(
+        run_queue,
+        on_event=message_dispatcher.send,
+        start_timeout=float(os.getenv("AGENT_BUILDER_RUN_START_TIMEOUT", "300")),
+        idle_timeout=float(os.getenv("AGENT_BUILDER_RUN_IDLE_TIMEOUT", "120")),
+    )
+    if run_queue is not None
+    else RunExecutor.from_env(run_workflow=execute_session_workflow)
 )
+single_flight = SingleFlight()
 
-def message_handler():
-    while True:
-        message = message_queue.get()
-        logger.info(
-            " ** Processing Agent Message on Queue: Active Connections: "
-            + str([client_id for _, client_id in websocket_manager.active_connections])
-            + " **"
-        )
+CACHE_HISTORY_TURNS = int(os.getenv("AGENT_BUILDER_CACHE_HISTORY_TURNS", "4"))
+CACHE_REPLAY = os.getenv("AGENT_BUILDER_CACHE_REPLAY", "true").lower() == "true"
+CACHE_REPLAY_DELAY = float(os.getenv("AGENT_BUILDER_CACHE_REPLAY_DELAY", "0"))
 
-        for connection, socket_client_id in websocket_manager.active_connections:
-            if message.connection_id == socket_client_id:
-                logger.info(
-                    f"Sending message to connection_id: {message.connection_id}. Connection ID: {socket_client_id}"
-                )
 
-                # if message.data["content"] == "UPDATE_CONTEXT" or message.data["content"] == "":
-                #     message.data["content"] = "Sorry !, I could not find the answer in my knowledge hub."
-                asyncio.run(websocket_manager.send_message(message, connection))
-            else:
-                logger.info(
-                    f"Skipping message for connection_id: {message['connection_id']}. Connection ID: {socket_client_id}"
-                )
+def init_conversation_store(redis_client) -> ConversationStateStore:
+    """Build the create_agent conversation state store. Use AGENT_BUILDER_STATE_STORE=redis with --workers > 1"""
+    ttl = int(os.getenv("AGENT_BUILDER_STATE_TTL", "3600"))
+    if os.getenv("AGENT_BUILDER_STATE_STORE", "memory").lower() == "redis":
+        return RedisStateStore(redis_client, ttl=ttl)
+    return InMemoryStateStore(
+        ttl=ttl, max_entries=int(os.getenv("AGENT_BUILDER_STATE_MAX_ENTRIES", "10000"))
+    )
 
-        message_queue.task_done()
 
-message_handler_thread = threading.Thread(target=message_handler, daemon=True)
-message_handler_thread.start()
+def init_semantic_cache() -> Optional[SemanticResponseCache]:
+    """
+    Build the semantic response cache from the AGENT_BUILDER_SEMANTIC_CACHE_* environment variables.
+    The cache is opt-in with AGENT_BUILDER_SEMANTIC_CACHE=true and loads its model on the first lookup.
+    """
+    if os.getenv("AGENT_BUILDER_SEMANTIC_CACHE", "false").lower() != "true":
+        return None
+    model_name = os.getenv("AGENT_BUILDER_SEMANTIC_CACHE_MODEL", "BAAI/bge-small-en-v1.5")
 
-app_file_path = current_directory = Path(__file__).resolve().parent
-folders = init_app_folders(app_file_path)
-ui_folder_path = Path(__file__).resolve().parent / "ui"
+    def embedding_function(texts: List[str]):
+        return embedding_registry.get(model_name, backend=FASTEMBED)(texts)
 
-database_engine_uri = folders["database_engine_uri"]
-dbmanager = DBManager(engine_uri=database_engine_uri)
+    return SemanticResponseCache(
+        embedding_function=embedding_function,
+        similarity_threshold=float(os.getenv("AGENT_BUILDER_SEMANTIC_CACHE_THRESHOLD", "0.92")),
+        ttl=float(os.getenv("AGENT_BUILDER_SEMANTIC_CACHE_TTL", "3600")),
+        max_entries=int(os.getenv("AGENT_BUILDER_SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+    )
 
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -87,13 +130,41 @@ async def lifespan(app: FastAPI):
     global redis
     redis = await redis_conn.Redis(host=REDIS_HOST, port=6379, decode_responses=True)
     print("✅ Redis connected!")
-    managers["chat"] = ChatManager(message_queue=message_queue)
+    managers["conversation_store"] = init_conversation_store(redis)
+    managers["response_cache"] = ResponseCache(
+        redis=redis,
+        max_entries=int(os.getenv("AGENT_BUILDER_RESPONSE_CACHE_SIZE", "1024")),
+        ttl=int(os.getenv("AGENT_BUILDER_RESPONSE_CACHE_TTL", "3600")),
+    )
+    message_dispatcher.start()
+    managers["chat"] = ChatManager(send_message_function=message_dispatcher.dispatch)
     dbmanager.create_db_and_tables()
+    run_executor.start()
+    workflow_runner.workspace_manager.start()
+    in_process_worker = None
+    if isinstance(run_queue, InMemoryRunQueue):
+        in_process_worker = RunWorker(run_queue, workflow_runner)
+        in_process_worker.start()
+    managers["semantic_cache"] = init_semantic_cache()
+    if managers["semantic_cache"] is not None:
+        # edits of linked agents, skills and models do not change the workflow's updated_at
+        dbmanager.add_write_listener(managers["semantic_cache"].invalidate_user)
+    await asyncio.to_thread(embedding_registry.warmup_from_env)
 
 
     yield
     # Close all active connections
+    await message_dispatcher.stop()
     await websocket_manager.disconnect_all()
+    run_executor.shutdown(wait=False)
+    workflow_runner.history_manager.shutdown()
+    workflow_runner.workspace_manager.stop()
+    llm_client_registry.close()
+    kernel_pool.close()
+    if embedding_registry.cache is not None:
+        embedding_registry.cache.flush()
+    if in_process_worker is not None:
+        in_process_worker.stop(timeout=0)
     await redis.close()
     print("***** App stopped *****")
 
@@ -135,45 +206,65 @@ for router in routers:
     api = router(api, dbmanager)
 
 
-@api.post("/sessions/{session_id}/workflow/{workflow_id}/run", tags=["Workflow"])
-async def run_session_workflow(message: Message, session_id: int, workflow_id: int):
-    """Runs a workflow on provided message"""
+async def wait_for_run(handle: RunHandle):
+    """Awaits a run without blocking the event loop and returns its response"""
     try:
-        user_message_history = (
-            dbmanager.get(
-                Message,
-                filters={"user_id": message.user_id, "session_id": message.session_id},
-                return_json=True,
-            ).data
-            if session_id is not None
-            else []
-        )
-        # save incoming message
-        dbmanager.upsert(message)
-        user_dir = os.path.join(
-            folders["files_static_root"], "user", md5_hash(message.user_id)
-        )
-
-        os.makedirs(user_dir, exist_ok=True)
-        workflow = workflow_from_id(workflow_id, dbmanager=dbmanager)
-        agent_response: Message = managers["chat"].chat(
-            message=message,
-            history=user_message_history,
-            user_dir=user_dir,
-            workflow=workflow,
-            connection_id=message.connection_id,
-        )
-
-        response: Response = dbmanager.upsert(agent_response)
-        return response.model_dump(mode="json")
+        return await handle.result()
+    except RunCancelledError as ex_error:
+        return {
+            "status": False,
+            "message": "Run cancelled: " + str(ex_error),
+            "data": handle.to_dict(),
+        }
     except Exception as ex_error:
-        print(traceback.format_exc())
         return {
             "status": False,
             "message": "Error occurred while processing message: " + str(ex_error),
+            "data": handle.to_dict(),
         }
 
 
+@api.post("/sessions/{session_id}/workflow/{workflow_id}/run", tags=["Workflow"])
+async def run_session_workflow(message: Message, session_id: int, workflow_id: int, wait: bool = True):
+    """Runs a workflow on provided message. With wait=false the run id is returned immediately."""
+    handle = run_executor.submit_workflow(
+        message=message, session_id=session_id, workflow_id=workflow_id
+    )
+    if not wait:
+        return {"status": True, "message": "Run queued", "data": handle.to_dict()}
+    return await wait_for_run(handle)
+
+
+@api.get("/runs/{run_id}", tags=["Workflow"])
+async def get_run(run_id: str):
+    """Get the status of a workflow run"""
+    handle = run_executor.get(run_id)
+    if handle is None:
+        return {"status": False, "message": f"Run {run_id} not found"}
+    data = handle.to_dict()
+    if handle.status == RunStatus.completed:
+        data["result"] = handle.future.result()
+    return {
+        "status": True,
+        "message": "Run retrieved successfully",
+        "data": data,
+    }
+
+
+@api.post("/runs/{run_id}/cancel", tags=["Workflow"])
+async def cancel_run(run_id: str):
+    """Cancel a queued or running workflow run"""
+    handle = run_executor.get(run_id)
+    if handle is None:
+        return {"status": False, "message": f"Run {run_id} not found"}
+    cancelled = handle.cancel()
+    return {
+        "status": cancelled,
+        "message": "Run cancellation requested" if cancelled else "Run has already finished",
+        "data": handle.to_dict(),
+    }
+
+
 @api.get("/version", tags=["Admin"])
 async def get_version():
     return {
@@ -184,44 +275,65 @@ async def get_version():
     }
 
 
+@api.get("/cache/stats", tags=["Admin"])
+async def get_cache_stats():
+    """Get hit, miss and near miss counts of the semantic response cache"""
+    semantic_cache = managers.get("semantic_cache")
+    if semantic_cache is None:
+        return {"status": False, "message": "Semantic cache is disabled"}
+    return {
+        "status": True,
+        "message": "Cache stats retrieved successfully",
+        "data": semantic_cache.get_stats(),
+    }
+
+
 @api.post("/create_agent", tags=["Custom Agents"])
 async def create_retriever_agent(user_input: UserInput):
     """Extracts agent parameters from user input and returns structured JSON response."""
     session_id = user_input.session_id
+    conversation_store: ConversationStateStore = managers["conversation_store"]
 
-    if session_id not in session:
-        session[session_id] = {
-            "conversation_state": initialize_conversation_state(),
-            "agents_created": []
-        }
+    state = await conversation_store.get(session_id) or {
+        "conversation_state": initialize_conversation_state(),
+        "agents_created": []
+    }
 
-    conversation_state = session[session_id]["conversation_state"]
+    conversation_state = state["conversation_state"]
 
     structured_prompt = generate_prompt(conversation_state)
 
     if structured_prompt["status"] == "final_confirmation":
-        session[session_id]["agents_created"].append(structured_prompt)
-
-        session[session_id]["conversation_state"] = initialize_conversation_state()
-        agent = create_retrieval_agent(agent_name=structured_prompt["agent_name"],
-                                       docs_path=structured_prompt["knowledge_hub"],
-                                       model_name=structured_prompt["llm_model"]
-                                       )
+        state["agents_created"].append(structured_prompt)
+
+        state["conversation_state"] = initialize_conversation_state()
+        await conversation_store.set(session_id, state)
+        agent = await asyncio.to_thread(
+            create_retrieval_agent,
+            agent_name=structured_prompt["agent_name"],
+            docs_path=structured_prompt["knowledge_hub"],
+            model_name=structured_prompt["llm_model"]
+        )
         return CreateAgentResponse(status="complete", content=agent)
 
-    response_json = extract_agent_parameters(user_input.user_input, conversation_state)
+    response_json = await asyncio.to_thread(
+        extract_agent_parameters, user_input.user_input, conversation_state
+    )
 
     try:
         response_data = json.loads(response_json)
         if response_data["status"] == "final_confirmation":
             content = response_data["content"]
 
-            session[session_id]["agents_created"].append(response_data)
-            session[session_id]["conversation_state"] = initialize_conversation_state()
-            agent = create_retrieval_agent(agent_name=content["agent_name"],
-                                           docs_path=content["knowledge_hub"],
-                                           model_name=content["llm_model"]
-                                           )
+            state["agents_created"].append(response_data)
+            state["conversation_state"] = initialize_conversation_state()
+            await conversation_store.set(session_id, state)
+            agent = await asyncio.to_thread(
+                create_retrieval_agent,
+                agent_name=content["agent_name"],
+                docs_path=content["knowledge_hub"],
+                model_name=content["llm_model"]
+            )
             return CreateAgentResponse(status="complete", content=agent)
         else:
             content = response_data["further_question"]
@@ -238,6 +350,7 @@ async def create_retriever_agent(user_input: UserInput):
                 if detail in content:
                     conversation_state[detail] = content[detail]
 
+            await conversation_store.set(session_id, state)
             return CreateAgentResponse(
                 status="further_question",
                 content=content["next_question"]
@@ -250,66 +363,164 @@ async def create_retriever_agent(user_input: UserInput):
 
 
 @api.get("/building_blocks", tags=["Admin"])
-async def get_building_blocks() -> BuildingBlocks:
+async def get_building_blocks(user_id: str = "guestuser@hdfcbank.com") -> BuildingBlocks:
+    """List the skills, models, agents, knowledge hubs and workflows of a user in one query"""
+    building_blocks = await asyncio.to_thread(dbmanager.get_building_blocks, user_id)
+    return BuildingBlocks(**building_blocks)
 
-    skills =  await client.get("http://localhost:8081/api/skills?user_id=guestuser@hdfcbank.com")
-    models = await client.get("http://localhost:8081/api/models?user_id=guestuser@hdfcbank.com")
 
-    agents =await client.get("http://localhost:8081/api/agents?user_id=guestuser@hdfcbank.com")
-    workflows = await client.get("http://localhost:8081/api/workflows?user_id=guestuser@hdfcbank.com")
-    knowledge_hub = await client.get("http://localhost:8081/api/knowledgehub?user_id=guestuser@hdfcbank.com")
-
-    response = BuildingBlocks(skills=skills.json()["data"], models=models.json()["data"],
-                              agents=agents.json()["data"], knowledgehub=knowledge_hub.json()["data"] ,
-                              workflows=workflows.json()["data"])
-    return response
 
 
+# manage websocket connections
 
+def build_response_cache_key(message: Message, workflow_id: int, prompt: str) -> Tuple[str, Any, bool]:
+    """
+    Builds the response cache key from the workflow version, prompt and recent session history.
+    Also returns the workflow version and whether the session has history, which scope the semantic cache.
+    Only the workflow's updated_at and the last CACHE_HISTORY_TURNS messages are read.
+    """
+    workflow_updated_at = dbmanager.get_updated_at(Workflow, workflow_id)
+    history = (
+        dbmanager.get_recent_messages(
+            message.user_id, message.session_id, limit=max(CACHE_HISTORY_TURNS, 1)
+        )
+        if message.session_id is not None
+        else []
+    )
+    cache_key = response_cache_key(
+        workflow_id=workflow_id,
+        workflow_updated_at=workflow_updated_at,
+        prompt=prompt,
+        history=history,
+        history_turns=CACHE_HISTORY_TURNS,
+    )
+    return cache_key, workflow_updated_at, bool(history)
+
+
+async def replay_cached_response(response: dict, client_id: str):
+    """Replays the agent messages recorded with a cached response to a client"""
+    if not CACHE_REPLAY:
+        return
+    meta = (response.get("data") or {}).get("meta") or {}
+    if isinstance(meta, str):
+        meta = json.loads(meta)
+    for message_payload in meta.get("messages", []):
+        await message_dispatcher.send(
+            {
+                "type": "agent_message",
+                "data": {**message_payload, "connection_id": client_id, "replayed": True},
+                "connection_id": client_id,
+            }
+        )
+        if CACHE_REPLAY_DELAY:
+            await asyncio.sleep(CACHE_REPLAY_DELAY)
 
-# manage websocket connections
 
 async def process_socket_message(data: dict, websocket: WebSocket, client_id: str):
     # print(f"Client says: {data['type']}")
     print(f"Client says->: {data}")
     if data["type"] == "user_message":
+        # route agent events for this run to the socket that asked for it
+        data["data"]["connection_id"] = client_id
         user_message = Message(**data["data"])
         session_id = data["data"].get("session_id", None)
         workflow_id = data["data"].get("workflow_id", None)
-        managers["user_prompt"] = data['data'].get("content", None)
-        cached_response = await get_cached_response(redis, data['data'].get("content", None))
+        prompt = data['data'].get("content", None)
+        response_cache: ResponseCache = managers["response_cache"]
+        cache_key, workflow_version, has_history = await asyncio.to_thread(
+            build_response_cache_key, user_message, workflow_id, prompt
+        )
+        cached_response = await response_cache.get(cache_key)
+        semantic_cache = managers.get("semantic_cache")
+        prompt_embedding = None
+        # answers depend on the conversation, which the semantic cache does not compare
+        if not cached_response and semantic_cache is not None and prompt and not has_history:
+            try:
+                prompt_embedding = await asyncio.to_thread(semantic_cache.embed, prompt)
+                cached_response = await asyncio.to_thread(
+                    semantic_cache.lookup, workflow_id, prompt_embedding, workflow_version
+                )
+            except Exception as ex_error:
+                logger.warning(f"Semantic cache lookup failed: {ex_error}")
+                prompt_embedding = None
         print(f"#### cache response : {cached_response}")
+
+        async def run_and_cache():
+            handle = run_executor.submit_workflow(
+                message=user_message, session_id=session_id, workflow_id=workflow_id
+            )
+            await message_dispatcher.send(
+                {"type": "run_status", "data": handle.to_dict(), "connection_id": client_id}
+            )
+            run_response = await wait_for_run(handle)
+            if run_response["status"] and run_response["data"]["content"]:
+                print(f"Response : {run_response['data']['content']}")
+                if run_response["data"]["content"] not in ("UPDATE CONTEXT", "TERMINATE", ""):
+                    await response_cache.set(cache_key, run_response)
+                    if prompt_embedding is not None:
+                        semantic_cache.store(
+                            workflow_id,
+                            prompt,
+                            prompt_embedding,
+                            run_response,
+                            workflow_version,
+                            user_id=user_message.user_id,
+                        )
+            return run_response
+
         if cached_response:
-            time.sleep(5)
+            await replay_cached_response(cached_response, client_id)
             response = cached_response
         else:
-            response = await run_session_workflow(
-                        message=user_message, session_id=session_id, workflow_id=workflow_id
-            )
-            user_prompt = managers.get("user_prompt", None)
-            if response["status"] and response["data"]["content"]:
-                print(f"Response : {response['data']['content']}")
-                if response["data"]["content"] != "UPDATE CONTEXT" or response["data"]["content"] != "TERMINATE" or response["data"]["content"] != "":
-                    await cache_response(redis, user_prompt, response)
+            # identical concurrent misses wait on the run already in flight
+            response, shared = await single_flight.do(cache_key, run_and_cache)
+            if shared:
+                await replay_cached_response(response, client_id)
 
         response_socket_message = {
             "type": "agent_response",
             "data": response,
             "connection_id": client_id,
         }
-        await websocket_manager.send_message(response_socket_message, websocket)
+        await message_dispatcher.send(response_socket_message)
+    elif data["type"] == "cancel_run":
+        handle = run_executor.get(data["data"].get("run_id"))
+        if handle is not None:
+            handle.cancel()
+            await message_dispatcher.send(
+                {"type": "run_status", "data": handle.to_dict(), "connection_id": client_id}
+            )
+
+
+def log_task_error(task: asyncio.Task) -> None:
+    """Done callback logging the exception of a fire and forget task, nobody awaits its result"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.opt(exception=task.exception()).error(f"Error while processing socket message: {task.exception()}")
 
 
 @api.websocket("/ws/")
 async def websocket_endpoint(websocket: WebSocket):
 
-    await websocket_manager.connect(websocket, "2")
+    client_id = str(uuid.uuid4())
+    transport = SocketTransport.from_query_params(websocket.query_params)
+    await websocket_manager.connect(websocket, client_id)
+    message_dispatcher.register(client_id, websocket, transport)
+    await message_dispatcher.send(
+        {"type": "connection_ack", "connection_id": client_id, "transport": transport.describe()}
+    )
+    # keep receiving while runs are in flight so clients can cancel them
+    pending_tasks = set()
     try:
         while True:
             data = await websocket.receive_json()
-            await process_socket_message(data, websocket, 2)
+            task = asyncio.create_task(process_socket_message(data, websocket, client_id))
+            pending_tasks.add(task)
+            task.add_done_callback(pending_tasks.discard)
+            task.add_done_callback(log_task_error)
     except WebSocketDisconnect:
-        print(f"Client #{2} is disconnected")
+        print(f"Client #{client_id} is disconnected")
+    finally:
+        await message_dispatcher.unregister(client_id)
         await websocket_manager.disconnect(websocket)
 
 
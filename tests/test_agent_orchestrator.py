@@ -0,0 +1,291 @@
+import threading
+from copy import deepcopy
+from datetime import datetime, timedelta
+
+import pytest
+from autogen.io import IOStream
+from autogen.messages.client_messages import StreamMessage
+
+from agent_builder.datamodel import Skill
+from agent_builder.manager.agent_orchestrator import AgentOrchestrator, WorkflowTemplateCache, workflow_fingerprint
+from agent_builder.manager.run_executor import RunCancelledError
+
+START = datetime(2026, 1, 1)
+
+
+def agent_spec(agent_id, name, agent_type="assistant", **config):
+    return {
+        "id": agent_id,
+        "type": agent_type,
+        "config": {"name": name, "llm_config": False, "code_execution_config": "none", **config},
+        "skills": [],
+        "models": [],
+        "agents": [],
+    }
+
+
+def two_agent_workflow():
+    return {
+        "id": 1,
+        "type": "twoagents",
+        "sender": agent_spec(1, "user_proxy", "userproxy", default_auto_reply="go on"),
+        "receiver": agent_spec(2, "assistant"),
+    }
+
+
+def messages(*pairs):
+    return [
+        {"id": index + 1, "role": role, "content": content, "session_id": 1,
+         "created_at": START + timedelta(minutes=index)}
+        for index, (role, content) in enumerate(pairs)
+    ]
+
+
+def script(agent, *replies):
+    """Make an agent answer with the given replies in turn, instead of calling an LLM."""
+    replies = list(replies)
+
+    def reply(recipient, messages=None, sender=None, config=None):
+        return True, replies.pop(0)
+
+    agent.register_reply([object, None], reply, position=0)
+
+
+def build(tmp_path, workflow, history, **kwargs):
+    return AgentOrchestrator(
+        workflow, history=history, work_dir=str(tmp_path), template_cache=WorkflowTemplateCache(0), **kwargs
+    )
+
+
+def transcripts(orchestrator):
+    return [
+        [(message["role"], message["content"]) for message in conversation]
+        for agent in (orchestrator.sender, orchestrator.receiver)
+        for conversation in agent.chat_messages.values()
+    ]
+
+
+def test_warm_runs_see_the_same_context_as_cold_runs(tmp_path):
+    history = messages(("user", "one"), ("assistant", "first answer"))
+    warm = build(tmp_path / "warm", two_agent_workflow(), history)
+    script(warm.receiver, "working on it", "second answer TERMINATE")
+    warm.run("two")
+    # the inner turns of the run stay in the warm agents until the next checkout
+    assert ("assistant", "working on it") in transcripts(warm)[1]
+
+    stored = messages(("user", "one"), ("assistant", "first answer"), ("user", "two"), ("assistant", "second answer"))
+    warm.prepare_run(history=stored)
+    cold = build(tmp_path / "cold", two_agent_workflow(), stored)
+
+    assert transcripts(warm) == transcripts(cold)
+    assert transcripts(cold)[1] == [
+        ("user", "one"), ("assistant", "first answer"), ("user", "two"), ("assistant", "second answer"),
+    ]
+    assert warm.history_length == cold.history_length == 4
+
+
+@pytest.mark.parametrize("history", [[], messages(("user", "one"))])
+def test_prepare_run_resets_the_run_state(tmp_path, history):
+    orchestrator = build(tmp_path, two_agent_workflow(), [])
+    script(orchestrator.receiver, "answer TERMINATE")
+    orchestrator.run("question")
+    assert orchestrator.agent_history
+
+    orchestrator.prepare_run(connection_id="socket", history=history)
+    assert orchestrator.agent_history == []
+    assert orchestrator.connection_id == "socket"
+    assert orchestrator.history_length == len(history)
+    assert sum(len(conversation) for conversation in orchestrator.receiver.chat_messages.values()) == len(history)
+
+
+def versioned_workflow():
+    workflow = two_agent_workflow()
+    workflow["updated_at"] = START
+    workflow["receiver"]["updated_at"] = START
+    workflow["receiver"]["skills"] = [Skill(id=1, name="skill", content="def skill(): pass", updated_at=START)]
+    workflow["receiver"]["models"] = [{"id": 1, "updated_at": START}]
+    return workflow
+
+
+def test_fingerprints_change_with_any_linked_entity():
+    workflow = versioned_workflow()
+    fingerprint = workflow_fingerprint(workflow)
+    assert fingerprint == workflow_fingerprint(deepcopy(workflow))
+
+    later = START + timedelta(seconds=1)
+    edits = [
+        lambda workflow: workflow.update(updated_at=later),
+        lambda workflow: workflow["receiver"].update(updated_at=later),
+        lambda workflow: workflow["receiver"]["models"][0].update(updated_at=later),
+        lambda workflow: setattr(workflow["receiver"]["skills"][0], "updated_at", later),
+    ]
+    for edit in edits:
+        edited = deepcopy(workflow)
+        edit(edited)
+        assert workflow_fingerprint(edited) != fingerprint
+
+
+def test_workflows_not_loaded_from_the_database_have_no_fingerprint():
+    workflow = versioned_workflow()
+    del workflow["id"]
+    assert workflow_fingerprint(workflow) is None
+
+    workflow = versioned_workflow()
+    workflow["receiver"]["skills"] = [{"name": "unsaved"}]
+    assert workflow_fingerprint(workflow) is None
+
+
+def test_sessions_of_a_workflow_share_its_templates(tmp_path, monkeypatch):
+    cache = WorkflowTemplateCache(max_entries=1)
+    compiled = []
+    compile_workflow = AgentOrchestrator.compile_workflow
+    monkeypatch.setattr(
+        AgentOrchestrator, "compile_workflow",
+        lambda self, workflow: compiled.append(workflow["id"]) or compile_workflow(self, workflow),
+    )
+
+    first = AgentOrchestrator(versioned_workflow(), history=[], work_dir=str(tmp_path / "1"), template_cache=cache)
+    second = AgentOrchestrator(versioned_workflow(), history=[], work_dir=str(tmp_path / "2"), template_cache=cache)
+    assert compiled == [1]
+    assert cache.get_stats() == {"entries": 1, "hits": 1, "misses": 1}
+    # every session still gets its own agents
+    assert first.receiver is not second.receiver
+
+    edited = versioned_workflow()
+    edited["receiver"]["updated_at"] = START + timedelta(seconds=1)
+    AgentOrchestrator(edited, history=[], work_dir=str(tmp_path / "3"), template_cache=cache)
+    # the least recently used version is evicted
+    AgentOrchestrator(versioned_workflow(), history=[], work_dir=str(tmp_path / "4"), template_cache=cache)
+    assert compiled == [1, 1, 1]
+    assert cache.get_stats()["entries"] == 1
+
+
+def test_a_cache_without_entries_always_compiles(tmp_path):
+    compiled = []
+    cache = WorkflowTemplateCache(max_entries=0)
+    for _ in range(2):
+        cache.get_or_compile(versioned_workflow(), lambda: compiled.append(1) or {})
+    assert len(compiled) == 2
+    assert cache.get_stats() == {"entries": 0, "hits": 0, "misses": 0}
+
+
+def stream(agent, *tokens):
+    """Make an agent stream its reply token by token, the way the model client does with `stream` enabled."""
+
+    def reply(recipient, messages=None, sender=None, config=None):
+        for token in tokens:
+            IOStream.get_default().send(StreamMessage(content=token))
+        return True, "".join(tokens)
+
+    agent.register_reply([object, None], reply, position=0)
+
+
+def test_token_deltas_are_sent_before_the_complete_message(tmp_path):
+    sent = []
+    orchestrator = build(tmp_path, two_agent_workflow(), [], send_message_function=sent.append, connection_id="socket")
+    stream(orchestrator.receiver, "Hello", " there", " TERMINATE")
+    orchestrator.run("hi")
+
+    events = [(message.type, message.data.get("sender")) for message in sent]
+    deltas = [message.data["delta"] for message in sent if message.type == "agent_message_delta"]
+    assert deltas == ["Hello", " there", " TERMINATE"]
+    assert events.index(("agent_message", "assistant")) > events.index(("agent_message_delta", "assistant"))
+    assert sent[-1].type == "agent_message"
+    assert sent[-1].data["message"]["content"] == "Hello there TERMINATE"
+
+
+def test_cancelling_interrupts_a_streamed_reply(tmp_path):
+    sent = []
+    orchestrator = build(
+        tmp_path, two_agent_workflow(), [], send_message_function=sent.append, connection_id="socket",
+        cancel_event=threading.Event(),
+    )
+
+    def reply(recipient, messages=None, sender=None, config=None):
+        IOStream.get_default().send(StreamMessage(content="Hel"))
+        orchestrator.cancel_event.set()
+        IOStream.get_default().send(StreamMessage(content="lo"))
+        return True, "Hello"
+
+    orchestrator.receiver.register_reply([object, None], reply, position=0)
+    with pytest.raises(RunCancelledError):
+        orchestrator.run("hi")
+    assert [message.data["delta"] for message in sent if message.type == "agent_message_delta"] == ["Hel"]
+
+
+def parallel_workflow(merger=True):
+    workflow = {
+        "id": 2,
+        "type": "parallel",
+        "sender": agent_spec(1, "user_proxy", "userproxy", default_auto_reply="go on"),
+        "receivers": [agent_spec(2, "researcher"), agent_spec(3, "writer")],
+    }
+    if merger:
+        workflow["merger"] = agent_spec(4, "merger")
+    return workflow
+
+
+def test_parallel_runs_fan_out_to_every_branch(tmp_path):
+    orchestrator = build(tmp_path, parallel_workflow(), [])
+    # both branches must be in flight at once to pass the barrier
+    barrier = threading.Barrier(2, timeout=5)
+    received = {}
+    for _, receiver in orchestrator.branches:
+        def reply(recipient, messages=None, sender=None, config=None):
+            received[recipient.name] = messages[-1]["content"]
+            barrier.wait()
+            return True, f"{recipient.name} result TERMINATE"
+
+        receiver.register_reply([object, None], reply, position=0)
+    merged = []
+
+    def merge(recipient, messages=None, sender=None, config=None):
+        merged.append(messages[-1]["content"])
+        return True, "merged answer"
+
+    orchestrator.merger.register_reply([object, None], merge, position=0)
+    # retriever senders generate their message from the collection in _initiate_chat
+    initiated = []
+    initiate_chat = orchestrator._initiate_chat
+    orchestrator._initiate_chat = lambda sender, receiver, *args, **kwargs: (
+        initiated.append(receiver.name) or initiate_chat(sender, receiver, *args, **kwargs)
+    )
+
+    orchestrator.run("write a report")
+
+    assert received == {"researcher": "write a report", "writer": "write a report"}
+    assert sorted(initiated) == ["researcher", "writer"]
+    assert len(merged) == 1
+    assert "### researcher\nresearcher result" in merged[0]
+    assert "### writer\nwriter result" in merged[0]
+    assert orchestrator.agent_history[-1]["sender"] == "merger"
+    assert orchestrator.agent_history[-1]["message"]["content"] == "merged answer"
+
+
+def test_parallel_runs_without_merger_answer_with_the_combined_results(tmp_path):
+    orchestrator = build(tmp_path, parallel_workflow(merger=False), [])
+    for _, receiver in orchestrator.branches:
+        script(receiver, f"{receiver.name} result TERMINATE")
+
+    orchestrator.run("write a report")
+
+    answer = orchestrator.agent_history[-1]["message"]["content"]
+    assert "### researcher\nresearcher result" in answer
+    assert "### writer\nwriter result" in answer
+
+
+def test_history_is_loaded_into_every_branch(tmp_path):
+    history = messages(("user", "one"), ("assistant", "first answer"))
+    orchestrator = build(tmp_path, parallel_workflow(), history)
+
+    for sender, receiver in orchestrator.branches:
+        assert [(m["role"], m["content"]) for m in receiver.chat_messages[sender]] == [
+            ("user", "one"), ("assistant", "first answer"),
+        ]
+        assert [(m["role"], m["content"]) for m in sender.chat_messages[receiver]] == [
+            ("assistant", "one"), ("user", "first answer"),
+        ]
+    # branch conversations are independent, every branch has its own sender
+    senders = [sender for sender, _ in orchestrator.branches]
+    assert len(set(map(id, senders))) == len(senders)
+    assert all(sender is not orchestrator.sender for sender in senders)
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+from sqlmodel import SQLModel
+
+from agent_builder.database import DBManager
+from agent_builder.datamodel import Agent, Model, Skill, Workflow
+
+
+@pytest.fixture
+def dbmanager(tmp_path):
+    dbmanager = DBManager(engine_uri=f"sqlite:///{tmp_path / 'database.sqlite'}")
+    SQLModel.metadata.create_all(dbmanager.engine)
+    return dbmanager
+
+
+def count_queries(dbmanager, monkeypatch):
+    queries = []
+    get_items = dbmanager.get_items
+    monkeypatch.setattr(
+        dbmanager, "get_items", lambda model_class, *args, **kwargs: (
+            queries.append(model_class) or get_items(model_class, *args, **kwargs)
+        )
+    )
+    return queries
+
+
+def test_building_blocks_of_a_user_are_loaded_together(dbmanager):
+    dbmanager.upsert(Skill(name="skill", content="def skill(): pass", user_id="user"))
+    dbmanager.upsert(Model(model="gpt-4", user_id="user"))
+    dbmanager.upsert(Agent(user_id="user", config={"name": "agent"}))
+    dbmanager.upsert(Workflow(name="workflow", description="workflow", user_id="user"))
+    dbmanager.upsert(Skill(name="other", content="def other(): pass", user_id="other"))
+
+    building_blocks = dbmanager.get_building_blocks("user")
+    assert set(building_blocks) == {"skills", "models", "agents", "knowledgehub", "workflows"}
+    assert [skill["name"] for skill in building_blocks["skills"]] == ["skill"]
+    assert [model["model"] for model in building_blocks["models"]] == ["gpt-4"]
+    assert [agent["config"]["name"] for agent in building_blocks["agents"]] == ["agent"]
+    assert [workflow["name"] for workflow in building_blocks["workflows"]] == ["workflow"]
+    assert building_blocks["knowledgehub"] == []
+
+
+def test_building_blocks_are_cached_until_the_user_writes(dbmanager, monkeypatch):
+    queries = count_queries(dbmanager, monkeypatch)
+    dbmanager.get_building_blocks("user")
+    dbmanager.get_building_blocks("other")
+    assert dbmanager.get_building_blocks("user")["skills"] == []
+    assert len(queries) == 10
+
+    dbmanager.upsert(Skill(name="skill", content="def skill(): pass", user_id="user"))
+    assert [skill["name"] for skill in dbmanager.get_building_blocks("user")["skills"]] == ["skill"]
+    # the other user's entry is kept
+    dbmanager.get_building_blocks("other")
+    assert len(queries) == 15
+
+    dbmanager.delete(Skill, filters={"user_id": "user"})
+    assert dbmanager.get_building_blocks("user")["skills"] == []
+    assert len(queries) == 20
+
+
+def test_writes_not_scoped_to_a_user_clear_every_entry(dbmanager, monkeypatch):
+    queries = count_queries(dbmanager, monkeypatch)
+    dbmanager.get_building_blocks("user")
+    dbmanager.get_building_blocks("other")
+
+    dbmanager.delete(Skill, filters={"name": "skill"})
+    dbmanager.get_building_blocks("user")
+    dbmanager.get_building_blocks("other")
+    assert len(queries) == 20
+
+
+def test_cached_building_blocks_expire_after_the_ttl(tmp_path, monkeypatch):
+    dbmanager = DBManager(engine_uri=f"sqlite:///{tmp_path / 'database.sqlite'}", building_blocks_ttl=10)
+    SQLModel.metadata.create_all(dbmanager.engine)
+    queries = count_queries(dbmanager, monkeypatch)
+    dbmanager.get_building_blocks("user")
+    dbmanager.get_building_blocks("user")
+    assert len(queries) == 5
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    dbmanager.get_building_blocks("user")
+    assert len(queries) == 10
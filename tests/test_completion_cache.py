@@ -0,0 +1,138 @@
+import autogen
+import pytest
+
+from agent_builder.manager import agent_orchestrator
+from agent_builder.manager.agent_orchestrator import AgentOrchestrator
+from agent_builder.manager.agents import ExtendedConversableAgent, ExtendedGroupChatManager
+from agent_builder.utils import completion_cache
+from agent_builder.utils.completion_cache import CompletionCache, InMemoryCompletionCache, SQLiteCompletionCache
+
+CONFIG_LIST = [{"model": "gpt-4o", "api_key": "sk-test"}]
+
+
+def make_agent(name, cache_seed):
+    llm_config = {"config_list": CONFIG_LIST}
+    if cache_seed is not None:
+        llm_config["cache_seed"] = cache_seed
+    return ExtendedConversableAgent(name=name, llm_config=llm_config, human_input_mode="NEVER")
+
+
+def make_orchestrator(sender, receiver):
+    # the cache wiring only needs the loaded agents, not a compiled workflow
+    orchestrator = AgentOrchestrator.__new__(AgentOrchestrator)
+    orchestrator.sender, orchestrator.receiver = sender, receiver
+    orchestrator.branches, orchestrator.planner = [], None
+    return orchestrator
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = InMemoryCompletionCache()
+    monkeypatch.setattr(agent_orchestrator, "get_completion_cache", lambda: cache)
+    return cache
+
+
+def test_caches_are_attached_per_agent_seed(cache):
+    seeded, unseeded, other_seed = make_agent("seeded", 41), make_agent("unseeded", None), make_agent("other", 7)
+    manager = ExtendedGroupChatManager(
+        groupchat=autogen.GroupChat(agents=[unseeded, other_seed], messages=[]), llm_config=False,
+    )
+    orchestrator = make_orchestrator(seeded, manager)
+
+    caches = orchestrator.completion_caches = orchestrator._attach_completion_caches()
+    assert sorted(caches) == [7, 41]
+    assert seeded.completion_cache.seed == 41
+    assert other_seed.completion_cache.seed == 7
+    assert unseeded.completion_cache is None
+    assert [stats["seed"] for stats in orchestrator.completion_cache_stats()] == [41, 7]
+
+
+def test_replies_use_the_agents_own_cache(cache, monkeypatch):
+    used = {}
+
+    def generate(agent, llm_client, messages, cache):
+        used[agent.name] = cache
+        return "answer"
+
+    monkeypatch.setattr(autogen.ConversableAgent, "_generate_oai_reply_from_client", generate)
+    seeded, unseeded = make_agent("seeded", 41), make_agent("unseeded", None)
+    make_orchestrator(seeded, unseeded)._attach_completion_caches()
+    # a cache handed to the whole chat, as initiate_chat does, is ignored
+    unseeded.client_cache = seeded.client_cache = cache.scoped(99)
+
+    for agent in (seeded, unseeded):
+        agent.generate_reply(messages=[{"role": "user", "content": "hi"}])
+    assert used["seeded"].seed == 41
+    assert used["unseeded"] is None
+
+
+def test_seeds_scope_entries():
+    cache = InMemoryCompletionCache(max_entries=2)
+    first, second = cache.scoped(1), cache.scoped(2)
+    first.set("key", "one")
+    assert first.get("key") == "one"
+    assert second.get("key") is None
+    assert (first.hits, second.misses) == (1, 1)
+
+    second.set("key", "two")
+    first.set("other", "three")
+    assert first.get("key") is None
+
+
+def test_sqlite_cache_round_trip(tmp_path):
+    cache = SQLiteCompletionCache(str(tmp_path / "completions.db"), max_entries=1)
+    cache.set(1, "a", {"content": "one"})
+    assert cache.get(1, "a") == {"content": "one"}
+    cache.set(1, "b", {"content": "two"})
+    assert cache.get(1, "a") is None
+    cache.close()
+
+
+def test_disabled_backend_is_memoized(monkeypatch):
+    calls = []
+    monkeypatch.setattr(completion_cache, "_completion_cache", None)
+    monkeypatch.setattr(completion_cache, "_completion_cache_loaded", False)
+    monkeypatch.setattr(completion_cache, "completion_cache_from_env", lambda: calls.append(1))
+
+    assert completion_cache.get_completion_cache() is None
+    assert completion_cache.get_completion_cache() is None
+    assert calls == [1]
+
+
+def test_completion_cache_is_abstract():
+    with pytest.raises(TypeError):
+        CompletionCache()
+
+
+def test_sqlite_hits_do_not_write(tmp_path):
+    cache = SQLiteCompletionCache(str(tmp_path / "completions.db"))
+    cache.set(1, "a", {"content": "one"})
+    connection = cache._connection()
+    changes = connection.total_changes
+
+    for _ in range(10):
+        assert cache.get(1, "a") == {"content": "one"}
+    assert connection.total_changes == changes
+    assert not connection.in_transaction
+    cache.close()
+
+
+def test_sqlite_hits_are_batched_and_keep_entries_recent(tmp_path):
+    cache = SQLiteCompletionCache(str(tmp_path / "completions.db"), max_entries=2, touch_interval=0, touch_batch=2)
+    cache.set(1, "a", {"content": "one"})
+    cache.set(1, "b", {"content": "two"})
+    connection = cache._connection()
+    changes = connection.total_changes
+
+    cache.get(1, "a")
+    assert connection.total_changes == changes
+    cache.get(1, "b")
+    # the second hit writes both
+    assert connection.total_changes == changes + 2
+
+    cache.get(1, "a")
+    # the pending hit of a is written before the eviction, so b is the least recently used
+    cache.set(1, "c", {"content": "three"})
+    assert cache.get(1, "a") == {"content": "one"}
+    assert cache.get(1, "b") is None
+    cache.close()
@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agent_builder.manager.embedding_functions import EmbeddingBatcher
+
+
+class RecordingEmbeddingFunction:
+    """Embeds a text as its length, records the batches it was called with."""
+
+    def __init__(self, delay: float = 0) -> None:
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, inputs):
+        with self.lock:
+            self.calls.append(list(inputs))
+        time.sleep(self.delay)
+        if "bad" in inputs:
+            raise ValueError("bad input")
+        return [[float(len(text))] for text in inputs]
+
+
+def test_concurrent_calls_are_batched_and_split_back():
+    function = RecordingEmbeddingFunction()
+    batcher = EmbeddingBatcher(function, max_batch_size=64, max_wait_ms=200)
+    requests = [["a"], ["bb", "ccc"], ["dddd"]]
+    with ThreadPoolExecutor(len(requests)) as pool:
+        results = list(pool.map(batcher, requests))
+
+    assert results == [[[1.0]], [[2.0], [3.0]], [[4.0]]]
+    assert len(function.calls) == 1
+    assert sorted(function.calls[0]) == ["a", "bb", "ccc", "dddd"]
+
+
+def test_large_and_empty_calls_bypass_the_queue():
+    function = RecordingEmbeddingFunction()
+    batcher = EmbeddingBatcher(function, max_batch_size=2)
+    assert batcher([]) == []
+    assert batcher(["a", "bb"]) == [[1.0], [2.0]]
+    assert function.calls == [["a", "bb"]]
+    assert batcher._pid is None
+
+
+def test_a_failing_input_only_fails_its_caller():
+    batcher = EmbeddingBatcher(RecordingEmbeddingFunction(), max_batch_size=64, max_wait_ms=200)
+
+    def embed(inputs):
+        try:
+            return batcher(inputs)
+        except ValueError as ex_error:
+            return str(ex_error)
+
+    with ThreadPoolExecutor(3) as pool:
+        results = list(pool.map(embed, [["a"], ["bad"], ["bb"]]))
+    assert results == [[[1.0]], "bad input", [[2.0]]]
+
+
+def test_callers_time_out():
+    batcher = EmbeddingBatcher(RecordingEmbeddingFunction(delay=1), max_batch_size=64, timeout=0.1)
+    with pytest.raises(TimeoutError):
+        batcher(["a"])
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_processes_start_their_own_threads():
+    batcher = EmbeddingBatcher(RecordingEmbeddingFunction(), max_batch_size=64, timeout=5)
+    assert batcher(["a"]) == [[1.0]]
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            result = batcher(["bb"])
+        except BaseException as ex_error:
+            result = repr(ex_error)
+        os.write(write_fd, json.dumps(result).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as response:
+        result = json.loads(response.read())
+    os.waitpid(pid, 0)
+    assert result == [[2.0]]
@@ -0,0 +1,48 @@
+import time
+from hashlib import sha256
+
+import numpy as np
+
+from agent_builder.utils.embedding_cache import MemmapEmbeddingStore
+
+
+def key(text):
+    return sha256(text.encode()).hexdigest()
+
+
+def vector(value):
+    return np.full(4, value, dtype=np.float32)
+
+
+def test_least_recently_used_rows_are_overwritten(tmp_path):
+    store = MemmapEmbeddingStore(str(tmp_path / "model"), dimension=4, capacity=2)
+    store.set(key("first"), vector(1))
+    time.sleep(0.01)
+    store.set(key("second"), vector(2))
+    time.sleep(0.01)
+    # reading the first row makes the second one the least recently used
+    assert np.array_equal(store.get(key("first")), vector(1))
+    time.sleep(0.01)
+    store.set(key("third"), vector(3))
+
+    assert store.get(key("second")) is None
+    assert np.array_equal(store.get(key("first")), vector(1))
+    assert np.array_equal(store.get(key("third")), vector(3))
+
+
+def test_rows_survive_reopening(tmp_path):
+    store = MemmapEmbeddingStore(str(tmp_path / "model"), dimension=4, capacity=2)
+    store.set(key("first"), vector(1))
+    store.flush()
+
+    reopened = MemmapEmbeddingStore(str(tmp_path / "model"), dimension=4, capacity=2)
+    assert np.array_equal(reopened.get(key("first")), vector(1))
+    assert reopened.get(key("missing")) is None
+
+
+def test_rows_with_a_foreign_tag_are_not_returned(tmp_path):
+    store = MemmapEmbeddingStore(str(tmp_path / "model"), dimension=4, capacity=2)
+    store.set(key("first"), vector(1))
+    # another process is overwriting the row
+    store.tags[0] = 0
+    assert store.get(key("first")) is None
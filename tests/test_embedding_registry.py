@@ -0,0 +1,101 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agent_builder.manager import embedding_functions
+from agent_builder.manager.embedding_functions import (
+    FASTEMBED,
+    OPENAI,
+    SENTENCE_TRANSFORMERS,
+    EmbeddingBatcher,
+    EmbeddingModelRegistry,
+    parse_embedding_model,
+)
+
+loads = []
+loads_lock = threading.Lock()
+
+
+class FakeModel:
+    """Records every load and every embedding call, loading takes a little while."""
+
+    def __init__(self, model_name, **options):
+        time.sleep(0.05)
+        with loads_lock:
+            loads.append((model_name, options))
+        self.calls = []
+
+    def __call__(self, inputs):
+        self.calls.append(list(inputs))
+        return [[float(len(text)), 0.0, 1.0] for text in inputs]
+
+
+class BrokenModel:
+    def __init__(self, model_name, **options):
+        raise OSError(f"{model_name} is not downloaded")
+
+
+@pytest.fixture(autouse=True)
+def fake_backends(monkeypatch):
+    loads.clear()
+    for backend in (FASTEMBED, SENTENCE_TRANSFORMERS):
+        monkeypatch.setitem(embedding_functions.EMBEDDING_BACKENDS, backend, FakeModel)
+    monkeypatch.setitem(embedding_functions.EMBEDDING_BACKENDS, OPENAI, BrokenModel)
+
+
+@pytest.mark.parametrize(
+    "embedding_model, backend, expected",
+    [
+        ("fastembed:BAAI/bge-small-en-v1.5", None, (FASTEMBED, "BAAI/bge-small-en-v1.5")),
+        ("text-embedding-3-small", None, (OPENAI, "text-embedding-3-small")),
+        ("all-MiniLM-L6-v2", None, (SENTENCE_TRANSFORMERS, "all-MiniLM-L6-v2")),
+        ("BAAI/bge-small-en-v1.5", FASTEMBED, (FASTEMBED, "BAAI/bge-small-en-v1.5")),
+        # a prefixed spec wins over the given backend, unknown prefixes are part of the name
+        ("sentence_transformers:all-MiniLM-L6-v2", FASTEMBED, (SENTENCE_TRANSFORMERS, "all-MiniLM-L6-v2")),
+        ("org:model", None, (SENTENCE_TRANSFORMERS, "org:model")),
+    ],
+)
+def test_embedding_model_specs_name_backend_and_model(embedding_model, backend, expected):
+    assert parse_embedding_model(embedding_model, backend) == expected
+
+
+def test_models_load_once_on_first_use():
+    registry = EmbeddingModelRegistry(batch_size=0)
+    assert loads == [] and registry.loaded() == []
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        models = list(executor.map(lambda _: registry.get("all-MiniLM-L6-v2"), range(4)))
+
+    assert len(loads) == 1
+    assert all(model is models[0] for model in models)
+    assert registry.get("sentence_transformers:all-MiniLM-L6-v2") is models[0]
+    assert registry.loaded() == ["sentence_transformers:all-MiniLM-L6-v2"]
+
+
+def test_models_are_batched_and_fastembed_gets_the_batch_size():
+    registry = EmbeddingModelRegistry(batch_size=16, threads=2)
+    model = registry.get("BAAI/bge-small-en-v1.5", backend=FASTEMBED)
+
+    assert isinstance(model, EmbeddingBatcher)
+    assert model.max_batch_size == 16
+    assert loads == [("BAAI/bge-small-en-v1.5", {"batch_size": 16, "threads": 2})]
+    assert model(["text"]) == [[4.0, 0.0, 1.0]]
+
+
+def test_the_dimension_is_measured_once():
+    registry = EmbeddingModelRegistry(batch_size=0)
+    assert registry.dimension("all-MiniLM-L6-v2") == 3
+    assert registry.dimension("sentence_transformers:all-MiniLM-L6-v2") == 3
+    assert registry.get("all-MiniLM-L6-v2").calls == [["dimension probe"]]
+
+
+def test_warmup_skips_models_that_fail_to_load(monkeypatch):
+    monkeypatch.setenv("AGENT_BUILDER_EMBEDDING_WARMUP", "text-embedding-3-small, all-MiniLM-L6-v2,")
+    registry = EmbeddingModelRegistry(batch_size=0)
+    registry.warmup_from_env()
+
+    assert registry.loaded() == ["sentence_transformers:all-MiniLM-L6-v2"]
+    with pytest.raises(OSError, match="not downloaded"):
+        registry.get("text-embedding-3-small")
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+
+import autogen
+import pytest
+
+from agent_builder.datamodel import SessionSummary
+from agent_builder.manager import history as history_module
+from agent_builder.manager.agent_orchestrator import AgentOrchestrator
+from agent_builder.manager.history import SUMMARY_PREFIX, HistoryManager, window_history
+
+START = datetime(2026, 1, 1)
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # count words instead of downloading a tokenizer
+    monkeypatch.setattr(history_module, "count_tokens", lambda text, model: len(text.split()))
+
+
+def conversation(*turns):
+    messages = []
+    for turn in turns:
+        for role, content in turn:
+            messages.append({
+                "id": len(messages) + 1,
+                "role": role,
+                "content": content,
+                "session_id": 1,
+                "created_at": START + timedelta(minutes=len(messages)),
+            })
+    return messages
+
+
+HISTORY = conversation(
+    [("user", "one"), ("assistant", "first answer")],
+    [("user", "two"), ("assistant", "calling a tool"), ("tool", "tool result with many words"), ("assistant", "done")],
+    [("user", "three"), ("assistant", "third answer")],
+)
+
+
+def test_max_turns_keeps_whole_turns():
+    kept, aged_out = window_history(HISTORY, max_turns=2)
+    assert [msg["id"] for msg in kept] == [3, 4, 5, 6, 7, 8]
+    assert [msg["id"] for msg in aged_out] == [1, 2]
+
+
+def test_token_budget_never_splits_a_turn():
+    # the second turn has 10 words, only 3 of them would fit next to the latest turn
+    kept, aged_out = window_history(HISTORY, token_budget=6)
+    assert [msg["id"] for msg in kept] == [7, 8]
+    assert [msg["id"] for msg in aged_out] == [1, 2, 3, 4, 5, 6]
+
+    kept, _ = window_history(HISTORY, token_budget=13)
+    assert [msg["id"] for msg in kept] == [3, 4, 5, 6, 7, 8]
+
+
+def test_latest_turn_is_kept_over_budget():
+    kept, aged_out = window_history(HISTORY, token_budget=1)
+    assert [msg["id"] for msg in kept] == [7, 8]
+    assert len(aged_out) == 6
+
+
+def test_leading_messages_form_a_turn():
+    history = conversation([("assistant", "welcome")], [("user", "hi"), ("assistant", "hello")])
+    kept, aged_out = window_history(history, max_turns=1)
+    assert [msg["id"] for msg in kept] == [2, 3]
+    assert [msg["id"] for msg in aged_out] == [1]
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeDBManager:
+    def __init__(self, summary):
+        self.summary = summary
+
+    def get(self, model, filters=None, **kwargs):
+        return FakeResult([self.summary])
+
+
+def test_summary_is_passed_as_a_system_message():
+    summary = SessionSummary(session_id=1, summary="the user counted to one", summarized_until_id=2)
+    manager = HistoryManager(FakeDBManager(summary))
+    try:
+        kept, trimmed = manager.prepare(1, list(HISTORY), {"history_max_turns": 2})
+    finally:
+        manager.shutdown()
+
+    assert trimmed
+    assert kept[0]["role"] == "system"
+    assert kept[0]["content"] == SUMMARY_PREFIX + "the user counted to one"
+    assert [msg["id"] for msg in kept[1:]] == [3, 4, 5, 6, 7, 8]
+
+    sender = autogen.ConversableAgent("sender", llm_config=False, human_input_mode="NEVER")
+    receiver = autogen.ConversableAgent("receiver", llm_config=False, human_input_mode="NEVER")
+    orchestrator = AgentOrchestrator.__new__(AgentOrchestrator)
+    orchestrator.sender, orchestrator.receiver, orchestrator.branches = sender, receiver, []
+    orchestrator._populate_history(kept[:1] + HISTORY[-2:])
+
+    assert [msg["role"] for msg in receiver.chat_messages[sender]] == ["system", "user", "assistant"]
+    assert sender.chat_messages[receiver][0]["content"] == kept[0]["content"]
@@ -0,0 +1,123 @@
+import time
+
+import pytest
+
+from agent_builder.utils import kernel_pool as kernel_pool_module
+from agent_builder.utils.kernel_pool import KernelPool
+
+pytestmark = pytest.mark.skipif(not KernelPool().supported, reason="kernels need posix fork")
+
+
+@pytest.fixture
+def pool():
+    pool = KernelPool(size=1, preload=(), startup_timeout=30)
+    yield pool
+    pool.close()
+
+
+def run(pool, tmp_path, code, timeout=30):
+    path = tmp_path / "code.py"
+    path.write_text(code)
+    return pool.execute(str(path), str(tmp_path), timeout)
+
+
+def test_exit_codes_and_output(pool, tmp_path):
+    assert run(pool, tmp_path, "print('hello')") == (0, "hello\n")
+    assert run(pool, tmp_path, "import sys\nsys.exit(3)")[0] == 3
+
+    exit_code, output = run(pool, tmp_path, "raise ValueError('broken')")
+    assert exit_code == 1
+    assert "ValueError: broken" in output
+
+
+def test_code_blocks_run_in_the_work_dir_with_fresh_state(pool, tmp_path):
+    assert run(pool, tmp_path, "import os\nX = 1\nprint(os.getcwd())") == (0, f"{tmp_path}\n")
+    assert run(pool, tmp_path, "print('X' in globals())") == (0, "False\n")
+
+
+def test_timeouts_kill_the_code_block(pool, tmp_path):
+    exit_code, output = run(pool, tmp_path, "import time\ntime.sleep(30)", timeout=0.5)
+    assert exit_code == 124
+    assert output.endswith("Timeout")
+    # the kernel survives and runs the next block
+    assert run(pool, tmp_path, "print('next')") == (0, "next\n")
+
+
+def test_kernels_that_fail_to_start_are_closed(tmp_path, monkeypatch):
+    (tmp_path / "slow_module.py").write_text("import time\ntime.sleep(30)\n")
+    monkeypatch.setenv("PYTHONPATH", str(tmp_path))
+    started = []
+
+    class RecordingKernel(kernel_pool_module.PythonKernel):
+        def __init__(self, preload):
+            super().__init__(preload)
+            started.append(self)
+
+    monkeypatch.setattr(kernel_pool_module, "PythonKernel", RecordingKernel)
+    pool = KernelPool(size=0, preload=("slow_module",), startup_timeout=0.2)
+
+    exit_code, output = run(pool, tmp_path, "print('hello')")
+    assert (exit_code, output) == (1, "Kernel did not respond")
+    assert len(started) == 1 and not started[0].alive()
+
+
+def test_forked_children_drop_the_inherited_kernels(pool, tmp_path):
+    pool.start()
+    assert run(pool, tmp_path, "print('warm')") == (0, "warm\n")
+    kernel = pool._idle[0]
+
+    pool._after_fork()
+    assert pool.get_stats() == {"idle": 0, "starting": 0}
+    # the kernel still belongs to the parent, the child only closed its pipes
+    assert kernel.alive()
+    kernel.close()
+
+
+def warm_kernel(pool):
+    """Start the single kernel of a pool and stop replacing kernels, so every block runs in it."""
+    pool.start()
+    deadline = time.monotonic() + 30
+    while pool.get_stats() != {"idle": 1, "starting": 0}:
+        assert time.monotonic() < deadline, "kernel did not start"
+        time.sleep(0.01)
+    pool._replenish = lambda: None
+    return pool._idle[0]
+
+
+def test_kernels_are_recycled_after_max_executions(tmp_path):
+    pool = KernelPool(size=1, max_executions=2, preload=(), startup_timeout=30)
+    try:
+        kernel = warm_kernel(pool)
+        run(pool, tmp_path, "print('one')")
+        assert pool._idle == [kernel]
+
+        run(pool, tmp_path, "print('two')")
+        assert kernel.executions == 2
+        assert not kernel.alive()
+        assert pool._idle == []
+    finally:
+        pool.close()
+
+
+def test_kernels_are_recycled_when_a_code_block_grows_beyond_the_limit(tmp_path):
+    pool = KernelPool(size=1, memory_limit_mb=64, preload=(), startup_timeout=30)
+    # a read only file mapping grows the rss of the code block without counting to its data limit
+    (tmp_path / "large.bin").write_bytes(b"\1" * 96 * 1024 * 1024)
+    code = (
+        "import mmap\n"
+        "with open('large.bin', 'rb') as f:\n"
+        "    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)\n"
+        "    print(sum(data[offset] for offset in range(0, len(data), 4096)))\n"
+    )
+    try:
+        kernel = warm_kernel(pool)
+        assert run(pool, tmp_path, "print('small')") == (0, "small\n")
+        assert pool._idle == [kernel]
+
+        assert run(pool, tmp_path, code) == (0, f"{96 * 1024 * 1024 // 4096}\n")
+        # the kernel itself stays small, only the forked child grew
+        assert kernel.rss < pool.memory_limit < kernel.child_rss
+        assert not kernel.alive()
+        assert pool._idle == []
+    finally:
+        pool.close()
@@ -0,0 +1,338 @@
+import hashlib
+import os
+import time
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from qdrant_client import QdrantClient
+from sqlmodel import Session, SQLModel, select
+
+from agent_builder.database import DBManager, workflow_from_id
+from agent_builder.datamodel import (
+    Agent, AgentConfig, AgentType, KnowledgeHub, KnowledgeHubDocument, KnowledgeHubType, RetrieverConfig, Workflow,
+)
+from agent_builder.manager import agents, knowledge_hub
+from agent_builder.manager.agents import ExtendedRetrieverAgent
+from agent_builder.manager.knowledge_hub import KnowledgeHubSync
+from agent_builder.routes.knowledge_hub_endpoints import setup_router
+
+DIMENSION = 8
+
+
+class FakeEmbeddingRegistry:
+
+    def get(self, embedding_model, backend=None):
+        def embed(inputs):
+            return [list(hashlib.sha256(text.encode()).digest()[:DIMENSION]) for text in inputs]
+        return embed
+
+    def dimension(self, embedding_model, backend=None):
+        return DIMENSION
+
+
+def split_files_to_chunks(files, max_tokens):
+    # one chunk per paragraph, autogen's splitter needs the tiktoken encodings
+    chunks = []
+    for path in files:
+        with open(path) as f:
+            chunks += [chunk for chunk in f.read().split("\n\n") if chunk.strip()]
+    return chunks, [{"source": path} for path in files]
+
+
+@pytest.fixture
+def qdrant(monkeypatch):
+    client = QdrantClient(":memory:")
+    monkeypatch.setattr(knowledge_hub, "QdrantClient", lambda url: client)
+    monkeypatch.setattr(knowledge_hub, "embedding_registry", FakeEmbeddingRegistry())
+    monkeypatch.setattr(knowledge_hub, "split_files_to_chunks", split_files_to_chunks)
+    return client
+
+
+@pytest.fixture
+def dbmanager(tmp_path):
+    dbmanager = DBManager(engine_uri=f"sqlite:///{tmp_path / 'database.sqlite'}")
+    SQLModel.metadata.create_all(dbmanager.engine)
+    return dbmanager
+
+
+def create_hub(dbmanager, details, hub_type=KnowledgeHubType.directory, name="docs"):
+    hub = KnowledgeHub(
+        name=name, description="docs", details=str(details), user_id="user", type=hub_type,
+        collection_name="docs_collection", embedding_model="test-model",
+    )
+    with Session(dbmanager.engine) as session:
+        session.add(hub)
+        session.commit()
+        session.refresh(hub)
+    return hub.id
+
+
+def stored_chunks(client):
+    points, _ = client.scroll("docs_collection", limit=100, with_payload=True)
+    return sorted(point.payload["_content"] for point in points)
+
+
+def write(path, content):
+    path.write_text(content)
+    # a distinct mtime even on filesystems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+
+def test_sync_adds_updates_and_removes_documents(tmp_path, dbmanager, qdrant):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write(docs / "a.txt", "alpha one\n\nalpha two")
+    write(docs / "b.txt", "beta")
+    hub_id = create_hub(dbmanager, docs)
+    hub_sync = KnowledgeHubSync(dbmanager, qdrant_url="memory")
+
+    result = hub_sync.sync(hub_id, "user")
+    assert result["status"], result
+    assert result["data"]["added"] == 2
+    assert stored_chunks(qdrant) == ["alpha one", "alpha two", "beta"]
+
+    result = hub_sync.sync(hub_id, "user")
+    assert result["data"]["unchanged"] == 2
+    assert result["data"]["chunks"] == 0
+
+    write(docs / "a.txt", "alpha one\n\nalpha three")
+    os.remove(docs / "b.txt")
+    write(docs / "c.txt", "gamma")
+    result = hub_sync.sync(hub_id, "user")
+    assert (result["data"]["added"], result["data"]["updated"], result["data"]["removed"]) == (1, 1, 1)
+    assert stored_chunks(qdrant) == ["alpha one", "alpha three", "gamma"]
+
+    with Session(dbmanager.engine) as session:
+        sources = session.exec(select(KnowledgeHubDocument.source)).all()
+    assert sorted(os.path.basename(source) for source in sources) == ["a.txt", "c.txt"]
+
+
+def test_sync_skips_touched_files_with_identical_content(tmp_path, dbmanager, qdrant):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write(docs / "a.txt", "alpha")
+    hub_id = create_hub(dbmanager, docs)
+    hub_sync = KnowledgeHubSync(dbmanager, qdrant_url="memory")
+    hub_sync.sync(hub_id, "user")
+
+    write(docs / "a.txt", "alpha")
+    result = hub_sync.sync(hub_id, "user")
+    assert result["data"]["unchanged"] == 1
+    assert result["data"]["updated"] == 0
+
+
+def test_sync_keeps_documents_when_the_directory_is_missing(tmp_path, dbmanager, qdrant):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write(docs / "a.txt", "alpha")
+    hub_id = create_hub(dbmanager, docs)
+    hub_sync = KnowledgeHubSync(dbmanager, qdrant_url="memory")
+    hub_sync.sync(hub_id, "user")
+
+    docs.rename(tmp_path / "unmounted")
+    result = hub_sync.sync(hub_id, "user")
+    assert not result["status"]
+    assert stored_chunks(qdrant) == ["alpha"]
+    with Session(dbmanager.engine) as session:
+        assert len(session.exec(select(KnowledgeHubDocument)).all()) == 1
+
+
+def test_sync_of_an_unknown_hub(dbmanager, qdrant):
+    result = KnowledgeHubSync(dbmanager, qdrant_url="memory").sync(1, "user")
+    assert result == {"status": False, "message": "Knowledge hub not found"}
+
+
+def test_first_sync_purges_chunks_ingested_by_retrievers(tmp_path, dbmanager, qdrant):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write(docs / "a.txt", "alpha")
+    hub_id = create_hub(dbmanager, docs)
+    knowledge_hub.ensure_collection(qdrant, "docs_collection", DIMENSION, "test-model")
+    # a chunk stored by autogen's implicit ingestion, under an id of its own scheme
+    qdrant.upsert("docs_collection", points=[
+        knowledge_hub.models.PointStruct(
+            id="6f1ed002-ab56-4a36-a2e1-2d6f0dd0bcba", vector=[1.0] * DIMENSION, payload={"_content": "alpha"},
+        )
+    ])
+
+    result = KnowledgeHubSync(dbmanager, qdrant_url="memory").sync(hub_id, "user")
+    assert result["data"]["purged"] == 1
+    assert stored_chunks(qdrant) == ["alpha"]
+
+
+def create_retriever_workflow(dbmanager, docs):
+    retriever = Agent(
+        user_id="user",
+        type=AgentType.retrieverproxy,
+        config=AgentConfig(
+            name="retriever",
+            retrieve_config=RetrieverConfig(
+                docs_path=str(docs), collection_name="docs_collection", db_config={"client": "memory"},
+                get_or_create=True,
+            ),
+        ).model_dump(mode="json"),
+    )
+    workflow = Workflow(name="retrieval", description="retrieval", user_id="user")
+    with Session(dbmanager.engine) as session:
+        session.add(retriever)
+        session.add(workflow)
+        session.commit()
+        session.refresh(retriever)
+        session.refresh(workflow)
+    dbmanager.link("workflow_agent", workflow.id, retriever.id, agent_type="sender")
+    return workflow.id
+
+
+def test_retrievers_only_query_synced_collections(tmp_path, dbmanager, qdrant):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write(docs / "a.txt", "alpha")
+    hub_id = create_hub(dbmanager, docs)
+    workflow_id = create_retriever_workflow(dbmanager, docs)
+
+    retrieve_config = workflow_from_id(workflow_id, dbmanager)["sender"]["config"]["retrieve_config"]
+    assert retrieve_config["managed_collection"] is False
+
+    KnowledgeHubSync(dbmanager, qdrant_url="memory").sync(hub_id, "user")
+    retrieve_config = workflow_from_id(workflow_id, dbmanager)["sender"]["config"]["retrieve_config"]
+    assert retrieve_config["managed_collection"] is True
+
+
+def test_retriever_skips_ingestion_of_managed_collections(qdrant, monkeypatch):
+    pytest.importorskip("chromadb")
+    pytest.importorskip("IPython")
+    monkeypatch.setattr(agents, "QdrantClient", lambda url: qdrant)
+    monkeypatch.setattr(agents, "embedding_registry", FakeEmbeddingRegistry())
+    retrieve_config = RetrieverConfig(
+        docs_path="docs", collection_name="docs_collection", db_config={"client": "memory"},
+        embedding_model="test-model", get_or_create=True, managed_collection=True,
+    ).model_dump(mode="json")
+    retriever = ExtendedRetrieverAgent(name="retriever", human_input_mode="NEVER", retrieve_config=retrieve_config)
+    assert retriever._docs_path is None
+    assert retriever._new_docs is False
+
+
+def test_sync_stores_the_embedding_backend_on_the_hub(tmp_path, dbmanager, qdrant):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write(docs / "a.txt", "alpha")
+    hub_id = create_hub(dbmanager, docs)
+    workflow_id = create_retriever_workflow(dbmanager, docs)
+    KnowledgeHubSync(dbmanager, qdrant_url="memory").sync(hub_id, "user")
+
+    with Session(dbmanager.engine) as session:
+        hub = session.get(KnowledgeHub, hub_id)
+        assert (hub.embedding_backend, hub.embedding_model) == ("sentence_transformers", "test-model")
+    retrieve_config = workflow_from_id(workflow_id, dbmanager)["sender"]["config"]["retrieve_config"]
+    assert retrieve_config["collection_embedding_model"] == "sentence_transformers:test-model"
+
+
+def test_retriever_rejects_a_collection_embedded_with_another_model(qdrant, monkeypatch):
+    pytest.importorskip("chromadb")
+    pytest.importorskip("IPython")
+    monkeypatch.setattr(agents, "QdrantClient", lambda url: qdrant)
+    monkeypatch.setattr(agents, "embedding_registry", FakeEmbeddingRegistry())
+    retrieve_config = RetrieverConfig(
+        docs_path="docs", collection_name="docs_collection", db_config={"client": "memory"},
+        embedding_model="test-model", get_or_create=True, managed_collection=True,
+        collection_embedding_model="fastembed:BAAI/bge-small-en-v1.5",
+    ).model_dump(mode="json")
+    with pytest.raises(ValueError, match="bge-small"):
+        ExtendedRetrieverAgent(name="retriever", human_input_mode="NEVER", retrieve_config=retrieve_config)
+
+
+def collection_config(collection_name="docs_collection"):
+    return {"retrieve_config": {"collection_name": collection_name, "docs_path": "docs", "embedding_model": "test-model"}}
+
+
+def test_new_collections_are_sized_for_the_embedding_model():
+    client = QdrantClient(":memory:")
+    # check_collection_exist only needs the client, not a constructed autogen agent
+    retriever = ExtendedRetrieverAgent.__new__(ExtendedRetrieverAgent)
+    retriever.check_collection_exist(client, collection_config(), 384)
+    assert client.get_collection("docs_collection").config.params.vectors.size == 384
+
+    # an existing collection of the right size is used as it is
+    retriever.check_collection_exist(client, collection_config(), 384)
+    with pytest.raises(ValueError, match="size 384 but the embedding model test-model produces vectors of size 1024"):
+        retriever.check_collection_exist(client, collection_config(), 1024)
+
+
+def test_retrievers_embed_with_the_configured_backend(qdrant, monkeypatch):
+    pytest.importorskip("chromadb")
+    pytest.importorskip("IPython")
+    requested = []
+
+    class RecordingRegistry(FakeEmbeddingRegistry):
+        def get(self, embedding_model, backend=None):
+            requested.append((embedding_model, backend))
+            return super().get(embedding_model, backend)
+
+    monkeypatch.setattr(agents, "QdrantClient", lambda url: qdrant)
+    monkeypatch.setattr(agents, "embedding_registry", RecordingRegistry())
+    retrieve_config = RetrieverConfig(
+        docs_path="docs", collection_name="new_collection", db_config={"client": "memory"},
+        embedding_model="BAAI/bge-small-en-v1.5", embedding_backend="fastembed", get_or_create=True,
+        managed_collection=True,
+    ).model_dump(mode="json")
+    ExtendedRetrieverAgent(name="retriever", human_input_mode="NEVER", retrieve_config=retrieve_config)
+
+    assert requested == [("BAAI/bge-small-en-v1.5", "fastembed")]
+    assert qdrant.get_collection("new_collection").config.params.vectors.size == DIMENSION
+
+
+def test_remove_drops_the_collection_and_the_manifest(tmp_path, dbmanager, qdrant):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write(docs / "a.txt", "alpha")
+    hub_id = create_hub(dbmanager, docs)
+    hub_sync = KnowledgeHubSync(dbmanager, qdrant_url="memory")
+    hub_sync.sync(hub_id, "user")
+
+    assert hub_sync.remove(hub_id, "user")["status"]
+    assert not qdrant.collection_exists("docs_collection")
+    with Session(dbmanager.engine) as session:
+        assert session.exec(select(KnowledgeHubDocument)).all() == []
+
+
+def test_remove_keeps_the_chunks_of_hubs_sharing_the_collection(tmp_path, dbmanager, qdrant):
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        write(tmp_path / name / f"{name}.txt", f"{name} text")
+    first, second = create_hub(dbmanager, tmp_path / "a", name="a"), create_hub(dbmanager, tmp_path / "b", name="b")
+    hub_sync = KnowledgeHubSync(dbmanager, qdrant_url="memory")
+    hub_sync.sync(first, "user")
+    hub_sync.sync(second, "user")
+
+    assert hub_sync.remove(first, "user")["status"]
+    assert stored_chunks(qdrant) == ["b text"]
+
+
+def test_sync_runs_as_a_job_and_delete_removes_the_vectors(tmp_path, dbmanager, qdrant, monkeypatch):
+    monkeypatch.setenv("AGENT_BUILDER_QDRANT_URI", "memory")
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write(docs / "a.txt", "alpha")
+    hub_id = create_hub(dbmanager, docs)
+    app = FastAPI()
+    app.include_router(setup_router(APIRouter(), dbmanager))
+
+    with TestClient(app) as client:
+        started = client.post("/knowledgehub/sync", params={"knowledgehub_id": hub_id, "user_id": "user"}).json()
+        assert started["status"], started
+        job_id = started["data"]["run_id"]
+        for _ in range(100):
+            job = client.get(f"/knowledgehub/sync/{job_id}").json()["data"]
+            if job["status"] not in ("queued", "running"):
+                break
+            time.sleep(0.05)
+        assert job["status"] == "completed"
+        assert job["result"]["data"]["added"] == 1
+        assert stored_chunks(qdrant) == ["alpha"]
+
+        deleted = client.delete("/knowledgehub/delete", params={"knowledgehub_id": hub_id, "user_id": "user"}).json()
+        assert deleted["status"], deleted
+        assert not qdrant.collection_exists("docs_collection")
+        assert not client.get("/knowledgehub/sync/unknown").json()["status"]
@@ -0,0 +1,74 @@
+import copy
+import sys
+
+import autogen
+
+from agent_builder.datamodel import Model
+from agent_builder.utils.llm_clients import LLMClientRegistry
+
+OPENAI = {"model": "gpt-4", "api_key": "sk-one"}
+GATEWAY = {"model": "gpt-4", "api_key": "sk-one", "base_url": "http://gateway/v1"}
+
+
+def test_clients_are_shared_per_endpoint_and_key():
+    registry = LLMClientRegistry()
+    client = registry.http_client(OPENAI)
+    # the model and unrelated keys don't matter, only where and as whom requests are sent
+    assert registry.http_client({**OPENAI, "model": "gpt-4o", "temperature": 0}) is client
+    assert registry.http_client(GATEWAY) is not client
+    assert registry.http_client({**OPENAI, "api_key": "sk-two"}) is not client
+
+    model = Model(model="gpt-4", api_key="sk-one", base_url="http://gateway/v1")
+    assert registry.http_client(model) is registry.http_client(model.model_dump())
+    # api keys are not kept in the registry
+    assert "sk-one" not in repr(list(registry._http_clients))
+
+
+def test_copies_of_an_llm_config_keep_the_pool():
+    registry = LLMClientRegistry()
+    llm_config = registry.bind({"config_list": [OPENAI], "temperature": 0})
+    assert copy.deepcopy(llm_config)["config_list"][0]["http_client"] is registry.http_client(OPENAI)
+
+
+def test_only_openai_compatible_entries_are_bound():
+    registry = LLMClientRegistry()
+    own_client = object()
+    config_list = [
+        OPENAI,
+        {**GATEWAY, "api_type": "azure"},
+        {"model": "claude", "api_key": "key", "api_type": "anthropic"},
+        {**OPENAI, "http_client": own_client},
+    ]
+    bound = registry.bind({"config_list": config_list})["config_list"]
+
+    assert bound[0]["http_client"] is registry.http_client(OPENAI)
+    assert bound[1]["http_client"] is registry.http_client({**GATEWAY, "api_type": "azure"})
+    assert "http_client" not in bound[2]
+    assert bound[3]["http_client"] is own_client
+    # the given config is left alone
+    assert "http_client" not in config_list[0]
+    assert registry.bind(False) is False
+    assert registry.bind({"config_list": []}) == {"config_list": []}
+
+
+def test_autogen_clients_send_through_the_pool():
+    registry = LLMClientRegistry()
+    wrapper = autogen.OpenAIWrapper(config_list=registry.bind_config_list([OPENAI]))
+    assert wrapper._clients[0]._oai_client._client is registry.http_client(OPENAI)
+
+
+def test_openai_clients_are_shared_and_closed_with_the_registry():
+    registry = LLMClientRegistry()
+    client = registry.openai_client(OPENAI)
+    assert registry.openai_client(dict(OPENAI)) is client
+    assert client._client is registry.http_client(OPENAI)
+
+    http_client = registry.http_client(OPENAI)
+    registry.close()
+    assert http_client.is_closed
+    assert registry.http_client(OPENAI) is not http_client
+
+
+def test_http2_needs_h2(monkeypatch):
+    monkeypatch.setitem(sys.modules, "h2", None)
+    assert LLMClientRegistry(http2=True).http2 is False
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from agent_builder.datamodel import SocketMessage
+from agent_builder.manager import chatmanager
+from agent_builder.manager.chatmanager import MAX_BATCH_WINDOW_MS, MessageDispatcher, SocketTransport
+
+
+class FakeWebSocketManager:
+    """Records what the writer tasks send, optionally holding every send until released."""
+
+    def __init__(self) -> None:
+        self.sent = []
+        self.frames = []
+        self.released = asyncio.Event()
+        self.released.set()
+
+    async def send_message(self, message, websocket):
+        await self.released.wait()
+        self.sent.append(message)
+
+    async def send_frame(self, frame, websocket):
+        await self.released.wait()
+        self.frames.append(json.loads(frame))
+
+
+def message(index, message_type="agent_message"):
+    return SocketMessage(type=message_type, data={"index": index}, connection_id="socket")
+
+
+async def drain(dispatcher, connection_id="socket"):
+    # wait until the writer picked up everything that was queued
+    while not dispatcher.queues[connection_id].empty():
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+
+
+def test_messages_from_run_threads_are_sent_in_order():
+    async def scenario():
+        manager = FakeWebSocketManager()
+        dispatcher = MessageDispatcher(manager)
+        dispatcher.start()
+        dispatcher.register("socket", websocket=None)
+
+        def run():
+            for index in range(50):
+                dispatcher.dispatch(message(index))
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        # dispatched messages reach the queue once the loop runs their callbacks
+        await asyncio.sleep(0)
+        await dispatcher.send({"type": "run_status", "connection_id": "socket"})
+        dispatcher.dispatch(message(99).model_copy(update={"connection_id": "unknown"}))
+        await drain(dispatcher)
+        await dispatcher.stop()
+        return manager.sent
+
+    sent = asyncio.run(scenario())
+    assert [item["data"]["index"] for item in sent[:-1]] == list(range(50))
+    assert sent[-1]["type"] == "run_status"
+
+
+def test_full_queues_drop_deltas_first_then_the_oldest_messages():
+    async def scenario():
+        manager = FakeWebSocketManager()
+        manager.released.clear()
+        dispatcher = MessageDispatcher(manager, max_queued=3)
+        dispatcher.start()
+        dispatcher.register("socket", websocket=None)
+        # the writer takes the first message and blocks on the stalled socket
+        await dispatcher.send(message(0))
+        await asyncio.sleep(0.01)
+        for index in range(1, 4):
+            await dispatcher.send(message(index))
+        await dispatcher.send(message(4, "agent_message_delta"))
+        await dispatcher.send(message(5))
+        dropped = dispatcher.dropped["socket"]
+        manager.released.set()
+        await drain(dispatcher)
+        await dispatcher.stop()
+        return manager.sent, dropped
+
+    sent, dropped = asyncio.run(scenario())
+    assert [item["data"]["index"] for item in sent] == [0, 2, 3, 5]
+    assert dropped == 2
+
+
+def test_batched_transports_coalesce_messages_into_frames():
+    async def scenario():
+        manager = FakeWebSocketManager()
+        dispatcher = MessageDispatcher(manager)
+        dispatcher.start()
+        dispatcher.register("socket", websocket=None, transport=SocketTransport(batch_window_ms=50))
+        for index in range(3):
+            dispatcher.dispatch(message(index))
+        await asyncio.sleep(0.2)
+        await dispatcher.stop()
+        return manager.frames
+
+    frames = asyncio.run(scenario())
+    assert len(frames) == 1
+    assert frames[0]["type"] == "batch"
+    assert [item["data"]["index"] for item in frames[0]["data"]] == [0, 1, 2]
+    assert "connection_id" not in frames[0]["data"][0]
+
+
+def test_frames_hold_at_most_max_batch_size_messages():
+    async def scenario():
+        manager = FakeWebSocketManager()
+        dispatcher = MessageDispatcher(manager)
+        dispatcher.start()
+        transport = SocketTransport(batch_window_ms=50, max_batch_size=2)
+        dispatcher.register("socket", websocket=None, transport=transport)
+        for index in range(3):
+            dispatcher.dispatch(message(index))
+        await asyncio.sleep(0.2)
+        await dispatcher.stop()
+        return manager.frames
+
+    frames = asyncio.run(scenario())
+    assert [item["data"]["index"] for item in frames[0]["data"]] == [0, 1]
+    # a lone message is sent as is, not wrapped in a batch
+    assert frames[1]["type"] == "agent_message"
+    assert frames[1]["data"] == {"index": 2}
+
+
+@pytest.mark.parametrize(
+    "query_params, batch_ms, encoding",
+    [
+        ({}, 0, "json"),
+        ({"batch_ms": "10"}, 10, "json"),
+        ({"batch_ms": "100000"}, MAX_BATCH_WINDOW_MS, "json"),
+        ({"batch_ms": "soon", "encoding": "xml"}, 0, "json"),
+    ],
+)
+def test_transports_are_negotiated_from_query_params(query_params, batch_ms, encoding):
+    transport = SocketTransport.from_query_params(query_params)
+    assert transport.describe() == {"batch_ms": batch_ms, "encoding": encoding}
+    assert transport.compact == (batch_ms > 0)
+
+
+def test_only_compact_transports_drop_the_connection_id():
+    event = SocketMessage(type="agent_message", data={"connection_id": "socket", "index": 0}, connection_id="socket")
+    assert SocketTransport().prepare(event) == event.model_dump(mode="json")
+
+    compact = SocketTransport(batch_window_ms=10)
+    assert compact.prepare(event) == {"type": "agent_message", "data": {"index": 0}}
+    # the ack is the one message that still tells the client its connection id
+    ack = {"type": "connection_ack", "data": {"transport": compact.describe()}, "connection_id": "socket"}
+    assert compact.prepare(ack) == ack
+
+
+def test_msgpack_falls_back_to_json_when_it_is_not_installed(monkeypatch):
+    monkeypatch.setattr(chatmanager, "msgpack", None)
+    transport = SocketTransport.from_query_params({"encoding": "msgpack"})
+    assert transport.encoding == "json"
+    assert isinstance(transport.encode([{"type": "agent_message"}]), str)
+
+
+def test_msgpack_frames_are_binary():
+    msgpack = pytest.importorskip("msgpack")
+    transport = SocketTransport(encoding="msgpack")
+    assert transport.compact
+    frame = transport.encode([{"type": "a"}, {"type": "b"}])
+    assert msgpack.unpackb(frame) == {"type": "batch", "data": [{"type": "a"}, {"type": "b"}]}
+
+
+def test_unregistered_connections_stop_their_writer():
+    async def scenario():
+        dispatcher = MessageDispatcher(FakeWebSocketManager())
+        dispatcher.start()
+        dispatcher.register("socket", websocket=None)
+        writer = dispatcher.writers["socket"]
+        await dispatcher.unregister("socket")
+        await asyncio.sleep(0)
+        return writer, dispatcher
+
+    writer, dispatcher = asyncio.run(scenario())
+    assert writer.cancelled()
+    assert dispatcher.queues == {} and dispatcher.writers == {}
@@ -0,0 +1,51 @@
+import pytest
+import sqlalchemy as sa
+
+from agent_builder.database import DBManager, database_manager
+from agent_builder.database.utils import run_migration
+
+
+def test_migrations_add_columns_to_existing_tables(tmp_path):
+    engine_uri = f"sqlite:///{tmp_path / 'database.sqlite'}"
+    engine = sa.create_engine(engine_uri)
+    with engine.begin() as connection:
+        connection.execute(sa.text("CREATE TABLE workflow (id INTEGER PRIMARY KEY, name VARCHAR)"))
+        connection.execute(sa.text("CREATE TABLE knowledgehub (id INTEGER PRIMARY KEY, name VARCHAR)"))
+
+    run_migration(engine_uri)
+    # revisions skip what is already in place, so running them again is harmless
+    run_migration(engine_uri)
+
+    inspector = sa.inspect(engine)
+    workflow_columns = {column["name"] for column in inspector.get_columns("workflow")}
+    hub_columns = {column["name"] for column in inspector.get_columns("knowledgehub")}
+    assert {"history_max_turns", "history_token_budget"} <= workflow_columns
+    assert {"collection_name", "embedding_model", "embedding_backend", "synced_at"} <= hub_columns
+    with engine.connect() as connection:
+        assert connection.execute(sa.text("SELECT version_num FROM alembic_version")).scalar()
+
+
+def test_migrations_skip_missing_tables(tmp_path):
+    engine_uri = f"sqlite:///{tmp_path / 'database.sqlite'}"
+    run_migration(engine_uri)
+    assert set(sa.inspect(sa.create_engine(engine_uri)).get_table_names()) == {"alembic_version"}
+
+
+def test_a_failed_migration_fails_startup(tmp_path, monkeypatch):
+    def failing_migration(engine_uri):
+        raise RuntimeError("Error running migrations")
+
+    monkeypatch.setattr(database_manager, "run_migration", failing_migration)
+    dbmanager = DBManager(engine_uri=f"sqlite:///{tmp_path / 'database.sqlite'}")
+    with pytest.raises(RuntimeError, match="Error running migrations"):
+        dbmanager.create_db_and_tables()
+
+
+def test_sample_errors_do_not_fail_startup(tmp_path, monkeypatch):
+    def failing_samples(dbmanager):
+        raise ValueError("no samples")
+
+    monkeypatch.setattr(database_manager, "init_db_samples", failing_samples)
+    engine_uri = f"sqlite:///{tmp_path / 'database.sqlite'}"
+    DBManager(engine_uri=engine_uri).create_db_and_tables()
+    assert "workflow" in sa.inspect(sa.create_engine(engine_uri)).get_table_names()
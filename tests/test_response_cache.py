@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+import pytest
+from sqlmodel import SQLModel
+
+from agent_builder.database import DBManager
+from agent_builder.datamodel import Message, Workflow
+from agent_builder.utils.response_cache import ResponseCache, SingleFlight, response_cache_key
+
+
+def test_concurrent_identical_requests_run_once():
+    calls = []
+
+    async def scenario():
+        single_flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def run():
+            calls.append(1)
+            await release.wait()
+            return "answer"
+
+        tasks = [asyncio.create_task(single_flight.do("key", run)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(scenario())
+    assert calls == [1]
+    assert results == [("answer", False), ("answer", True), ("answer", True)]
+
+
+def test_a_failure_reaches_every_waiter():
+    async def scenario():
+        single_flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def run():
+            await release.wait()
+            raise ValueError("run failed")
+
+        tasks = [asyncio.create_task(single_flight.do("key", run)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # the key is released, so a later call runs again
+        return results, await single_flight.do("key", lambda: asyncio.sleep(0, "retried"))
+
+    results, retried = asyncio.run(scenario())
+    assert [str(result) for result in results] == ["run failed"] * 3
+    assert all(isinstance(result, ValueError) for result in results)
+    assert retried == ("retried", False)
+
+
+def test_least_recently_used_responses_are_evicted():
+    async def scenario():
+        cache = ResponseCache(max_entries=2)
+        await cache.set("a", 1)
+        await cache.set("b", 2)
+        await cache.get("a")
+        await cache.set("c", 3)
+        return [await cache.get(key) for key in ("a", "b", "c")]
+
+    assert asyncio.run(scenario()) == [1, None, 3]
+
+
+def test_responses_expire_after_the_ttl(monkeypatch):
+    async def scenario():
+        cache = ResponseCache(ttl=10)
+        await cache.set("a", 1)
+        before = await cache.get("a")
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 11)
+        return before, await cache.get("a")
+
+    assert asyncio.run(scenario()) == (1, None)
+
+
+class FailingRedis:
+    async def get(self, key):
+        raise ConnectionError("redis is down")
+
+    async def set(self, *args, **kwargs):
+        raise ConnectionError("redis is down")
+
+
+def test_redis_errors_are_misses():
+    async def scenario():
+        cache = ResponseCache(redis=FailingRedis())
+        missing = await cache.get("a")
+        await cache.set("a", 1)
+        return missing, await cache.get("a")
+
+    assert asyncio.run(scenario()) == (None, 1)
+
+
+@pytest.fixture
+def dbmanager(tmp_path):
+    dbmanager = DBManager(engine_uri=f"sqlite:///{tmp_path / 'database.sqlite'}")
+    SQLModel.metadata.create_all(dbmanager.engine)
+    return dbmanager
+
+
+def test_the_key_only_reads_recent_messages(dbmanager):
+    for index in range(6):
+        dbmanager.upsert(
+            Message(user_id="user", session_id=1, role="user", content=f"message {index}")
+        )
+
+    recent = dbmanager.get_recent_messages("user", 1, limit=2)
+    assert recent == [
+        {"role": "user", "content": "message 4"},
+        {"role": "user", "content": "message 5"},
+    ]
+    assert response_cache_key(1, None, "hi", recent, history_turns=2) == response_cache_key(
+        1, None, "hi", dbmanager.get(Message, return_json=True, order="asc").data, history_turns=2
+    )
+
+
+def test_the_workflow_version_is_read_without_the_workflow(dbmanager):
+    workflow = Workflow(name="workflow", description="workflow", user_id="user")
+    dbmanager.upsert(workflow)
+    assert dbmanager.get_updated_at(Workflow, workflow.id) == workflow.updated_at
+    assert dbmanager.get_updated_at(Workflow, workflow.id + 1) is None
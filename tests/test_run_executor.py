@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from agent_builder.manager.run_executor import RunCancelledError, RunExecutor, RunStatus
+
+
+def test_workflows_run_on_the_configured_callable():
+    def run_workflow(message, session_id, workflow_id, cancel_event):
+        return {"message": message, "session_id": session_id, "workflow_id": workflow_id}
+
+    async def scenario():
+        executor = RunExecutor(max_workers=1, run_workflow=run_workflow)
+        try:
+            handle = executor.submit_workflow("hello", 1, 2, run_id="run-1")
+            return handle.run_id, await handle.result()
+        finally:
+            executor.shutdown(wait=False)
+
+    assert asyncio.run(scenario()) == ("run-1", {"message": "hello", "session_id": 1, "workflow_id": 2})
+
+
+def test_runs_receive_their_cancel_event():
+    def run(value, cancel_event):
+        if not cancel_event.wait(5):
+            return value
+        raise RunCancelledError("cancelled")
+
+    async def scenario():
+        executor = RunExecutor(max_workers=2)
+        try:
+            cancelled = executor.submit(run, "never")
+            await asyncio.sleep(0.05)
+            assert cancelled.cancel()
+            with pytest.raises(RunCancelledError):
+                await cancelled.result()
+            return cancelled
+        finally:
+            executor.shutdown(wait=False)
+
+    assert asyncio.run(scenario()).status == RunStatus.cancelled
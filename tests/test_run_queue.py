@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from typer.testing import CliRunner
+
+from agent_builder.cli import app
+from agent_builder.datamodel import Message
+from agent_builder.manager.run_executor import RunCancelledError, RunStatus
+from agent_builder.manager.run_queue import (
+    InMemoryRunQueue,
+    QueuedRunExecutor,
+    RunQueue,
+    SQLiteRunQueue,
+    run_queue_from_url,
+)
+from agent_builder.manager.worker import RunWorker
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def run_queue(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryRunQueue()
+    return SQLiteRunQueue(str(tmp_path / "runs.db"), poll_interval=0.01)
+
+
+def test_runs_are_consumed_in_order_and_published_to_subscribers(run_queue):
+    async def scenario():
+        subscription = await run_queue.subscribe("run-1")
+        await run_queue.aenqueue("run-1", {"prompt": "first"})
+        await run_queue.aenqueue("run-2", {"prompt": "second"})
+
+        run = await asyncio.to_thread(run_queue.consume, "worker", 100)
+        assert (run.run_id, run.payload) == ("run-1", {"prompt": "first"})
+        run_queue.publish("run-1", {"type": "run_result", "data": {"content": "done"}})
+        run_queue.ack(run)
+        event = await asyncio.wait_for(subscription.get(), timeout=5)
+        await subscription.close()
+
+        second = await asyncio.to_thread(run_queue.consume, "worker", 100)
+        assert second.run_id == "run-2"
+        assert await asyncio.to_thread(run_queue.consume, "worker", 10) is None
+        return event
+
+    assert asyncio.run(scenario()) == {"type": "run_result", "data": {"content": "done"}}
+
+
+def test_cancellation_is_visible_to_workers(run_queue):
+    async def scenario():
+        await run_queue.aenqueue("run-1", {})
+        await run_queue.cancel("run-1")
+
+    asyncio.run(scenario())
+    assert run_queue.is_cancelled("run-1")
+    assert not run_queue.is_cancelled("run-2")
+
+
+def test_queue_url_schemes(tmp_path):
+    assert isinstance(run_queue_from_url(f"sqlite:///{tmp_path / 'runs.db'}"), SQLiteRunQueue)
+    assert isinstance(run_queue_from_url("memory://"), InMemoryRunQueue)
+    with pytest.raises(ValueError):
+        run_queue_from_url("amqp://localhost")
+
+
+def test_run_queue_is_abstract():
+    with pytest.raises(TypeError):
+        RunQueue()
+
+
+def test_worker_rejects_memory_queues():
+    result = CliRunner().invoke(app, ["worker", "--queue-url", "memory://"])
+    assert result.exit_code != 0
+    assert "memory://" in result.output
+
+
+def test_sqlite_reclaims_runs_of_workers_that_stopped_heartbeating(tmp_path):
+    run_queue = SQLiteRunQueue(str(tmp_path / "runs.db"), poll_interval=0.01, claim_timeout=0.2)
+    asyncio.run(run_queue.aenqueue("run-1", {}))
+
+    crashed = run_queue.consume("crashed", 100)
+    assert crashed.run_id == "run-1"
+    assert run_queue.consume("other", 10) is None
+
+    time.sleep(0.3)
+    reclaimed = run_queue.consume("other", 100)
+    assert (reclaimed.run_id, reclaimed.consumer) == ("run-1", "other")
+
+    # the run belongs to the new worker, the stale one can neither renew nor finish it
+    run_queue.heartbeat(crashed)
+    run_queue.ack(crashed)
+    time.sleep(0.3)
+    assert run_queue.consume("third", 100).run_id == "run-1"
+
+
+def test_sqlite_heartbeats_keep_runs_with_their_worker(tmp_path):
+    run_queue = SQLiteRunQueue(str(tmp_path / "runs.db"), poll_interval=0.01, claim_timeout=0.2)
+    asyncio.run(run_queue.aenqueue("run-1", {}))
+
+    run = run_queue.consume("worker", 100)
+    for _ in range(3):
+        time.sleep(0.1)
+        run_queue.heartbeat(run)
+        assert run_queue.consume("other", 10) is None
+
+    run_queue.ack(run)
+    time.sleep(0.3)
+    assert run_queue.consume("other", 10) is None
+
+
+def test_worker_heartbeats_active_runs(tmp_path):
+    run_queue = SQLiteRunQueue(str(tmp_path / "runs.db"), poll_interval=0.01, claim_timeout=0.2)
+    asyncio.run(run_queue.aenqueue("run-1", {}))
+    run = run_queue.consume("worker", 100)
+
+    worker = RunWorker(run_queue, runner=None, cancel_poll_interval=0.01, heartbeat_interval=0.05)
+    worker._active[run.run_id] = (run, threading.Event())
+    watcher = threading.Thread(target=worker._watch_active_runs)
+    watcher.start()
+    try:
+        time.sleep(0.4)
+        assert run_queue.consume("other", 10) is None
+    finally:
+        worker._stop_event.set()
+        watcher.join()
+
+    events = [event for _, event in run_queue._events_after("run-1", 0)]
+    assert events and all("run_heartbeat" in event for event in events)
+
+
+def test_queued_runs_fail_when_no_worker_starts_them(run_queue):
+    async def scenario():
+        executor = QueuedRunExecutor(run_queue, start_timeout=0.2)
+        handle = executor.enqueue({"prompt": "hello"})
+        with pytest.raises(TimeoutError):
+            await asyncio.wait_for(handle.result(), timeout=5)
+        await asyncio.sleep(0.05)
+        return handle
+
+    handle = asyncio.run(scenario())
+    assert handle.status == RunStatus.failed
+    assert run_queue.is_cancelled(handle.run_id)
+
+
+def test_running_runs_fail_once_their_worker_goes_silent(run_queue):
+    async def scenario():
+        executor = QueuedRunExecutor(run_queue, start_timeout=5, idle_timeout=0.3)
+        handle = executor.enqueue({"prompt": "hello"})
+        run = await asyncio.to_thread(run_queue.consume, "worker", 1000)
+        run_queue.publish(run.run_id, {"type": "run_status", "data": {"status": "running"}})
+        for _ in range(3):
+            await asyncio.sleep(0.15)
+            run_queue.publish(run.run_id, {"type": "run_heartbeat", "data": {"worker": "worker"}})
+        assert not handle.done
+        with pytest.raises(TimeoutError):
+            await asyncio.wait_for(handle.result(), timeout=5)
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_a_queued_run_resolves_its_handle(run_queue):
+    async def scenario():
+        executor = QueuedRunExecutor(run_queue)
+        handle = executor.enqueue({"prompt": "hello"})
+        await asyncio.sleep(0.05)
+        assert handle.cancel()
+        with pytest.raises(RunCancelledError):
+            await asyncio.wait_for(handle.result(), timeout=1)
+        await asyncio.wait_for(handle.task, timeout=5)
+        return handle
+
+    handle = asyncio.run(scenario())
+    assert handle.status == RunStatus.cancelled
+    assert run_queue.is_cancelled(handle.run_id)
+
+
+def test_queued_executors_enqueue_workflow_runs(run_queue):
+    async def scenario():
+        executor = QueuedRunExecutor(run_queue)
+        message = Message(role="user", content="hello", session_id=1, user_id="user")
+        handle = executor.submit_workflow(message, 1, 2)
+        run = await asyncio.to_thread(run_queue.consume, "worker", 1000)
+        assert handle.cancel()
+        with pytest.raises(NotImplementedError):
+            executor.submit(print, "hello")
+        return handle, run
+
+    handle, run = asyncio.run(scenario())
+    assert run.run_id == handle.run_id
+    assert (run.payload["session_id"], run.payload["workflow_id"]) == (1, 2)
+    assert Message(**run.payload["message"]).content == "hello"
@@ -0,0 +1,110 @@
+from sqlmodel import SQLModel
+
+from agent_builder.database import DBManager
+from agent_builder.datamodel import Agent, Skill
+from agent_builder.utils.semantic_cache import SemanticResponseCache
+
+VECTORS = {
+    "what is the refund policy": [1.0, 0.0, 0.0],
+    "what's the refund policy": [0.99, 0.1, 0.0],
+    "book a flight": [0.0, 1.0, 0.0],
+}
+
+
+def embed(inputs):
+    return [VECTORS[text] for text in inputs]
+
+
+def test_similar_prompts_hit_within_a_workflow_version():
+    cache = SemanticResponseCache(embed, similarity_threshold=0.95)
+    cache.store(1, "what is the refund policy", cache.embed("what is the refund policy"), "30 days", version="v1")
+
+    assert cache.lookup(1, cache.embed("what's the refund policy"), version="v1") == "30 days"
+    assert cache.lookup(1, cache.embed("book a flight"), version="v1") is None
+    assert cache.lookup(2, cache.embed("what is the refund policy"), version="v1") is None
+
+
+def test_a_new_workflow_version_drops_old_answers():
+    cache = SemanticResponseCache(embed)
+    embedding = cache.embed("what is the refund policy")
+    cache.store(1, "what is the refund policy", embedding, "30 days", version="v1")
+
+    assert cache.lookup(1, embedding, version="v2") is None
+    assert cache.lookup(1, embedding, version="v1") is None
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_clear_and_expiry():
+    cache = SemanticResponseCache(embed, ttl=None)
+    embedding = cache.embed("book a flight")
+    cache.store(1, "book a flight", embedding, "booked")
+    cache.clear()
+    assert cache.lookup(1, embedding) is None
+
+    cache = SemanticResponseCache(embed, ttl=-1)
+    cache.store(1, "book a flight", embedding, "booked")
+    assert cache.lookup(1, embedding) is None
+
+
+def test_least_recently_used_prompts_are_evicted():
+    cache = SemanticResponseCache(embed, max_entries=1)
+    cache.store(1, "book a flight", cache.embed("book a flight"), "booked")
+    cache.store(1, "what is the refund policy", cache.embed("what is the refund policy"), "30 days")
+    assert cache.lookup(1, cache.embed("book a flight")) is None
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_the_embedding_function_is_only_called_on_first_embed():
+    calls = []
+
+    def lazy_embed(inputs):
+        calls.append(inputs)
+        return embed(inputs)
+
+    cache = SemanticResponseCache(lazy_embed)
+    assert calls == []
+    cache.embed("book a flight")
+    assert calls == [["book a flight"]]
+
+
+def test_invalidate_user_only_drops_that_users_workflows():
+    cache = SemanticResponseCache(embed)
+    embedding = cache.embed("book a flight")
+    cache.store(1, "book a flight", embedding, "booked", user_id="alice")
+    cache.store(2, "book a flight", embedding, "booked", user_id="bob")
+
+    cache.invalidate_user("alice")
+    assert cache.lookup(1, embedding) is None
+    assert cache.lookup(2, embedding) == "booked"
+
+    cache.invalidate_user(None)
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_building_block_writes_invalidate_the_writers_workflows(tmp_path):
+    dbmanager = DBManager(engine_uri=f"sqlite:///{tmp_path / 'database.sqlite'}")
+    SQLModel.metadata.create_all(dbmanager.engine)
+    cache = SemanticResponseCache(embed)
+    embedding = cache.embed("book a flight")
+    cache.store(1, "book a flight", embedding, "booked", user_id="user")
+    cache.store(2, "book a flight", embedding, "booked", user_id="other")
+    dbmanager.add_write_listener(cache.invalidate_user)
+
+    dbmanager.upsert(Skill(name="skill", content="def skill(): pass", user_id="user"))
+    assert cache.lookup(1, embedding) is None
+    assert cache.lookup(2, embedding) == "booked"
+
+
+def test_links_invalidate_the_owner_of_the_primary_entity(tmp_path):
+    dbmanager = DBManager(engine_uri=f"sqlite:///{tmp_path / 'database.sqlite'}")
+    SQLModel.metadata.create_all(dbmanager.engine)
+    agent = Agent(user_id="user", config={"name": "agent"})
+    skill = Skill(name="skill", content="def skill(): pass", user_id="user")
+    dbmanager.upsert(agent)
+    dbmanager.upsert(skill)
+    invalidated = []
+    dbmanager.add_write_listener(invalidated.append)
+
+    assert dbmanager.link("agent_skill", agent.id, skill.id).status
+    assert dbmanager.unlink("agent_skill", agent.id, skill.id).status
+    assert invalidated == ["user", "user"]
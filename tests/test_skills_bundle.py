@@ -0,0 +1,94 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from agent_builder.datamodel import Skill
+from agent_builder.utils import skills_bundle
+from agent_builder.utils.skills_bundle import SkillsBundleCache, skills_digest
+
+GREET = Skill(
+    name="greet",
+    content=(
+        "__all__ = ['greet']\n\n"
+        "def _greeting():\n    return 'hello'\n\n"
+        "def greet(name):\n    return f'{_greeting()} {name}'\n\n"
+        "def helper():\n    return 'helper'\n"
+    ),
+)
+SHOUT = Skill(name="shout", content="def shout(text):\n    return text.upper()\n")
+
+
+def test_digests_follow_the_names_contents_and_order_of_the_skills():
+    assert skills_digest([GREET, SHOUT]) == skills_digest([GREET.model_copy(), SHOUT.model_copy()])
+    assert skills_digest([GREET, SHOUT]) != skills_digest([SHOUT, GREET])
+    assert skills_digest([SHOUT]) != skills_digest([SHOUT.model_copy(update={"content": "x = 1\n"})])
+    # names and contents are delimited, moving text between them changes the digest
+    assert skills_digest([Skill(name="ab", content="c")]) != skills_digest([Skill(name="a", content="bc")])
+
+
+def test_bundles_are_built_once_per_digest(tmp_path, monkeypatch):
+    sources = []
+    get_skills_source = skills_bundle.get_skills_source
+    monkeypatch.setattr(
+        skills_bundle, "get_skills_source", lambda skills: sources.append(skills) or get_skills_source(skills)
+    )
+    cache = SkillsBundleCache(str(tmp_path / "bundles"))
+    digest = skills_digest([GREET])
+
+    module = cache.build([GREET], digest)
+    assert module == f"skills_{digest}"
+    assert cache.build([GREET], digest) == module
+    # another worker finds the bundle on disk
+    assert SkillsBundleCache(str(tmp_path / "bundles")).build([GREET], digest) == module
+    assert len(sources) == 1
+    assert os.listdir(tmp_path / "bundles" / "__pycache__")
+
+    cache.build([SHOUT], skills_digest([SHOUT]))
+    assert len(sources) == 2
+
+
+def test_the_shim_exposes_every_name_of_the_skills(tmp_path):
+    cache = SkillsBundleCache(str(tmp_path / "bundles"))
+    work_dir = tmp_path / "work"
+    cache.link([GREET, SHOUT], str(work_dir))
+
+    shim = (work_dir / "skills.py").read_text()
+    assert skills_digest([GREET, SHOUT]) in shim
+    code = (
+        "import skills\n"
+        "from skills import *\n"
+        "print(skills.greet('you'), skills._greeting(), skills.helper(), shout('hi'))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=work_dir, capture_output=True, text=True, check=True
+    )
+    assert result.stdout == "hello you hello helper HI\n"
+
+
+def test_link_only_rewrites_a_stale_shim(tmp_path):
+    cache = SkillsBundleCache(str(tmp_path / "bundles"))
+    work_dir = tmp_path / "work"
+    cache.link([GREET], str(work_dir))
+    path = work_dir / "skills.py"
+    os.utime(path, (0, 0))
+
+    cache.link([GREET], str(work_dir))
+    assert os.stat(path).st_mtime == 0
+
+    cache.link([SHOUT], str(work_dir))
+    assert skills_digest([SHOUT]) in path.read_text()
+
+
+@pytest.mark.parametrize("max_prompts", [1, 2])
+def test_prompts_are_memoized_by_digest(tmp_path, monkeypatch, max_prompts):
+    cache = SkillsBundleCache(str(tmp_path / "bundles"), max_prompts=max_prompts)
+    first = cache.prompt([GREET])
+    assert "def greet(name)" in first
+    cache.prompt([SHOUT])
+
+    monkeypatch.setattr(skills_bundle, "get_skills_source", lambda skills: "rebuilt")
+    assert cache.prompt([SHOUT]) != "rebuilt"
+    # the least recently used prompt is dropped once the cache is full
+    assert (cache.prompt([GREET]) == first) == (max_prompts == 2)
@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from agent_builder.utils.state_store import ConversationStateStore, InMemoryStateStore
+
+
+def test_state_is_copied_and_evicted():
+    async def scenario():
+        store = InMemoryStateStore(ttl=60, max_entries=1)
+        state = {"step": 1}
+        await store.set("a", state)
+        state["step"] = 2
+        assert await store.get("a") == {"step": 1}
+
+        await store.set("b", {"step": 1})
+        assert await store.get("a") is None
+        await store.delete("b")
+        assert await store.get("b") is None
+
+    asyncio.run(scenario())
+
+
+def test_state_expires():
+    async def scenario():
+        store = InMemoryStateStore(ttl=-1)
+        await store.set("a", {"step": 1})
+        return await store.get("a")
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_state_store_is_abstract():
+    with pytest.raises(TypeError):
+        ConversationStateStore()
@@ -0,0 +1,31 @@
+from autogen.messages.client_messages import StreamMessage
+
+from agent_builder.utils.streaming import DeltaIOStream, current_speaker, streaming_speaker
+
+
+def test_deltas_are_attributed_to_the_speaking_agent():
+    deltas = []
+    stream = DeltaIOStream(on_delta=lambda speaker, content: deltas.append((speaker, content)))
+
+    with streaming_speaker("planner"):
+        stream.send(StreamMessage(content="Hel"))
+        with streaming_speaker("coder"):
+            stream.send(StreamMessage(content="def"))
+        stream.send(StreamMessage(content="lo"))
+
+    assert deltas == [("planner", "Hel"), ("coder", "def"), ("planner", "lo")]
+    assert current_speaker.get() is None
+
+
+def test_other_messages_are_printed(capsys):
+    deltas = []
+    stream = DeltaIOStream(on_delta=lambda speaker, content: deltas.append((speaker, content)))
+
+    # deltas outside of a reply have no speaker to attribute them to
+    stream.send(StreamMessage(content="orphan"))
+    with streaming_speaker("planner"):
+        stream.print("not a delta")
+
+    assert deltas == []
+    out = capsys.readouterr().out
+    assert "orphan" in out and "not a delta" in out
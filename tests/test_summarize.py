@@ -0,0 +1,91 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from autogen.io import IOStream
+from autogen.messages.client_messages import StreamMessage
+
+from agent_builder.utils import utils
+from agent_builder.utils.utils import summarize_chat_history
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # count words instead of downloading a tokenizer
+    monkeypatch.setattr(utils, "count_tokens", lambda text, model: len(text.split()))
+
+
+class FakeClient:
+    """Answers summary requests with `summarize(prompt)`, streaming the answer word by word when asked."""
+
+    _config_list = [{"model": "gpt-4"}]
+
+    def __init__(self, summarize=lambda prompt: "summary"):
+        self.summarize = summarize
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def create(self, messages, cache_seed=None, stream=False):
+        prompt = messages[-1]["content"]
+        with self.lock:
+            self.prompts.append(prompt)
+        content = self.summarize(prompt)
+        if stream:
+            for word in content.split(" "):
+                IOStream.get_default().send(StreamMessage(content=word))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def payload(sender, content):
+    return {
+        "sender": sender, "recipient": "user_proxy", "message": {"content": content, "role": "user"},
+        "timestamp": "2026-01-01T00:00:00", "connection_id": "socket", "message_type": "agent_message",
+    }
+
+
+def test_short_histories_are_summarized_in_one_request():
+    client = FakeClient()
+    messages = [payload("user_proxy", "what is 2 + 2"), payload("assistant", "4"), payload("assistant", "")]
+
+    assert summarize_chat_history("add numbers", messages, client, chunk_tokens=100) == "summary"
+    assert client.prompts == ["Summarize the following chat history.\nuser_proxy: what is 2 + 2\nassistant: 4"]
+
+
+def test_long_histories_are_summarized_in_concurrent_chunks():
+    # every chunk must be in flight at once to pass the barrier
+    barrier = threading.Barrier(3, timeout=5)
+
+    def summarize(prompt):
+        if prompt.startswith("Summarize this part"):
+            barrier.wait()
+            return f"partial {prompt.rsplit(' ', 1)[-1]}"
+        return "final summary"
+
+    client = FakeClient(summarize)
+    messages = [payload("assistant", f"answer number {index}") for index in range(6)]
+
+    summary = summarize_chat_history("task", messages, client, chunk_tokens=8, max_workers=3)
+    assert summary == "final summary"
+    assert len(client.prompts) == 4
+    assert client.prompts[-1] == "Summarize the following chat history.\npartial 1\npartial 3\npartial 5"
+
+
+def test_partial_summaries_that_do_not_shrink_are_reduced_as_they_are():
+    partial = "a partial summary as long as its chunk"
+    client = FakeClient(lambda prompt: partial)
+    messages = [payload("assistant", "one two three four five six seven") for _ in range(4)]
+
+    assert summarize_chat_history("task", messages, client, chunk_tokens=9) == partial
+    assert client.prompts[-1] == "Summarize the following chat history.\n" + "\n".join([partial] * 4)
+    assert len(client.prompts) == 5
+
+
+def test_the_final_summary_is_streamed():
+    deltas = []
+    client = FakeClient(lambda prompt: "the answer is 4")
+
+    summary = summarize_chat_history(
+        "add numbers", [payload("assistant", "4")], client, on_delta=deltas.append
+    )
+    assert summary == "the answer is 4"
+    assert deltas == ["the", "answer", "is", "4"]
@@ -0,0 +1,137 @@
+import os
+import time
+
+import pytest
+
+from agent_builder.manager import workspace as workspace_module
+from agent_builder.manager.workspace import WorkspaceManager
+
+
+def write(path, content, age=-10):
+    """Write a file dated `age` seconds ago. By default slightly in the future, a coarse filesystem clock could date it before the run."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+
+
+def names(run):
+    return sorted(file["name"] for file in run.files)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return WorkspaceManager(str(tmp_path / "files" / "user"), use_inotify=False)
+
+
+def test_snapshots_record_created_and_modified_files(manager):
+    work_dir = manager.workspace(str(manager.root / "user"), 1)
+    write(work_dir / "kept.txt", "kept", age=60)
+    write(work_dir / "changed.txt", "old", age=60)
+    write(work_dir / "deleted.txt", "deleted", age=60)
+
+    with manager.track(work_dir) as run:
+        write(work_dir / "changed.txt", "new content")
+        write(work_dir / "nested" / "created.csv", "a,b")
+        write(work_dir / "__pycache__" / "module.pyc", "bytecode")
+        os.remove(work_dir / "deleted.txt")
+
+    assert names(run) == ["changed.txt", "created.csv"]
+    assert run.files[0]["path"].startswith("files/user/user/1/")
+    # 8 more bytes in changed.txt, 3 in created.csv and 7 freed by deleted.txt
+    assert run.bytes_written == 8 + 3 - 7
+
+
+def test_the_next_run_reuses_the_final_snapshot(manager, monkeypatch):
+    work_dir = manager.workspace(str(manager.root / "user"), 1)
+    with manager.track(work_dir):
+        write(work_dir / "first.txt", "first")
+
+    scans = []
+    snapshot_directory = workspace_module.snapshot_directory
+    monkeypatch.setattr(
+        workspace_module, "snapshot_directory", lambda directory: scans.append(directory) or snapshot_directory(directory)
+    )
+    with manager.track(work_dir) as run:
+        write(work_dir / "second.txt", "second")
+
+    assert names(run) == ["second.txt"]
+    assert len(scans) == 1
+
+
+def test_a_user_over_quota_is_rejected(tmp_path):
+    manager = WorkspaceManager(str(tmp_path / "files" / "user"), quota_bytes=10, use_inotify=False)
+    user_dir = str(manager.root / "user")
+    work_dir = manager.workspace(user_dir, 1)
+    manager.check_quota(user_dir)
+
+    with manager.track(work_dir):
+        write(work_dir / "large.txt", "x" * 20)
+
+    with pytest.raises(ValueError, match="Workspace quota exceeded"):
+        manager.check_quota(user_dir)
+    # other users have their own quota
+    manager.check_quota(str(manager.root / "other"))
+
+
+def test_gc_removes_expired_workspaces_and_keeps_active_ones(manager):
+    manager.retention_days = 1
+    user_dir = manager.root / "user"
+    expired, active, recent = user_dir / "1" / "20260101", user_dir / "2" / "20260101", user_dir / "3" / "20260101"
+    for work_dir in (expired, active, recent):
+        write(work_dir / "file.txt", "content")
+    old = time.time() - 3 * 24 * 3600
+    for work_dir in (expired, active):
+        os.utime(work_dir, (old, old))
+
+    with manager.track(str(active)):
+        manager.collect_garbage()
+
+    assert not expired.exists()
+    # the session directory left empty is removed with it
+    assert not expired.parent.exists()
+    assert active.exists() and recent.exists()
+    assert manager._usage[str(user_dir)] == 2 * len("content")
+
+
+def test_gc_removes_workspaces_linked_from_tmpfs(tmp_path):
+    manager = WorkspaceManager(
+        str(tmp_path / "files" / "user"), tmpfs_root=str(tmp_path / "tmpfs"), retention_days=1, use_inotify=False
+    )
+    work_dir = manager.workspace(str(manager.root / "user"), 1)
+    assert work_dir.is_symlink()
+    target = work_dir.resolve()
+    old = time.time() - 3 * 24 * 3600
+    os.utime(target, (old, old))
+
+    manager.collect_garbage()
+    assert not target.exists()
+    assert not os.path.lexists(work_dir)
+
+
+def test_without_inotify_simple_runs_use_snapshots(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace_module, "INotify", None)
+    manager = WorkspaceManager(str(tmp_path / "files" / "user"), use_inotify=True)
+    assert manager.use_inotify is False
+
+    work_dir = manager.workspace(str(manager.root / "user"), 1)
+    with manager.track(work_dir) as run:
+        write(work_dir / "created.txt", "created")
+    assert names(run) == ["created.txt"]
+
+
+def test_runs_fall_back_to_snapshots_when_inotify_fails(tmp_path, monkeypatch):
+    class ExhaustedINotify:
+        def __init__(self):
+            raise OSError(28, "inotify watch limit reached")
+
+    monkeypatch.setattr(workspace_module, "INotify", ExhaustedINotify)
+    manager = WorkspaceManager(str(tmp_path / "files" / "user"), use_inotify=True)
+    assert manager.use_inotify is True
+
+    work_dir = manager.workspace(str(manager.root / "user"), 1)
+    with manager.track(work_dir) as run:
+        write(work_dir / "created.txt", "created")
+    assert names(run) == ["created.txt"]
+    assert run._inotify is None
+    assert not manager._active